@@ -0,0 +1,113 @@
+"""
+Benchmark suite: runs bench.scenarios at several scales, each in its own process
+(so that peak RSS is per scale), prints a report and optionally gates on a baseline.
+
+    python -m bench                                   # 1k / 10k / 100k users
+    python -m bench --users 1000 --update-baseline    # record bench/baseline.json
+    python -m bench --users 1000 --gate               # exit 1 on regression vs baseline
+
+Needs a local Mongo at BOTSPOT_MONGO_DATABASE_CONN_STR.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any
+
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+
+# metric path -> True if higher is better
+GATED_METRICS = {
+    ("posts_per_sec",): True,
+    ("enqueue_latency_ms", "p99"): False,
+    ("fire_lag_ms", "p99"): False,
+    ("startup_scheduling_seconds",): False,
+    ("peak_rss_mb",): False,
+}
+
+
+def run_scale(users: int, extra_args: list[str]) -> dict:
+    command = [sys.executable, "-m", "bench.scenarios", "--users", str(users), *extra_args]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    # the report is the last line, everything before is the bot's own output
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def get_metric(report: dict, path: tuple[str, ...]) -> float | None:
+    value: Any = report
+    for key in path:
+        value = value.get(key) if isinstance(value, dict) else None
+    return value if isinstance(value, (int, float)) else None
+
+
+def check_regressions(reports: list[dict], baseline: dict, tolerance: float) -> list[str]:
+    failures = []
+    for report in reports:
+        expected = baseline.get(str(report["users"]))
+        if expected is None:
+            failures.append(f"{report['users']} users: no baseline recorded")
+            continue
+        for path, higher_is_better in GATED_METRICS.items():
+            actual, reference = get_metric(report, path), get_metric(expected, path)
+            if actual is None or reference is None:
+                continue
+            limit = reference * (1 - tolerance) if higher_is_better else reference * (1 + tolerance)
+            if (actual < limit) if higher_is_better else (actual > limit):
+                name = ".".join(path)
+                failures.append(
+                    f"{report['users']} users: {name} = {actual:.2f}, baseline {reference:.2f}"
+                )
+    return failures
+
+
+def print_report(reports: list[dict]):
+    header = f"{'users':>8} {'posts/s':>10} {'enqueue p50/p99 ms':>20} {'fire lag p50/p99 ms':>20} {'startup s':>10} {'rss MB':>8}"
+    print(header)
+    for r in reports:
+        enqueue, lag = r["enqueue_latency_ms"], r["fire_lag_ms"]
+        print(
+            f"{r['users']:>8} {r['posts_per_sec']:>10.1f} "
+            f"{enqueue['p50'] or 0:>9.1f}/{enqueue['p99'] or 0:<10.1f}"
+            f"{lag['p50'] or 0:>9.1f}/{lag['p99'] or 0:<10.1f}"
+            f"{r['startup_scheduling_seconds'] or 0:>10.2f} {r['peak_rss_mb']:>8.0f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--period", type=int, default=10)
+    parser.add_argument("--queue-size", type=int, default=3)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--gate", action="store_true", help="fail on regression vs the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--output", type=Path, help="also write the raw reports as json")
+    args = parser.parse_args()
+
+    extra_args = ["--period", str(args.period), "--queue-size", str(args.queue_size)]
+    reports = [run_scale(users, extra_args) for users in args.users]
+    print_report(reports)
+
+    if args.output:
+        args.output.write_text(json.dumps(reports, indent=2))
+
+    if args.update_baseline:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        baseline.update({str(report["users"]): report for report in reports})
+        args.baseline.write_text(json.dumps(baseline, indent=2))
+        print(f"Baseline updated: {args.baseline}")
+
+    if args.gate:
+        if not args.baseline.exists():
+            sys.exit(f"No baseline at {args.baseline}, record one with --update-baseline")
+        failures = check_regressions(reports, json.loads(args.baseline.read_text()), args.tolerance)
+        for failure in failures:
+            print(f"REGRESSION: {failure}")
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import asyncio
+import itertools
+import json
+import time
+from typing import Any, Callable
+
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class FakeBotAPI:
+    """
+    Minimal local stand-in for the Telegram Bot API.
+
+    Answers every method with a plausible result and records what the bot sent,
+    so the benchmark can measure throughput and react to prompts (inline keyboards).
+    """
+
+    def __init__(self):
+        self.calls: list[dict[str, Any]] = []
+        self._message_ids = itertools.count(1)
+        self._changed = asyncio.Condition()
+        self._runner: web.AppRunner | None = None
+        self.url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def count(self, method: str, chat_id: int | None = None) -> int:
+        return sum(
+            1
+            for call in self.calls
+            if call["method"] == method and (chat_id is None or call["chat_id"] == chat_id)
+        )
+
+    async def wait_for(self, predicate: Callable[[dict], bool], start: int = 0, timeout: float = 30) -> dict:
+        """Wait for a call matching the predicate, looking at calls from index `start` on"""
+        async with self._changed:
+            found: list[dict] = []
+
+            def check():
+                found.extend(call for call in self.calls[start:] if predicate(call))
+                return bool(found)
+
+            await asyncio.wait_for(self._changed.wait_for(check), timeout)
+            return found[0]
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params: dict[str, Any]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        chat_id = int(params["chat_id"]) if "chat_id" in params else None
+        reply_markup = params.get("reply_markup")
+        if isinstance(reply_markup, str):
+            reply_markup = json.loads(reply_markup)
+
+        result = self._result(method, params, chat_id)
+        call = {
+            "method": method,
+            "chat_id": chat_id,
+            "text": params.get("text"),
+            "reply_markup": reply_markup,
+            "result": result,
+            "ts": time.perf_counter(),
+        }
+        async with self._changed:
+            self.calls.append(call)
+            self._changed.notify_all()
+        return web.json_response({"ok": True, "result": result})
+
+    def _message(self, chat_id: int | None, text: str | None = None) -> dict:
+        chat_type = "channel" if chat_id is not None and chat_id < 0 else "private"
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": chat_type},
+            "from": BOT_USER,
+        }
+        if text is not None:
+            message["text"] = text
+        return message
+
+    def _result(self, method: str, params: dict, chat_id: int | None) -> Any:
+        if method == "getme":
+            return BOT_USER
+        if method in ("sendmessage", "editmessagetext"):
+            return self._message(chat_id, params.get("text"))
+        if method in ("senddocument", "sendphoto"):
+            return self._message(chat_id)
+        if method == "copymessage":
+            return {"message_id": next(self._message_ids)}
+        if method in ("copymessages", "forwardmessages"):
+            message_ids = params["message_ids"]
+            if isinstance(message_ids, str):
+                message_ids = json.loads(message_ids)
+            return [{"message_id": next(self._message_ids)} for _ in message_ids]
+        if method == "getupdates":
+            return []
+        return True
@@ -0,0 +1,127 @@
+"""
+Import time of a module in a fresh interpreter, via python -X importtime, with a breakdown
+by top-level package - what a cold start of the bot process pays before handling the first update.
+
+    python -m bench.import_time                  # src.bot, top 20 packages
+    python -m bench.import_time src.app --top 50
+    python -m bench.import_time --budget 3       # exit 1 if over 3 seconds
+    python -m bench.import_time --overhead 0.5   # exit 1 if everything but aiogram takes over
+                                                 # half of aiogram's own time
+"""
+
+import argparse
+import subprocess
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+
+# imports everything a start of the bot needs. Most of it is aiogram.types - building the pydantic
+# models of the Bot API, seconds on a slow machine - which the bot needs to parse the first update
+DEFAULT_MODULE = "src.bot"
+
+# the bot can not handle an update without aiogram, so a cold start is budgeted relative to it:
+# everything else may take at most this share of aiogram's own time, measured in the same run -
+# a budget that holds on any machine
+BASELINE_PACKAGE = "aiogram"
+OVERHEAD_BUDGET = 0.5
+
+
+@dataclass
+class ImportRecord:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+    @property
+    def package(self) -> str:
+        return self.module.split(".")[0]
+
+
+def parse_importtime(stderr: str) -> list[ImportRecord]:
+    """
+    Lines of -X importtime output look like:
+        import time:       412 |       1290 |   encodings
+    nesting is encoded in the indentation of the module name.
+    """
+    records = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        if not self_us.strip().isdigit():
+            # the header line
+            continue
+        stripped = name.lstrip()
+        depth = (len(name) - len(stripped) - 1) // 2
+        records.append(ImportRecord(stripped.strip(), int(self_us), int(cumulative_us), depth))
+    return records
+
+
+def measure(module: str = DEFAULT_MODULE) -> list[ImportRecord]:
+    """Import the module in a new interpreter. Raises if the import fails"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def total_seconds(records: list[ImportRecord]) -> float:
+    """Wall time of all imports - the sum of the top-level cumulative times"""
+    return sum(record.cumulative_us for record in records if record.depth == 0) / 1e6
+
+
+def breakdown(records: list[ImportRecord]) -> dict[str, float]:
+    """Seconds spent in every top-level package, own time of all of its modules, slowest first"""
+    packages: dict[str, int] = defaultdict(int)
+    for record in records:
+        packages[record.package] += record.self_us
+    return {
+        package: us / 1e6 for package, us in sorted(packages.items(), key=lambda item: -item[1])
+    }
+
+
+def overhead(records: list[ImportRecord], baseline: str = BASELINE_PACKAGE) -> float:
+    """Own time of all packages but the baseline, as a share of the baseline's own time"""
+    packages = breakdown(records)
+    baseline_seconds = packages.pop(baseline, 0)
+    if not baseline_seconds:
+        raise ValueError(f"{baseline} is not imported")
+    return sum(packages.values()) / baseline_seconds
+
+
+def format_report(records: list[ImportRecord], top: int = 20) -> str:
+    lines = [f"total: {total_seconds(records):.3f}s, {len(records)} modules"]
+    for package, seconds in list(breakdown(records).items())[:top]:
+        lines.append(f"{seconds:8.3f}s  {package}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("module", nargs="?", default=DEFAULT_MODULE)
+    parser.add_argument("--top", type=int, default=20, help="packages to show")
+    parser.add_argument("--budget", type=float, help="exit 1 if the import takes longer (seconds)")
+    parser.add_argument(
+        "--overhead",
+        type=float,
+        help=f"exit 1 if packages other than {BASELINE_PACKAGE} take a larger share of its time",
+    )
+    args = parser.parse_args()
+
+    records = measure(args.module)
+    print(format_report(records, top=args.top))
+    if args.budget is not None and total_seconds(records) > args.budget:
+        print(f"over budget: {total_seconds(records):.3f}s > {args.budget}s")
+        sys.exit(1)
+    if args.overhead is not None and overhead(records) > args.overhead:
+        print(f"over budget: {overhead(records):.2f} of {BASELINE_PACKAGE} > {args.overhead}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Benchmark the bot at a single scale, in-process, and print a JSON report.
+
+Drives the real dispatcher from src.bot against a local fake Bot API server and a local Mongo
+(BOTSPOT_MONGO_DATABASE_CONN_STR, database 'poster-bot-bench' - dropped before and after the run).
+
+    python -m bench.scenarios --users 1000
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import resource
+import time
+from datetime import datetime
+
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from bench.fake_bot_api import FakeBotAPI
+
+BENCH_DATABASE = "poster-bot-bench"
+USER_ID_BASE = 10_000_000
+CHANNEL_ID_BASE = -1_000_000_000_000
+TEMPLATE_USER_ID = USER_ID_BASE - 1
+
+_update_ids = itertools.count(1)
+
+
+def percentiles(samples: list[float]) -> dict[str, float | None]:
+    if not samples:
+        return {"p50": None, "p99": None}
+    ordered = sorted(samples)
+    return {
+        "p50": ordered[int(0.5 * (len(ordered) - 1))],
+        "p99": ordered[int(0.99 * (len(ordered) - 1))],
+    }
+
+
+def percentiles_ms(samples: list[float]) -> dict[str, float | None]:
+    return {k: None if v is None else v * 1000 for k, v in percentiles(samples).items()}
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def configure_env():
+    os.environ.update(
+        {
+            "TELEGRAM_BOT_TOKEN": "123456:bench",
+            "TARGET_CHANNEL_ID": str(CHANNEL_ID_BASE),
+            "SCHEDULING_MODE": "period",
+            # the fake api has no limits - measure the bot, not telegram's rate limits
+            "OUTBOX_GLOBAL_RATE": "1000000",
+            # measure enqueue processing, not the wait for more messages of a burst
+            "ENQUEUE_DEBOUNCE_SECONDS": "0",
+            "BOTSPOT_MONGO_DATABASE_ENABLED": "true",
+            "BOTSPOT_MONGO_DATABASE_DATABASE": BENCH_DATABASE,
+            "BOTSPOT_SCHEDULER_ENABLED": "true",
+            "BOTSPOT_USER_DATA_ENABLED": "true",
+            "BOTSPOT_QUEUE_MANAGER_ENABLED": "true",
+            "BOTSPOT_LLM_PROVIDER_ENABLED": "false",
+            "BOTSPOT_PRINT_BOT_URL_ENABLED": "false",
+        }
+    )
+
+
+def message_update(user_id: int, text: str) -> Update:
+    user = User(id=user_id, is_bot=False, first_name="Bench")
+    message = Message(
+        message_id=next(_update_ids),
+        date=datetime.now(),
+        chat=Chat(id=user_id, type="private"),
+        from_user=user,
+        text=text,
+    )
+    return Update(update_id=next(_update_ids), message=message)
+
+
+def callback_update(user_id: int, prompt: dict, data: str) -> Update:
+    query = CallbackQuery(
+        id=str(next(_update_ids)),
+        from_user=User(id=user_id, is_bot=False, first_name="Bench"),
+        chat_instance="bench",
+        message=Message.model_validate(prompt),
+        data=data,
+    )
+    return Update(update_id=next(_update_ids), callback_query=query)
+
+
+def button_data(reply_markup: dict, text: str) -> str:
+    for row in reply_markup["inline_keyboard"]:
+        for button in row:
+            if button["text"] == text:
+                return button["callback_data"]
+    raise ValueError(f"No '{text}' button in {reply_markup}")
+
+
+async def measure_enqueue(dp, bot, api: FakeBotAPI, samples: int) -> list[float]:
+    """Send posts as the template user and answer the readiness prompt right away"""
+    user_id = TEMPLATE_USER_ID
+    latencies = []
+    for i in range(samples):
+        start = len(api.calls)
+        started = time.perf_counter()
+        handler = asyncio.create_task(dp.feed_update(bot, message_update(user_id, f"Bench post {i}")))
+        prompt = await api.wait_for(
+            lambda call: call["chat_id"] == user_id and call["reply_markup"], start=start
+        )
+        data = button_data(prompt["reply_markup"], "Finished")
+        await dp.feed_update(bot, callback_update(user_id, prompt["result"], data))
+        await handler
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def seed_item(app, item_template: dict, user_id: int, text: str) -> dict:
+    """Template item with new text - the content hash and send plan are derived from the text"""
+    from src.app import PosterBotQueueItem
+
+    item = PosterBotQueueItem.from_doc(
+        {**item_template, "data": text, "content_hash": None, "render_plan": app.render(text)}
+    )
+    return item.to_doc(user_id)
+
+
+async def seed(app, users: int, period: int, queue_size: int):
+    """Clone the template user and its queue item - documents have exactly the shape the bot writes"""
+    user_template = await app.users_collection.find_one({"user_id": TEMPLATE_USER_ID}, {"_id": 0})
+    item_template = await app.queue_collection.find_one({"user_id": TEMPLATE_USER_ID}, {"_id": 0})
+    assert user_template and item_template, "Enqueue phase did not create the template user / item"
+
+    batch_size = 5000
+    for offset in range(0, users, batch_size):
+        user_ids = range(USER_ID_BASE + offset, USER_ID_BASE + min(offset + batch_size, users))
+        await app.users_collection.insert_many(
+            [
+                {
+                    **user_template,
+                    "user_id": user_id,
+                    "auto_posting_enabled": True,
+                    "scheduling_mode": "period",
+                    "scheduling_period_seconds": period,
+                    "target_channel_id": CHANNEL_ID_BASE - user_id,
+                }
+                for user_id in user_ids
+            ]
+        )
+        await app.queue_collection.insert_many(
+            [
+                seed_item(app, item_template, user_id, f"Post {n} of {user_id}")
+                for user_id in user_ids
+                for n in range(queue_size)
+            ]
+        )
+        await app.stats_collection.insert_many(
+            [
+                {"user_id": user_id, "unposted": {"finished": queue_size}, "posted": 0}
+                for user_id in user_ids
+            ]
+        )
+
+
+async def measure_posting(app, api: FakeBotAPI, users: int, timeout: float) -> tuple[float, list[float]]:
+    """Wait for every seeded user to post once. Returns posts/sec and scheduler fire lags"""
+    lags: list[float] = []
+    app.dispatcher.lag_observer = lambda user_id, delay, offset: lags.append(delay - offset)
+
+    def channel_posts():
+        return [call for call in api.calls if call["chat_id"] is not None and call["chat_id"] < 0]
+
+    deadline = time.perf_counter() + timeout
+    while len(channel_posts()) < users and time.perf_counter() < deadline:
+        await asyncio.sleep(0.5)
+    app.dispatcher.lag_observer = None
+
+    posts = channel_posts()
+    if len(posts) < 2:
+        return 0.0, lags
+    elapsed = posts[-1]["ts"] - posts[0]["ts"]
+    return len(posts) / elapsed if elapsed > 0 else float("inf"), lags
+
+
+async def run(users: int, period: int, queue_size: int, enqueue_samples: int) -> dict:
+    configure_env()
+    api = FakeBotAPI()
+    await api.start()
+
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from botspot.components.data.mongo_database import get_database
+
+    from src.bot import create_dispatcher
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api.url))
+    dp, bot = create_dispatcher(session=session)
+    app = dp["app"]
+    workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+
+    db = get_database()
+    await db.client.drop_database(BENCH_DATABASE)
+    await dp.emit_startup(bot=bot, **workflow_data)
+    try:
+        enqueue_latencies = await measure_enqueue(dp, bot, api, enqueue_samples)
+
+        await seed(app, users, period, queue_size)
+        rss_before_scheduling = peak_rss_mb()
+        await app.schedule_posts_on_startup()
+
+        posts_per_sec, fire_lags = await measure_posting(app, api, users, timeout=period * 3 + 60)
+        return {
+            "users": users,
+            "posts_per_sec": posts_per_sec,
+            "enqueue_latency_ms": percentiles_ms(enqueue_latencies),
+            "fire_lag_ms": percentiles_ms(fire_lags),
+            "startup_scheduling_seconds": app.startup_scheduling_seconds,
+            "peak_rss_mb": peak_rss_mb(),
+            "rss_before_scheduling_mb": rss_before_scheduling,
+        }
+    finally:
+        await dp.emit_shutdown(bot=bot, **workflow_data)
+        await db.client.drop_database(BENCH_DATABASE)
+        await bot.session.close()
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--period", type=int, default=10, help="posting period of synthetic users, seconds")
+    parser.add_argument("--queue-size", type=int, default=3, help="queued posts per synthetic user")
+    parser.add_argument("--enqueue-samples", type=int, default=100)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.users, args.period, args.queue_size, args.enqueue_samples))
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
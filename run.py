@@ -10,7 +10,11 @@ load_dotenv()
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--debug", action="store_true", help="Enable debug mode")
+    parser.add_argument(
+        "--webhook", action="store_true", help="Receive updates via webhook instead of polling"
+    )
     args = parser.parse_args()
 
     debug = args.debug if args.debug else bool(os.getenv("DEBUG"))
-    main(debug=debug)
+    webhook = args.webhook if args.webhook else bool(os.getenv("WEBHOOK"))
+    main(debug=debug, webhook=webhook)
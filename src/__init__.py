@@ -1,16 +1,21 @@
-from importlib.metadata import PackageNotFoundError
+def __getattr__(name: str):
+    # resolved on first access, not on every start of the bot
+    if name == "__version__":
+        global __version__
+        __version__ = _resolve_version()
+        return __version__
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-try:
-    import importlib.metadata
-
-    __version__ = importlib.metadata.version(__package__ or __name__)
-    del importlib
-except PackageNotFoundError:
-    from pathlib import Path
 
-    import toml
+def _resolve_version() -> str:
+    import importlib.metadata
 
-    path = Path(__file__).parent.parent / "pyproject.toml"
-    __version__ = toml.load(path)["project"]["version"]
-    del toml, Path, path
+    try:
+        return importlib.metadata.version(__package__ or __name__)
+    except importlib.metadata.PackageNotFoundError:
+        import tomllib
+        from pathlib import Path
 
+        path = Path(__file__).parent.parent / "pyproject.toml"
+        with path.open("rb") as file:
+            return tomllib.load(file)["project"]["version"]
@@ -1,33 +1,135 @@
-import random
-from datetime import datetime
+import asyncio
+import hashlib
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
 from enum import Enum
-from typing import Any, Optional
+from typing import IO, Any, Awaitable, Callable, Iterable, Optional
+from uuid import uuid4
 
-from aiogram.types import Message
+from aiogram.enums import ContentType
+from aiogram.types import BufferedInputFile, Message
+from apscheduler.triggers.base import BaseTrigger
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from botspot.components.data.mongo_database import get_database
 from botspot.components.data.user_data import User
 from botspot.components.main.event_scheduler import get_scheduler
 from botspot.components.new.queue_manager import QueueItem, create_queue
 from botspot.utils import send_safe
 from loguru import logger
-from pydantic import SecretStr, model_validator
+from pydantic import BaseModel, PrivateAttr, SecretStr, model_validator
 from pydantic_settings import BaseSettings
+from pymongo import DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
-from src.utils import parse_cron_expr_for_apscheduler, validate_cron_expr
+from src.catch_up import MisfirePolicy, catch_up, missed_fire_times
+from src.dispatcher import PostingDispatcher
+from src.fanout import ChannelDelivery, DeliveryStatus, deliver, pending_channels
+from src.metrics import (
+    ADD_TO_QUEUE_SECONDS,
+    GET_USER_SECONDS,
+    PICK_POST_SECONDS,
+    POST_DELAY_SECONDS,
+    POST_JOB_SECONDS,
+    QUEUE_DEPTH,
+    SCHEDULER_LAG_SECONDS,
+    STARTUP_SCHEDULING_SECONDS,
+    USER_CACHE_REQUESTS,
+    timed,
+)
+from src.outbox import Outbox, Priority
+from src.render import RenderPlan, SendSafeSettings, html_preview, render_post
+from src.rollups import Granularity, PostingHistory, history_query, rollup_updates
+from src.simulator import SimulationResult, SimUser, simulate
+from src.slots import CATCH_UP_SLOT, REGULAR_SLOT, claim_slot
+from src.transfer import EXPORT_FIELDS, check_source, export_line
+from src.unit_of_work import PostingUnitOfWork
+from src.utils import normalize_cron_expr, parse_cron_expr_for_apscheduler, validate_cron_expr
 
 
 class SchedulingMode(Enum):
     PERIOD = "period"
     CRON = "cron"
 
+class SaveMode(Enum):
+    DATA = "data"  # save data to db and then post manually
+    FORWARD = (
+        "forward"  # save message id to db and then forward original message to channel
+    )
+
+
 class AppConfig(BaseSettings):
     """Basic app configuration"""
 
     telegram_bot_token: SecretStr
     target_channel_id: int
+    # mirrored channels every post goes to, e.g. [-1001, -1002]. Empty - target_channel_id only
+    target_channel_ids: list[int] = []
+    # channels a post is sent to at the same time
+    max_parallel_channels: int = 10
+    # failed sends to a channel before it is given up for that post - the queue moves on
+    max_channel_attempts: int = 3
     scheduling_mode: SchedulingMode = SchedulingMode.PERIOD
     scheduling_period_seconds: int = 60
     scheduling_cron_expr: Optional[str] = None
+    # how long a claimed post stays reserved for the sender before other workers may take it
+    post_lease_seconds: int = 300
+    # how many posting jobs may run at the same time
+    max_concurrent_posts: int = 100
+    # spread jobs due at the same moment (e.g. everyone on "0 10 * * *") over this window:
+    # each user gets a stable offset. 0 - post exactly on time, in bursts
+    post_spread_seconds: float = 0
+    # messages per second across all chats - telegram's default limit is 30
+    outbox_global_rate: float = 30
+    # users fetched per round trip when scheduling on startup
+    startup_batch_size: int = 1000
+    # schedules are loaded from db lazily: only users due within this window are kept in memory
+    schedule_horizon_seconds: int = 3600
+    misfire_policy: MisfirePolicy = MisfirePolicy.ONCE
+    # cap on catch-up posts per user after a long downtime
+    misfire_max_posts: int = 10
+    # catch-up posts per second across all users, for misfire_policy=rate_limited
+    misfire_catchup_rate: float = 1
+    # how long user settings are served from memory before re-reading them from db
+    user_cache_ttl_seconds: int = 300
+    # users kept in memory at most - the least recently cached are evicted first
+    user_cache_max_size: int = 10000
+    # how text posts are stored. Posts with media are always saved as FORWARD
+    save_mode: SaveMode = SaveMode.DATA
+    # messages from a user arriving within this window of each other are enqueued as one batch,
+    # with one readiness prompt. Also how long to wait for the rest of an album
+    enqueue_debounce_seconds: float = 1.0
+    # a burst is flushed early once it has this many messages
+    enqueue_batch_max_messages: int = 100
+    # items per bulk write on /import and per cursor batch on /export
+    transfer_batch_size: int = 1000
+    # posted items are moved from the queue to the archive collection on this interval
+    archive_interval_seconds: int = 3600
+    archive_batch_size: int = 1000
+    # optional retention limits for the archive
+    archive_ttl_days: Optional[int] = None
+    archive_max_items_per_user: Optional[int] = None
+    # hourly posting history buckets are dropped after this many days, daily ones are kept
+    rollup_hourly_retention_days: int = 7
+    # prometheus endpoint at http://{metrics_host}:{metrics_port}/metrics, disabled if no port
+    metrics_host: str = "127.0.0.1"
+    metrics_port: Optional[int] = None
+    # queue depth gauges are recomputed from the counters on this interval
+    metrics_refresh_seconds: int = 60
+    # webhook mode (run.py --webhook): updates are served at http://{webhook_host}:{webhook_port}{webhook_path}
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
+    webhook_path: str = "/webhook"
+    # public url registered with telegram on startup. Not set - register it yourself (or test locally)
+    webhook_url: Optional[str] = None
+    webhook_secret: Optional[SecretStr] = None
+    # updates handled at the same time / accepted and not yet handled before asking telegram to retry
+    webhook_workers: int = 100
+    webhook_max_pending: int = 1000
+    # how long shutdown waits for in-flight updates
+    webhook_drain_timeout_seconds: float = 30
     debug: bool = False
 
     class Config:
@@ -53,34 +155,167 @@ class AppConfig(BaseSettings):
         return self
 
 
-class SaveMode(Enum):
-    DATA = "data"  # save data to db and then post manually
-    FORWARD = (
-        "forward"  # save message id to db and then forward original message to channel
-    )
-
-
 class Readiness(Enum):
     DRAFT = "draft"
     UNPOLISHED = "unpolished"
     FINISHED = "finished"
 
 
+# how much of the text is kept for previews of FORWARD posts
+PREVIEW_LENGTH = 200
+
+# Lower value = picked first. Stored on queue items so that the pick can be served by an index
+READINESS_PRIORITY = {
+    Readiness.FINISHED: 0,
+    Readiness.UNPOLISHED: 1,
+    Readiness.DRAFT: 2,
+}
+
+
 class PosterBotQueueItem(QueueItem):
     posted: bool = False
+    # the first target channel - per-channel results are in deliveries
     posted_channel_id: Optional[int] = None
     posted_at: Optional[datetime] = None
     readiness: Readiness = Readiness.DRAFT
+    readiness_priority: int = READINESS_PRIORITY[Readiness.DRAFT]
+    # FORWARD mode: the post is copied from the source message(s) by reference at post time
+    save_mode: SaveMode = SaveMode.DATA
+    source_chat_id: Optional[int] = None
+    source_message_ids: list[int] = []
+    media_group_id: Optional[str] = None
+    # lease: set while a worker is sending the post, expired leases can be re-claimed
+    claimed_by: Optional[str] = None
+    claim_expires_at: Optional[datetime] = None
+    # items enqueued together share the batch id - readiness is set per batch
+    batch_id: Optional[str] = None
+    # unique per user among pending items - see compute_content_hash
+    content_hash: Optional[str] = None
+    # DATA mode: how the text is sent, decided at enqueue
+    render_plan: Optional[RenderPlan] = None
+    # delivery per target channel, keyed by str(channel_id). Posted once no channel is left to retry
+    deliveries: dict[str, ChannelDelivery] = {}
     # todo: topic(s) - set of enums
 
+    # mongo _id of the stored document, if loaded from db
+    _doc_id: Any = PrivateAttr(default=None)
+
+    @model_validator(mode="after")
+    def sync_readiness_priority(self):
+        self.readiness_priority = READINESS_PRIORITY[self.readiness]
+        return self
+
+    @property
+    def preview(self) -> str:
+        if self.save_mode == SaveMode.FORWARD:
+            media_note = f"[{len(self.source_message_ids)} message(s), copied on posting]"
+            return f"{self.data}\n{media_note}" if self.data else media_note
+        return self.data
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "PosterBotQueueItem":
+        item = cls(**doc)
+        item._doc_id = doc.get("_id")
+        return item
+
+    def compute_content_hash(self) -> str:
+        """
+        Hash of the normalized text (whitespace collapsed, case folded).
+        FORWARD items are identified by their source messages instead - their text is only a preview.
+        """
+        if self.save_mode == SaveMode.FORWARD:
+            key = f"forward:{self.source_chat_id}:{','.join(map(str, self.source_message_ids))}"
+        else:
+            key = "data:" + " ".join(self.data.split()).casefold()
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def to_doc(self, user_id: int) -> dict:
+        """Document as stored in the queue collection, enums by value"""
+        if self.content_hash is None:
+            self.content_hash = self.compute_content_hash()
+        doc = {
+            key: value.value if isinstance(value, Enum) else value
+            for key, value in self.model_dump().items()
+        }
+        doc["deliveries"] = {key: delivery.to_doc() for key, delivery in self.deliveries.items()}
+        doc["user_id"] = user_id
+        return doc
+
+
+class QueueStats(BaseModel):
+    """Per-user queue counters, maintained incrementally on enqueue / post / readiness change"""
+
+    user_id: int
+    # unposted item counts, keyed by Readiness.value
+    unposted: dict[str, int] = {}
+    posted: int = 0
+    last_posted_at: Optional[datetime] = None
+
+    def count(self, readiness: Readiness) -> int:
+        return self.unposted.get(readiness.value, 0)
+
+    @property
+    def total_unposted(self) -> int:
+        return sum(self.unposted.values())
+
+    @property
+    def total_pickable(self) -> int:
+        """Items that will be posted - drafts never are"""
+        return self.count(Readiness.FINISHED) + self.count(Readiness.UNPOLISHED)
+
+    def format_breakdown(self) -> str:
+        return (
+            "Breakdown by readiness:\n"
+            f"- Finished: {self.count(Readiness.FINISHED)}\n"
+            f"- Unpolished: {self.count(Readiness.UNPOLISHED)}\n"
+            f"- Draft: {self.count(Readiness.DRAFT)}"
+        )
+
 
 class PosterBotUser(User):
     target_channel_id: int | None = None
+    target_channel_ids: list[int] = []
     scheduling_mode: SchedulingMode | None = None
     scheduling_period_seconds: int | None = None
     scheduling_cron_expr: str | None = None
     auto_posting_enabled: bool = False
 
+    @property
+    def channel_ids(self) -> list[int]:
+        """All channels posts go to - target_channel_ids, or the single target_channel_id"""
+        if self.target_channel_ids:
+            return list(dict.fromkeys(self.target_channel_ids))
+        return [self.target_channel_id] if self.target_channel_id is not None else []
+
+
+@dataclass
+class MessageBurst:
+    messages: list[Message]
+    last_received_at: float
+
+
+def _release_fields(deliveries: dict[str, ChannelDelivery] | None = None) -> dict[str, Any]:
+    """
+    $set fields dropping the lease on a claimed item, with delivery results if any -
+    per channel, so that earlier results are kept
+    """
+    return {
+        "claimed_by": None,
+        "claim_expires_at": None,
+        **{f"deliveries.{key}": delivery.to_doc() for key, delivery in (deliveries or {}).items()},
+    }
+
+
+def _log_task_failure(task: asyncio.Task):
+    """Done callback of background tasks - nobody awaits them, so errors are logged here"""
+    if not task.cancelled() and task.exception() is not None:
+        logger.opt(exception=task.exception()).error(f"Background task {task.get_name()} failed")
+
+
+def _as_utc(value: datetime) -> datetime:
+    """Datetimes come back from mongo naive (in UTC) unless the client is tz-aware"""
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
 
 class App:
     name = "Channel Poster Bot"
@@ -90,6 +325,28 @@ class App:
 
         self._queue = None
         self._scheduler = None
+        self._dispatcher = None
+        self._outbox = None
+        self._stats_collection = None
+        self._archive_collection = None
+        self._schedule_state_collection = None
+        self._rollups_collection = None
+        self._users_collection = None
+        self._startup_task: asyncio.Task | None = None
+        self._catch_up_task: asyncio.Task | None = None
+        # schedule state writes in flight - referenced so they are not garbage collected
+        self._state_writes: set[asyncio.Task] = set()
+        # next fire time -> users whose jobs for the previous one are done, not written yet
+        self._advances: dict[datetime | None, list[int]] = {}
+        self._advance_writer: asyncio.Task | None = None
+        # user_id -> (user, expires_at)
+        self._user_cache: dict[int, tuple[PosterBotUser, float]] = {}
+        # normalized cron expression -> compiled trigger
+        self._cron_triggers: dict[str, CronTrigger] = {}
+        # user_id -> messages of the burst received so far
+        self._bursts: dict[int, MessageBurst] = {}
+        self.startup_scheduling_seconds: float | None = None
+        self.send_safe_settings = SendSafeSettings()
 
     @property
     def queue(self):
@@ -98,50 +355,863 @@ class App:
             self._queue = create_queue(key="content", item_model=PosterBotQueueItem)
         return self._queue
 
+    @property
+    def queue_collection(self):
+        """Raw mongo collection behind the content queue - for indexed queries"""
+        return self.queue.collection
+
+    @property
+    def outbox(self) -> Outbox:
+        if self._outbox is None:
+            self._outbox = Outbox(send_safe, global_rate=self.config.outbox_global_rate)
+        return self._outbox
+
+    @property
+    def stats_collection(self):
+        if self._stats_collection is None:
+            self._stats_collection = get_database()["queue_stats"]
+        return self._stats_collection
+
+    @property
+    def archive_collection(self):
+        """Posted items, moved out of the hot queue by compact_posted_items"""
+        if self._archive_collection is None:
+            self._archive_collection = get_database()["content_archive"]
+        return self._archive_collection
+
+    @property
+    def schedule_state_collection(self):
+        """Per-user next fire time - lets a restart load only the schedules that are due"""
+        if self._schedule_state_collection is None:
+            self._schedule_state_collection = get_database()["schedule_state"]
+        return self._schedule_state_collection
+
+    @property
+    def rollups_collection(self):
+        """Hour / day buckets of posting counters - see src.rollups"""
+        if self._rollups_collection is None:
+            self._rollups_collection = get_database()["posting_rollups"]
+        return self._rollups_collection
+
+    @property
+    def users_collection(self):
+        """Raw mongo collection behind botspot's user manager - for filtered / streaming queries"""
+        if self._users_collection is None:
+            from botspot.utils import get_user_manager
+
+            user_manager = get_user_manager()
+            self._users_collection = user_manager.db[user_manager.collection]
+        return self._users_collection
+
     @property
     def scheduler(self):
         if self._scheduler is None:
             self._scheduler = get_scheduler()
         return self._scheduler
 
-    async def add_to_queue(self, text: str, user_id: int, readiness: Readiness = Readiness.DRAFT):
-        logger.debug(f"Adding to queue: user_id={user_id}, text={text!r}, readiness={readiness}")
-        item = PosterBotQueueItem(data=text, readiness=readiness)
-        # todo: return the item - including the id
-        return await self.queue.add_item(item, user_id=user_id)
+    @property
+    def dispatcher(self) -> PostingDispatcher:
+        if self._dispatcher is None:
+            self._dispatcher = PostingDispatcher(
+                self.post_content_job,
+                timezone=self.scheduler.timezone,
+                max_concurrency=self.config.max_concurrent_posts,
+                spread_seconds=self.config.post_spread_seconds,
+            )
+            self._dispatcher.lag_observer = self._observe_post_delay
+            self._dispatcher.advance_observer = self._on_schedule_advanced
+        return self._dispatcher
+
+    @staticmethod
+    def _observe_post_delay(user_id: int, delay: float, offset: float):
+        POST_DELAY_SECONDS.observe(delay)
+        # the spread offset is intended - the lag is what admission control added on top
+        SCHEDULER_LAG_SECONDS.observe(delay - offset)
+
+    @timed(ADD_TO_QUEUE_SECONDS)
+    async def add_to_queue(
+        self, item: PosterBotQueueItem, user_id: int, readiness: Readiness = Readiness.DRAFT
+    ) -> Any:
+        """
+        Save the item to the queue. Returns its id, also set as item._doc_id.
+        Returns None if the same content is already pending.
+        """
+        logger.debug(f"Adding to queue: user_id={user_id}, item={item!r}, readiness={readiness}")
+        item.readiness = readiness
+        item.readiness_priority = READINESS_PRIORITY[readiness]
+        # inserted directly rather than via queue.add_item - to get the id back
+        try:
+            result = await self.queue_collection.insert_one(item.to_doc(user_id))
+        except DuplicateKeyError:
+            logger.debug(f"Duplicate content for user_id={user_id}, hash={item.content_hash}")
+            item._doc_id = None
+            return None
+        item._doc_id = result.inserted_id
+        await self._update_queue_stats(user_id, inc={f"unposted.{readiness.value}": 1})
+        await self._record_rollups(rollup_updates(user_id, datetime.now(timezone.utc), {"added": 1}))
+        return item._doc_id
+
+    @timed(ADD_TO_QUEUE_SECONDS)
+    async def add_batch_to_queue(
+        self, items: list[PosterBotQueueItem], user_id: int, readiness: Readiness = Readiness.DRAFT
+    ) -> str:
+        """Save the items in a single write, under a common batch id. Returns the batch id"""
+        batch_id = uuid4().hex
+        logger.debug(f"Adding batch {batch_id} of {len(items)} items to queue: user_id={user_id}")
+        for item in items:
+            item.readiness = readiness
+            item.readiness_priority = READINESS_PRIORITY[readiness]
+            item.batch_id = batch_id
+        await self._insert_queue_items(items, user_id)
+        return batch_id
+
+    async def _insert_queue_items(self, items: list[PosterBotQueueItem], user_id: int) -> int:
+        """
+        Bulk insert. Ids are assigned client-side in list order, so the items are picked in this order.
+        Duplicates of pending content are skipped - their item._doc_id is None.
+        Returns the number of inserted items.
+        """
+        docs = [item.to_doc(user_id) for item in items]
+        duplicates: set[int] = set()
+        try:
+            await self.queue_collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+            duplicates = {error["index"] for error in e.details["writeErrors"]}
+        inserted = []
+        for index, (item, doc) in enumerate(zip(items, docs)):
+            # insert_many sets _id on the documents it was given
+            item._doc_id = None if index in duplicates else doc["_id"]
+            if item._doc_id is not None:
+                inserted.append(item)
+        if inserted:
+            inc = Counter(f"unposted.{item.readiness.value}" for item in inserted)
+            await self._update_queue_stats(user_id, inc=dict(inc))
+            await self._record_rollups(
+                rollup_updates(user_id, datetime.now(timezone.utc), {"added": len(inserted)})
+            )
+        return len(inserted)
+
+    async def import_items(
+        self,
+        user_id: int,
+        records: Iterable[dict],
+        readiness: Readiness = Readiness.DRAFT,
+        progress: Callable[[int], Awaitable[None]] | None = None,
+    ) -> tuple[int, int]:
+        """
+        Add posts from parsed records (see src.transfer) in bulk writes, in record order.
+
+        Records without readiness get the given one. Returns the number of imported items and of
+        skipped duplicates. A bad record - or one copying messages from another chat, see
+        check_source - raises ValueError. The batches written before it stay imported.
+        """
+        batch_id = uuid4().hex
+        imported = 0
+        read = 0
+        batch: list[PosterBotQueueItem] = []
+        for record in records:
+            check_source(record, user_id)
+            item = PosterBotQueueItem(**{"readiness": readiness, **record, "batch_id": batch_id})
+            if item.save_mode == SaveMode.DATA:
+                item.render_plan = self.render(item.data)
+            batch.append(item)
+            if len(batch) >= self.config.transfer_batch_size:
+                imported += await self._insert_queue_items(batch, user_id)
+                read += len(batch)
+                batch = []
+                if progress is not None:
+                    await progress(imported)
+        if batch:
+            imported += await self._insert_queue_items(batch, user_id)
+            read += len(batch)
+        logger.info(f"Imported {imported} items for user_id={user_id}, {read - imported} duplicates")
+        return imported, read - imported
+
+    async def export_queue(
+        self, user_id: int, file: IO[str], progress: Callable[[int], Awaitable[None]] | None = None
+    ) -> int:
+        """Write pending items as JSONL, in the order they would be posted. Returns the item count"""
+        cursor = self.queue_collection.find(
+            {"user_id": user_id, "posted": False},
+            {field: 1 for field in EXPORT_FIELDS},
+            sort=[("readiness_priority", 1), ("_id", 1)],
+            batch_size=self.config.transfer_batch_size,
+        )
+        exported = 0
+        async for doc in cursor:
+            file.write(export_line(doc))
+            exported += 1
+            if progress is not None and exported % self.config.transfer_batch_size == 0:
+                await progress(exported)
+        return exported
+
+    async def set_batch_readiness(self, user_id: int, batch_id: str, readiness: Readiness) -> int:
+        """Change readiness of the pending items of a batch. Returns the number of such items"""
+        logger.debug(f"Setting readiness of batch {batch_id} to {readiness} for user_id={user_id}")
+        query = {"user_id": user_id, "batch_id": batch_id, "posted": False}
+        unchanged = await self.queue_collection.count_documents({**query, "readiness": readiness.value})
+        inc = {}
+        moved = 0
+        for old_readiness in Readiness:
+            if old_readiness == readiness:
+                continue
+            # one update per old readiness - the counters move by exactly what was modified
+            result = await self.queue_collection.update_many(
+                {**query, "readiness": old_readiness.value},
+                {
+                    "$set": {
+                        "readiness": readiness.value,
+                        "readiness_priority": READINESS_PRIORITY[readiness],
+                    }
+                },
+            )
+            if result.modified_count:
+                inc[f"unposted.{old_readiness.value}"] = -result.modified_count
+                moved += result.modified_count
+        if moved:
+            inc[f"unposted.{readiness.value}"] = moved
+            await self._update_queue_stats(user_id, inc=inc)
+        return unchanged + moved
+
+    async def remove_batch_from_queue(self, user_id: int, batch_id: str) -> int:
+        """Delete the pending items of a batch. Returns the number of deleted items"""
+        inc = {}
+        query = {"user_id": user_id, "batch_id": batch_id, "posted": False}
+        for readiness in Readiness:
+            result = await self.queue_collection.delete_many({**query, "readiness": readiness.value})
+            if result.deleted_count:
+                inc[f"unposted.{readiness.value}"] = -result.deleted_count
+        if inc:
+            await self._update_queue_stats(user_id, inc=inc)
+            await self._record_rollups(
+                rollup_updates(user_id, datetime.now(timezone.utc), {"removed": -sum(inc.values())})
+            )
+        return -sum(inc.values())
+
+    async def set_readiness(self, user_id: int, item_id: Any, readiness: Readiness) -> bool:
+        """Change readiness of a pending queue item. Returns False if there was no such item."""
+        logger.debug(f"Setting readiness of item {item_id} to {readiness} for user_id={user_id}")
+        old_doc = await self.queue_collection.find_one_and_update(
+            {"_id": item_id, "user_id": user_id, "posted": False},
+            {
+                "$set": {
+                    "readiness": readiness.value,
+                    "readiness_priority": READINESS_PRIORITY[readiness],
+                }
+            },
+            projection={"readiness": 1},
+        )
+        if old_doc is None:
+            return False
+        old_readiness = Readiness(old_doc["readiness"])
+        if old_readiness != readiness:
+            await self._update_queue_stats(
+                user_id,
+                inc={f"unposted.{old_readiness.value}": -1, f"unposted.{readiness.value}": 1},
+            )
+        return True
+
+    async def _update_queue_stats(self, user_id: int, inc: dict, set_fields: dict | None = None):
+        update: dict[str, Any] = {"$inc": inc}
+        if set_fields:
+            update["$set"] = set_fields
+        result = await self.stats_collection.update_one({"user_id": user_id}, update)
+        if result.matched_count == 0:
+            # no counters yet - build them from the queue (already includes this change)
+            await self.recount_queue_stats(user_id)
+
+    async def _record_rollups(self, updates: list[UpdateOne]):
+        if updates:
+            await self.rollups_collection.bulk_write(updates, ordered=False)
+
+    async def get_posting_history(self, user_id: int) -> PostingHistory:
+        """Recent throughput from the rollups - a bounded read, independent of the history size"""
+        now = datetime.now(timezone.utc)
+        cursor = self.rollups_collection.find(history_query(user_id, now), {"_id": 0, "user_id": 0})
+        return PostingHistory.from_docs([doc async for doc in cursor], now)
+
+    async def get_queue_stats(self, user_id: int) -> QueueStats:
+        """Read queue counters for the user - O(1), no queue scan."""
+        doc = await self.stats_collection.find_one({"user_id": user_id})
+        if doc is None:
+            # first access for a user that had items before counters existed
+            return await self.recount_queue_stats(user_id)
+        return QueueStats(**doc)
+
+    async def recount_queue_stats(self, user_id: int) -> QueueStats:
+        """Rebuild the counters document from the queue itself - to repair drift."""
+        logger.info(f"Recounting queue stats for user {user_id}")
+        stats = QueueStats(user_id=user_id)
+        pipeline = [
+            {"$match": {"user_id": user_id}},
+            {
+                "$group": {
+                    "_id": {"posted": "$posted", "readiness": "$readiness"},
+                    "count": {"$sum": 1},
+                    "last_posted_at": {"$max": "$posted_at"},
+                }
+            },
+        ]
+        rows = [row async for row in self.queue_collection.aggregate(pipeline)]
+        # posted items that were already moved to the archive
+        rows += [row async for row in self.archive_collection.aggregate(pipeline)]
+        for row in rows:
+            if row["_id"].get("posted"):
+                stats.posted += row["count"]
+                if row["last_posted_at"] and (
+                    stats.last_posted_at is None or row["last_posted_at"] > stats.last_posted_at
+                ):
+                    stats.last_posted_at = row["last_posted_at"]
+            else:
+                readiness = row["_id"].get("readiness") or Readiness.DRAFT.value
+                stats.unposted[readiness] = stats.unposted.get(readiness, 0) + row["count"]
+        await self.stats_collection.replace_one(
+            {"user_id": user_id}, stats.model_dump(), upsert=True
+        )
+        return stats
+
+    async def ensure_indexes(self):
+        """Create indexes used by the app and backfill fields they rely on."""
+        logger.debug("Ensuring queue indexes")
+        # backfill priority for items created before the field existed
+        for readiness, priority in READINESS_PRIORITY.items():
+            await self.queue_collection.update_many(
+                {"readiness": readiness.value, "readiness_priority": {"$exists": False}},
+                {"$set": {"readiness_priority": priority}},
+            )
+        await self.stats_collection.create_index("user_id", unique=True)
+        # rejects content that is already pending at enqueue. Posted items and items without
+        # a hash (duplicates found by the backfill) are not indexed
+        await self.queue_collection.create_index(
+            [("user_id", 1), ("content_hash", 1)],
+            unique=True,
+            partialFilterExpression={"content_hash": {"$type": "string"}, "posted": False},
+            name="unique_pending_content",
+        )
+        await self.schedule_state_collection.create_index("user_id", unique=True)
+        await self.schedule_state_collection.create_index("next_fire_at")
+        # one document per bucket - concurrent upserts can not create two. Serves history_query
+        await self.rollups_collection.create_index(
+            [("user_id", 1), ("granularity", 1), ("bucket", 1), ("channel_id", 1)],
+            unique=True,
+            name="rollup_bucket",
+        )
+        # note: changing the ttl of an existing index requires a manual collMod
+        await self.rollups_collection.create_index(
+            "bucket",
+            expireAfterSeconds=self.config.rollup_hourly_retention_days * 24 * 3600,
+            partialFilterExpression={"granularity": Granularity.HOUR.value},
+            name="hourly_rollup_ttl",
+        )
+        # serves _claim_post_from_queue: equality on user_id, posted + sort on priority, insertion order
+        await self.queue_collection.create_index(
+            [("user_id", 1), ("posted", 1), ("readiness_priority", 1), ("_id", 1)],
+            name="pick_post",
+        )
+        # serves batch readiness updates
+        await self.queue_collection.create_index(
+            [("user_id", 1), ("batch_id", 1)],
+            partialFilterExpression={"batch_id": {"$type": "string"}},
+            name="batch_items",
+        )
+        # serves compact_posted_items
+        await self.queue_collection.create_index(
+            "posted", partialFilterExpression={"posted": True}, name="posted_items"
+        )
+        # serves archive history queries and per-user size caps
+        await self.archive_collection.create_index([("user_id", 1), ("posted_at", DESCENDING)])
+        if self.config.archive_ttl_days is not None:
+            # note: changing the ttl of an existing index requires a manual collMod
+            await self.archive_collection.create_index(
+                "posted_at",
+                expireAfterSeconds=self.config.archive_ttl_days * 24 * 3600,
+                name="archive_ttl",
+            )
+
+    def schedule_maintenance_jobs(self):
+        """Background jobs that keep the queue small"""
+        # one-off, right away - a no-op once all items have a hash
+        self.scheduler.add_job(
+            func=self.backfill_content_hashes, id="backfill_content_hashes", replace_existing=True
+        )
+        self.scheduler.add_job(
+            func=self.compact_posted_items,
+            trigger="interval",
+            seconds=self.config.archive_interval_seconds,
+            id="compact_posted_items",
+            replace_existing=True,
+        )
+        self.scheduler.add_job(
+            func=self.load_upcoming_schedules,
+            trigger="interval",
+            seconds=self.config.schedule_horizon_seconds / 2,
+            id="load_upcoming_schedules",
+            replace_existing=True,
+        )
+        if self.config.metrics_port is not None:
+            self.scheduler.add_job(
+                func=self.refresh_queue_depth_metrics,
+                trigger="interval",
+                seconds=self.config.metrics_refresh_seconds,
+                id="refresh_queue_depth_metrics",
+                replace_existing=True,
+            )
+
+    async def backfill_content_hashes(self) -> int:
+        """
+        Set content_hash on queue items created before it existed. Returns the number of updated items.
+
+        Of pending duplicates one item gets the hash, the others are left without one (null) -
+        they are still posted, but do not block anything.
+        """
+        cursor = self.queue_collection.find(
+            {"content_hash": {"$exists": False}}, batch_size=self.config.archive_batch_size
+        )
+        updated = 0
+        duplicates = 0
+        batch: list[tuple[Any, str]] = []
+
+        async def flush():
+            nonlocal updated, duplicates
+            requests = [
+                UpdateOne({"_id": item_id}, {"$set": {"content_hash": content_hash}})
+                for item_id, content_hash in batch
+            ]
+            try:
+                result = await self.queue_collection.bulk_write(requests, ordered=False)
+                updated += result.modified_count
+            except BulkWriteError as e:
+                errors = e.details["writeErrors"]
+                if any(error["code"] != 11000 for error in errors):
+                    raise
+                updated += e.details["nModified"]
+                duplicates += len(errors)
+                # mark as processed, so that the next run skips them
+                await self.queue_collection.update_many(
+                    {"_id": {"$in": [batch[error["index"]][0] for error in errors]}},
+                    {"$set": {"content_hash": None}},
+                )
+            batch.clear()
+
+        async for doc in cursor:
+            batch.append((doc["_id"], PosterBotQueueItem.from_doc(doc).compute_content_hash()))
+            if len(batch) >= self.config.archive_batch_size:
+                await flush()
+        if batch:
+            await flush()
+        if updated or duplicates:
+            logger.info(f"Backfilled content hash of {updated} items, {duplicates} duplicates found")
+        return updated
+
+    async def refresh_queue_depth_metrics(self):
+        """Sum the per-user counters into global per-readiness gauges"""
+        pipeline = [
+            {"$project": {"unposted": {"$objectToArray": "$unposted"}}},
+            {"$unwind": "$unposted"},
+            {"$group": {"_id": "$unposted.k", "count": {"$sum": "$unposted.v"}}},
+        ]
+        async for row in self.stats_collection.aggregate(pipeline):
+            QUEUE_DEPTH.set(row["count"], row["_id"])
+
+    async def compact_posted_items(self) -> int:
+        """
+        Move posted items from the queue to the archive, so that the queue holds only pending items.
+
+        Safe to run concurrently and to re-run after a crash: items are copied with their _id
+        before they are deleted from the queue, duplicates in the archive are skipped.
+        """
+        moved = 0
+        users = set()
+        batch_size = self.config.archive_batch_size
+        while True:
+            docs = await self.queue_collection.find({"posted": True}).to_list(batch_size)
+            if not docs:
+                break
+            try:
+                await self.archive_collection.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                # already archived by a previous or concurrent run
+                if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                    raise
+            await self.queue_collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+            moved += len(docs)
+            users.update(doc.get("user_id") for doc in docs)
+
+        if self.config.archive_max_items_per_user is not None:
+            for user_id in users:
+                await self._trim_archive(user_id, self.config.archive_max_items_per_user)
+        if moved:
+            logger.info(f"Moved {moved} posted items to the archive")
+        return moved
 
-    async def get_users(self) -> list[PosterBotUser]:
-        from botspot.utils import get_user_manager
+    async def _trim_archive(self, user_id: int, max_items: int):
+        cursor = self.archive_collection.find(
+            {"user_id": user_id}, projection={"_id": 1}, sort=[("posted_at", DESCENDING)], skip=max_items
+        )
+        ids = [doc["_id"] async for doc in cursor]
+        if ids:
+            await self.archive_collection.delete_many({"_id": {"$in": ids}})
+            logger.debug(f"Trimmed {len(ids)} archived items for user_id={user_id}")
 
-        logger.debug("Fetching all users from user manager")
-        user_manager = get_user_manager()
-        users = await user_manager.get_users()
-        logger.debug(f"Fetched {len(users)} users")
+    async def get_archived_items(
+        self, user_id: int, limit: int = 10, skip: int = 0
+    ) -> list[PosterBotQueueItem]:
+        """Posting history of the user, newest first"""
+        cursor = self.archive_collection.find(
+            {"user_id": user_id}, sort=[("posted_at", DESCENDING)], skip=skip, limit=limit
+        )
+        return [PosterBotQueueItem.from_doc(doc) async for doc in cursor]
+
+    async def repost_archived_item(self, user_id: int, item_id: Any) -> PosterBotQueueItem | None:
+        """
+        Put a copy of an archived post back in the queue, with its original readiness.
+        The copy has no _doc_id if the same content is already pending.
+        """
+        doc = await self.archive_collection.find_one({"_id": item_id, "user_id": user_id})
+        if doc is None:
+            return None
+        archived = PosterBotQueueItem.from_doc(doc)
+        item = archived.model_copy(
+            update={
+                "posted": False,
+                "posted_channel_id": None,
+                "posted_at": None,
+                "deliveries": {},
+                "claimed_by": None,
+                "claim_expires_at": None,
+            }
+        )
+        await self.add_to_queue(item, user_id, readiness=archived.readiness)
+        return item
+
+    async def simulation_users(self) -> list[SimUser]:
+        """Active users with their schedules, queue sizes and saved fire times - input for simulate"""
+        users = []
+        batch: list[PosterBotUser] = []
+
+        async def flush():
+            user_ids = [user.user_id for user in batch]
+            stats = {
+                doc["user_id"]: QueueStats(**doc)
+                async for doc in self.stats_collection.find({"user_id": {"$in": user_ids}})
+            }
+            fire_times = {
+                doc["user_id"]: _as_utc(doc["next_fire_at"])
+                async for doc in self.schedule_state_collection.find({"user_id": {"$in": user_ids}})
+            }
+            for user in batch:
+                assert user.scheduling_mode is not None
+                user_stats = stats.get(user.user_id)
+                users.append(
+                    SimUser(
+                        user_id=user.user_id,
+                        scheduling_mode=user.scheduling_mode.value,
+                        scheduling_period_seconds=user.scheduling_period_seconds,
+                        scheduling_cron_expr=user.scheduling_cron_expr,
+                        queue_size=user_stats.total_pickable if user_stats is not None else 0,
+                        channels=len(user.channel_ids),
+                        next_fire_at=fire_times.get(user.user_id),
+                    )
+                )
+
+        cursor = self.users_collection.find(
+            {"auto_posting_enabled": True}, batch_size=self.config.startup_batch_size
+        )
+        async for doc in cursor:
+            user = PosterBotUser(**doc)
+            if user.scheduling_mode is None:
+                continue
+            batch.append(user)
+            if len(batch) >= self.config.startup_batch_size:
+                await flush()
+                batch = []
+        if batch:
+            await flush()
         return users
 
+    async def simulate_schedules(self, days: float) -> SimulationResult:
+        """Replay the current schedules of all active users for the next `days`, in virtual time"""
+        users = await self.simulation_users()
+        # pure cpu work - keep the event loop responsive
+        return await asyncio.to_thread(
+            simulate,
+            users,
+            start=self.dispatcher.now().replace(microsecond=0),
+            days=days,
+            spread_seconds=self.config.post_spread_seconds,
+            global_rate=self.config.outbox_global_rate,
+        )
+
+    def start_scheduling_on_startup(self):
+        """Schedule posts in the background, so that the bot can start handling updates right away."""
+        self._startup_task = asyncio.create_task(
+            self.schedule_posts_on_startup(), name="schedule_posts_on_startup"
+        )
+        self._startup_task.add_done_callback(_log_task_failure)
+
     async def schedule_posts_on_startup(self):
-        """Schedule posting from queue at regular intervals or cron."""
+        """
+        Schedule posting from queue at regular intervals or cron.
 
-        logger.debug("Scheduling posts for all users on startup")
-        # go over all existing users and schedule posting job if they have auto-posting enabled
-        users = await self.get_users()
+        Schedules are restored from the schedule_state collection: only users due within the
+        horizon are loaded, the rest are picked up by load_upcoming_schedules as they come due.
+        Posts missed during downtime are handled according to the misfire policy.
+        Active users without saved state - all of them on the first start - are scheduled from
+        their settings, and their state is saved.
+        """
 
-        for user in users:
-            if user.auto_posting_enabled:
-                logger.info(
-                    f"Scheduling posts for user {user.user_id} to channel {user.target_channel_id}"
+        logger.debug("Scheduling posts for active users on startup")
+        started_at = time.perf_counter()
+        if await self.schedule_state_collection.estimated_document_count() == 0:
+            scheduled = await self._schedule_all_active_users()
+        else:
+            scheduled = await self.load_upcoming_schedules(catch_up=True)
+            scheduled += await self._schedule_users_without_state()
+
+        self.startup_scheduling_seconds = time.perf_counter() - started_at
+        STARTUP_SCHEDULING_SECONDS.set(self.startup_scheduling_seconds)
+        logger.info(
+            f"Scheduled posts for {scheduled} active users in {self.startup_scheduling_seconds:.2f}s"
+        )
+
+    async def stop_scheduling(self):
+        """Stop startup scheduling, the dispatcher and the catch-up, let pending schedule state writes finish"""
+        background = [task for task in (self._startup_task, self._catch_up_task) if task is not None]
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        await self.dispatcher.stop()
+        await asyncio.gather(*self._state_writes, return_exceptions=True)
+
+    async def _schedule_all_active_users(self) -> int:
+        scheduled = 0
+        batch: list[PosterBotUser] = []
+        # only users with auto-posting enabled, streamed from the server in batches
+        cursor = self.users_collection.find(
+            {"auto_posting_enabled": True}, batch_size=self.config.startup_batch_size
+        )
+        async for doc in cursor:
+            batch.append(PosterBotUser(**doc))
+            if len(batch) >= self.config.startup_batch_size:
+                scheduled += await self._schedule_and_save(batch)
+                batch = []
+        if batch:
+            scheduled += await self._schedule_and_save(batch)
+        return scheduled
+
+    async def _schedule_users_without_state(self) -> int:
+        """
+        Schedule active users that have no schedule state - e.g. its write failed on activation.
+        The states are joined on the server, only the users that are missing one are returned.
+        """
+        scheduled = 0
+        batch: list[PosterBotUser] = []
+        cursor = self.users_collection.aggregate(
+            [
+                {"$match": {"auto_posting_enabled": True}},
+                # one state per user (unique index), served by the user_id index
+                {
+                    "$lookup": {
+                        "from": self.schedule_state_collection.name,
+                        "localField": "user_id",
+                        "foreignField": "user_id",
+                        "as": "schedule_state",
+                    }
+                },
+                # a document with only a slot claim (see src.slots) is no schedule
+                {"$match": {"schedule_state": {"$not": {"$elemMatch": {"next_fire_at": {"$ne": None}}}}}},
+                {"$project": {"schedule_state": 0}},
+            ],
+            batchSize=self.config.startup_batch_size,
+        )
+        async for doc in cursor:
+            user = PosterBotUser(**doc)
+            if user.user_id in self.dispatcher:
+                continue
+            batch.append(user)
+            if len(batch) >= self.config.startup_batch_size:
+                scheduled += await self._schedule_stateless(batch)
+                batch = []
+        if batch:
+            scheduled += await self._schedule_stateless(batch)
+        return scheduled
+
+    async def _schedule_stateless(self, users: list[PosterBotUser]) -> int:
+        logger.info(f"Scheduling {len(users)} active users without schedule state")
+        return await self._schedule_and_save(users)
+
+    async def _schedule_and_save(self, users: list[PosterBotUser]) -> int:
+        scheduled = self._schedule_user_posting_jobs(users)
+        await self._save_schedule_state([user.user_id for user in users])
+        return scheduled
+
+    async def load_upcoming_schedules(self, catch_up: bool = False) -> int:
+        """
+        Register users that are due within the horizon and not in the dispatcher yet.
+
+        With catch_up, users whose saved fire time has passed get their missed posts
+        according to the misfire policy.
+        """
+        now = self.dispatcher.now()
+        horizon = now + timedelta(seconds=self.config.schedule_horizon_seconds)
+        cursor = self.schedule_state_collection.find(
+            {"next_fire_at": {"$lt": horizon}},
+            {"_id": 0, "user_id": 1, "next_fire_at": 1},
+            batch_size=self.config.startup_batch_size,
+        )
+        missed: dict[int, list[datetime]] = {}
+        scheduled = 0
+        batch: dict[int, datetime] = {}
+        async for doc in cursor:
+            if doc["user_id"] in self.dispatcher:
+                continue
+            batch[doc["user_id"]] = _as_utc(doc["next_fire_at"])
+            if len(batch) >= self.config.startup_batch_size:
+                scheduled += await self._load_schedules(batch, now, missed)
+                batch = {}
+        if batch:
+            scheduled += await self._load_schedules(batch, now, missed)
+
+        if catch_up and missed:
+            self._catch_up_task = asyncio.create_task(
+                self._catch_up_missed_posts(missed), name="catch_up_missed_posts"
+            )
+            self._catch_up_task.add_done_callback(_log_task_failure)
+        elif missed:
+            await self._save_schedule_state(list(missed))
+        logger.debug(f"Loaded {scheduled} schedules due before {horizon}")
+        return scheduled
+
+    async def _load_schedules(
+        self, next_fire_times: dict[int, datetime], now: datetime, missed: dict[int, list[datetime]]
+    ) -> int:
+        """
+        Schedule a batch of users from their saved state. Fills `missed` with missed fire times -
+        the state of those users is saved once they are caught up.
+        """
+        schedules = []
+        cursor = self.users_collection.find(
+            {"user_id": {"$in": list(next_fire_times)}, "auto_posting_enabled": True}
+        )
+        async for doc in cursor:
+            user = PosterBotUser(**doc)
+            next_fire_at = next_fire_times.pop(user.user_id)
+            try:
+                group_key, trigger = self._build_user_schedule(user, start_date=next_fire_at)
+            except (AssertionError, ValueError) as e:
+                logger.warning(f"Skipping scheduling for user {user.user_id}: {e}")
+                continue
+            schedules.append((user.user_id, trigger, group_key))
+            if next_fire_at <= now:
+                missed[user.user_id] = missed_fire_times(
+                    trigger, next_fire_at, now, self.config.misfire_max_posts
+                )
+        self.dispatcher.schedule_many(schedules)
+
+        if next_fire_times:
+            # deactivated or deleted users
+            await self.schedule_state_collection.delete_many(
+                {"user_id": {"$in": list(next_fire_times)}}
+            )
+        return len(schedules)
+
+    async def _catch_up_missed_posts(self, missed: dict[int, list[datetime]]):
+        await catch_up(
+            missed,
+            self.config.misfire_policy,
+            post=self._post_missed_slot,
+            # move the saved state past the downtime, so that a crash does not repeat the catch-up
+            caught_up=self._save_schedule_state,
+            max_concurrency=self.config.max_concurrent_posts,
+            rate=self.config.misfire_catchup_rate,
+        )
+
+    async def _post_missed_slot(self, user_id: int, slot: datetime):
+        await self.post_content_job(user_id, slot, slot_field=CATCH_UP_SLOT)
+
+    async def _save_schedule_state(self, user_ids: list[int]):
+        """Save the dispatcher's next fire time of the users"""
+        requests = []
+        for user_id in user_ids:
+            next_fire_at = self.dispatcher.next_fire_time(user_id)
+            if next_fire_at is not None:
+                requests.append(
+                    UpdateOne(
+                        {"user_id": user_id}, {"$set": {"next_fire_at": next_fire_at}}, upsert=True
+                    )
                 )
-                self._schedule_user_posting_job(user)
+        if requests:
+            await self.schedule_state_collection.bulk_write(requests, ordered=False)
+
+    def _on_schedule_advanced(self, user_ids: list[int], next_fire_at: datetime | None):
+        """
+        Reported per user as its job finishes. Buffered, so that the users of a group finishing
+        around the same time are written together by a single writer task.
+        """
+        self._advances.setdefault(next_fire_at, []).extend(user_ids)
+        if self._advance_writer is None or self._advance_writer.done():
+            self._advance_writer = asyncio.create_task(self._write_advances())
+            self._state_writes.add(self._advance_writer)
+            self._advance_writer.add_done_callback(self._state_writes.discard)
+
+    async def _write_advances(self):
+        while self._advances:
+            advances, self._advances = self._advances, {}
+            for next_fire_at, user_ids in advances.items():
+                try:
+                    await self._save_next_fire_time(user_ids, next_fire_at)
+                except Exception:
+                    logger.exception(
+                        f"Failed to save next fire time {next_fire_at} of {len(user_ids)} users"
+                    )
+
+    async def _save_next_fire_time(self, user_ids: list[int], next_fire_at: datetime | None):
+        batch_size = self.config.startup_batch_size
+        for offset in range(0, len(user_ids), batch_size):
+            query = {"user_id": {"$in": user_ids[offset : offset + batch_size]}}
+            if next_fire_at is None:
+                await self.schedule_state_collection.delete_many(query)
             else:
-                logger.info(
-                    f"Auto-posting is disabled for user {user.user_id}, skipping scheduling."
+                # $max: a job finishing late must not move the state back past a later one
+                await self.schedule_state_collection.update_many(
+                    query, {"$max": {"next_fire_at": next_fire_at}}
                 )
 
+    def _schedule_user_posting_jobs(self, users: list[PosterBotUser]) -> int:
+        """Bulk version of _schedule_user_posting_job. Users with broken settings are skipped."""
+        schedules = []
+        for user in users:
+            try:
+                group_key, trigger = self._build_user_schedule(user)
+            except (AssertionError, ValueError) as e:
+                logger.warning(f"Skipping scheduling for user {user.user_id}: {e}")
+                continue
+            schedules.append((user.user_id, trigger, group_key))
+        self.dispatcher.schedule_many(schedules)
+        return len(schedules)
+
     def _schedule_user_posting_job(self, user: PosterBotUser):
         """
         Schedule a posting job for a user based on their settings.
         """
         logger.debug(f"_schedule_user_posting_job called with user_id={user.user_id}")
+        group_key, trigger = self._build_user_schedule(user)
+        self.dispatcher.schedule(user.user_id, trigger, group_key)
+
+    def _build_user_schedule(
+        self, user: PosterBotUser, start_date: datetime | None = None
+    ) -> tuple[str | None, BaseTrigger]:
+        """
+        Returns (group key, trigger) for the dispatcher.
+
+        Cron users with the same (normalized) expression share one group and one compiled trigger.
+        Period users get a group of their own, as the interval starts when they are scheduled -
+        or at start_date, to keep the phase of a restored schedule. The start is cut to whole
+        seconds, which mongo stores exactly: a replica restoring the schedule from the saved next
+        fire time then fires the same slots as the replica that scheduled it.
+        """
         assert user.scheduling_mode is not None, "Scheduling mode is not set for user"
 
         if user.scheduling_mode == SchedulingMode.PERIOD:
@@ -152,12 +1222,13 @@ class App:
             logger.debug(
                 f"Scheduling user {user.user_id} to post every {user.scheduling_period_seconds} seconds"
             )
-            self.scheduler.add_job(
-                func=self.post_content_job,
-                trigger="interval",
+            if start_date is None:
+                # the first post is one period from now
+                start_date = self.dispatcher.now() + timedelta(seconds=user.scheduling_period_seconds)
+            return None, IntervalTrigger(
                 seconds=user.scheduling_period_seconds,
-                args=[user.user_id],
-                id=f"post_content_job_{user.user_id}",
+                start_date=start_date.replace(microsecond=0),
+                timezone=self.scheduler.timezone,
             )
         elif user.scheduling_mode == SchedulingMode.CRON:
             assert (
@@ -167,96 +1238,284 @@ class App:
             logger.debug(
                 f"Scheduling user {user.user_id} to post with cron {user.scheduling_cron_expr}"
             )
-            cron_kwargs = parse_cron_expr_for_apscheduler(user.scheduling_cron_expr)
-            self.scheduler.add_job(
-                func=self.post_content_job,
-                trigger=CronTrigger(**cron_kwargs),
-                args=[user.user_id],
-                id=f"post_content_job_{user.user_id}",
-            )
+            expr = normalize_cron_expr(user.scheduling_cron_expr)
+            return f"cron:{expr}", self._get_cron_trigger(expr)
         else:
             raise ValueError(f"Invalid scheduling mode: {user.scheduling_mode}")
 
-    async def post_content_job(self, user_id: int):
+    def _get_cron_trigger(self, expr: str) -> CronTrigger:
+        """Compiled triggers are cached by normalized expression and shared between users"""
+        trigger = self._cron_triggers.get(expr)
+        if trigger is None:
+            cron_kwargs = parse_cron_expr_for_apscheduler(expr)
+            trigger = CronTrigger(**cron_kwargs, timezone=self.scheduler.timezone)
+            self._cron_triggers[expr] = trigger
+        return trigger
+
+    @timed(POST_JOB_SECONDS)
+    async def post_content_job(
+        self, user_id: int, slot: datetime | None = None, slot_field: str = REGULAR_SLOT
+    ):
         """
         A job that runs on a schedule for a particular user.
-        """
 
-        logger.debug(f"post_content_job triggered for user_id={user_id}")
-        user = await self.get_user(user_id)
+        `slot` - the fire time being posted. It is claimed first, so that with several replicas
+        running the same schedules only one of them posts it. None - post unconditionally.
+        `slot_field` - where the claim is kept, see src.slots.
 
-        post = await self._pick_post_from_queue(user_id)
-        channel_id = user.target_channel_id
-        assert channel_id is not None, "Target channel ID is not set for user"
+        Three mongo round trips on the happy path: the user is read (or served from the cache)
+        while the slot is claimed, then the post is claimed, and all writes of the cycle are flushed
+        together after sending. The post is claimed only once the slot is won - a replica that
+        loses the slot must not hold the lease on the post the winner is about to pick.
+        Whether auto-posting is on is read along with the slot claim, past the cache: it may have
+        been turned off on another replica.
+        """
+
+        logger.debug(f"post_content_job triggered for user_id={user_id}, slot={slot}")
+        user, enabled, slot_claimed = await asyncio.gather(
+            self.get_user(user_id),
+            self._is_auto_posting_enabled(user_id),
+            self._claim_slot(user_id, slot, slot_field),
+        )
+        if not enabled:
+            logger.info(f"Auto-posting was turned off for user {user_id}, unscheduling")
+            self.invalidate_user(user_id)
+            self._cancel_user_posting_job(user_id)
+            return
+        if not slot_claimed:
+            logger.info(f"Slot {slot} of user {user_id} was posted by another replica, skipping")
+            return
+        post = await self._claim_post_from_queue(user_id)
+        channel_ids = user.channel_ids
+        assert channel_ids, "Target channel ID is not set for user"
 
         if not post:
             logger.info(f"No posts in queue for user {user_id}")
             # notify the user.
-            await send_safe(
+            self.outbox.notify(
                 user_id,
                 "Scheduled posting time is due, but there are no posts in queue to post.",
+                coalesce_key=f"queue_empty_{user_id}",
             )
             return
 
-        logger.debug(f"Sending post to channel {channel_id}: {post.data!r}")
-        await send_safe(channel_id, post.data)
-        logger.info(f"Posted content to channel {channel_id}: {post.data}")
+        # after a partial failure only the channels that did not get the post are retried,
+        # until they are given up on
+        channels = pending_channels(channel_ids, post.deliveries)
+        logger.debug(f"Sending post to channels {channels}: {post.preview!r}")
+        try:
+            results = await deliver(
+                channels,
+                lambda channel_id: self._send_post(channel_id, post),
+                max_parallel=self.config.max_parallel_channels,
+                previous=post.deliveries,
+                max_attempts=self.config.max_channel_attempts,
+            )
+        except asyncio.CancelledError:
+            # cancelled mid-delivery: let the next run (or another worker) pick it up again
+            await self._release_post(post)
+            raise
+        post.deliveries.update(results)
 
-        # Notify the user that the post was sent, and the amount of remaining posts in queue
-        all_posts = await self.queue.get_items(user_id=user_id)
-        logger.debug(f"User {user_id} has {len(all_posts)} posts in queue after posting")
-        remaining_posts = [item for item in all_posts if not item.posted]
-        # Calculate stats by readiness
-        readiness_stats = {
-            Readiness.FINISHED: 0,
-            Readiness.UNPOLISHED: 0,
-            Readiness.DRAFT: 0
-        }
-        for item in remaining_posts:
-            if item.readiness in readiness_stats:
-                readiness_stats[item.readiness] += 1
-        stats_message = f"Your post was sent to the channel. Remaining posts in queue: {len(remaining_posts)}\n"
-        stats_message += "Breakdown by readiness:\n"
-        stats_message += f"- Finished: {readiness_stats[Readiness.FINISHED]}\n"
-        stats_message += f"- Unpolished: {readiness_stats[Readiness.UNPOLISHED]}\n"
-        stats_message += f"- Draft: {readiness_stats[Readiness.DRAFT]}"
-        await send_safe(user_id, stats_message)
-
-        # Mark the post as posted
-        post.posted = True
-        post.posted_channel_id = channel_id
-        post.posted_at = datetime.now()
-        await self.queue.update_item(post)
+        work = self._unit_of_work(user_id)
+        now = datetime.now(timezone.utc)
+        for key, delivery in results.items():
+            if delivery.status == DeliveryStatus.SENT:
+                work.add_rollups(
+                    rollup_updates(
+                        user_id, now, {"posts": 1, "messages": len(delivery.message_ids)}, channel_id=int(key)
+                    )
+                )
+
+        failed = [key for key, delivery in results.items() if delivery.status == DeliveryStatus.FAILED]
+        if failed:
+            work.update_item(post._doc_id, post.claimed_by, _release_fields(results))
+            await work.flush()
+            logger.warning(f"Post {post._doc_id} failed for channels {failed}, will retry on the next run")
+            self.outbox.notify(
+                user_id,
+                f"Your post could not be sent to {len(failed)} of {len(channel_ids)} channels "
+                f"({', '.join(failed)}). It will be retried for those channels on the next run.",
+                coalesce_key=f"post_failed_{user_id}",
+            )
+            return
+        given_up = [
+            key for key, delivery in post.deliveries.items() if delivery.status == DeliveryStatus.GIVEN_UP
+        ]
+        if given_up:
+            logger.warning(
+                f"Post {post._doc_id} gave up on channels {given_up} after "
+                f"{self.config.max_channel_attempts} attempts"
+            )
+        logger.info(f"Posted content to channels {channels}: {post.preview}")
+
+        sent = [
+            int(key) for key, delivery in post.deliveries.items() if delivery.status == DeliveryStatus.SENT
+        ]
+        self._mark_as_posted(work, post, sent[0] if sent else channel_ids[0], deliveries=results)
+        if sent:
+            messages = sum(
+                len(delivery.message_ids)
+                for delivery in post.deliveries.values()
+                if delivery.status == DeliveryStatus.SENT
+            )
+            work.add_rollups(rollup_updates(user_id, now, {"posts": 1, "messages": messages}))
+        else:
+            # given up on every channel - not a post, but it left the backlog like queue_stats says
+            work.add_rollups(rollup_updates(user_id, now, {"removed": 1}))
+        if not await work.flush():
+            logger.warning(
+                f"Lease on post {post._doc_id} was lost before confirmation (user_id={user_id}) - "
+                f"consider increasing post_lease_seconds"
+            )
+            return
         logger.debug(f"Marked post as posted for user_id={user_id}")
+        if work.stats is None:
+            # no counters yet - build them from the queue (already includes this post)
+            stats = await self.recount_queue_stats(user_id)
+        else:
+            stats = QueueStats(**work.stats)
+
+        # Notify the user that the post was sent, and the amount of remaining posts in queue
+        sent_to = "the channel" if len(channel_ids) == 1 else f"{len(sent)} of {len(channel_ids)} channels"
+        stats_message = f"Your post was sent to {sent_to}." if sent else "Your post was not sent to any channel."
+        if given_up:
+            stats_message += (
+                f" Gave up on channels {', '.join(given_up)} after "
+                f"{self.config.max_channel_attempts} failed attempts."
+            )
+        stats_message += f" Remaining posts in queue: {stats.total_unposted}\n"
+        stats_message += stats.format_breakdown()
+        self.outbox.notify(user_id, stats_message, coalesce_key=f"queue_stats_{user_id}")
+
+    async def _is_auto_posting_enabled(self, user_id: int) -> bool:
+        doc = await self.users_collection.find_one(
+            {"user_id": user_id}, {"_id": 0, "auto_posting_enabled": 1}
+        )
+        return doc is not None and doc.get("auto_posting_enabled", False)
+
+    async def _claim_slot(self, user_id: int, slot: datetime | None, field: str) -> bool:
+        if slot is None:
+            return True
+        return await claim_slot(self.schedule_state_collection, user_id, slot, field)
+
+    def _unit_of_work(self, user_id: int) -> PostingUnitOfWork:
+        return PostingUnitOfWork(
+            self.queue_collection, self.stats_collection, self.rollups_collection, user_id
+        )
+
+    async def _send_post(self, channel_id: int, post: PosterBotQueueItem) -> list[int]:
+        """Send the post to one channel, returns the ids of the sent messages"""
+        from botspot.utils.deps_getters import get_bot
+
+        bot = get_bot()
+        if post.save_mode == SaveMode.FORWARD:
+            assert post.source_chat_id is not None, "Source chat is not set for a FORWARD post"
+            # telegram copies the content server-side, albums go as one call
+            copied = await self.outbox.submit(
+                channel_id,
+                lambda: bot.copy_messages(
+                    chat_id=channel_id,
+                    from_chat_id=post.source_chat_id,
+                    message_ids=post.source_message_ids,
+                ),
+                priority=Priority.CHANNEL_POST,
+            )
+            return [message.message_id for message in copied]
+
+        # items enqueued before render plans existed are rendered now
+        plan = post.render_plan or self.render(post.data)
+        if plan.send_as_file:
+            document = BufferedInputFile(plan.chunks[0].encode(), filename="post.txt")
+            sent = await self.outbox.submit(
+                channel_id,
+                lambda: bot.send_document(chat_id=channel_id, document=document),
+                priority=Priority.CHANNEL_POST,
+            )
+            return [sent.message_id]
+        message_ids = []
+        for chunk in plan.chunks:
+            sent = await self.outbox.submit(
+                channel_id,
+                lambda chunk=chunk: bot.send_message(
+                    chat_id=channel_id, text=chunk, parse_mode=plan.parse_mode
+                ),
+                priority=Priority.CHANNEL_POST,
+            )
+            message_ids.append(sent.message_id)
+        return message_ids
 
-    async def _pick_post_from_queue(self, user_id: int) -> PosterBotQueueItem | None:
+    def _mark_as_posted(
+        self,
+        work: PostingUnitOfWork,
+        post: PosterBotQueueItem,
+        channel_id: int,
+        deliveries: dict[str, ChannelDelivery] | None = None,
+    ):
         """
-        Pick a post from the queue for a user.
+        Confirm a claimed post as sent, along with the latest delivery results - on flush of `work`.
+        Only the current lease holder can confirm.
         """
-        logger.debug(f"_pick_post_from_queue called with user_id={user_id}")
-        all_posts = await self.queue.get_items(user_id=user_id)
-        logger.debug(f"Fetched {len(all_posts)} posts from queue for user_id={user_id}")
-        if not all_posts:
-            logger.info(f"No posts in queue for user {user_id}")
-            return None
+        post.posted = True
+        post.posted_channel_id = channel_id
+        post.posted_at = datetime.now(timezone.utc)
+        work.update_item(
+            post._doc_id,
+            post.claimed_by,
+            {
+                "posted": True,
+                "posted_channel_id": channel_id,
+                "posted_at": post.posted_at,
+                **_release_fields(deliveries),
+            },
+        )
+        work.update_stats(
+            inc={f"unposted.{post.readiness.value}": -1, "posted": 1},
+            set_fields={"last_posted_at": post.posted_at},
+        )
 
-        # Prioritize posts based on readiness: FINISHED > UNPOLISHED > DRAFT
-        non_posted = [item for item in all_posts if not item.posted]
-        logger.debug(f"User {user_id} has {len(non_posted)} non-posted items in queue")
-        if not non_posted:
-            logger.debug(f"No non-posted items in queue for user {user_id}")
-            return None
+    async def _release_post(self, post: PosterBotQueueItem):
+        """Drop the lease on a claimed post without posting it."""
+        await self.queue_collection.update_one(
+            {"_id": post._doc_id, "claimed_by": post.claimed_by}, {"$set": _release_fields()}
+        )
+        logger.debug(f"Released lease on post {post._doc_id}")
 
-        # Filter out DRAFT posts
-        eligible_posts = [item for item in non_posted if item.readiness != Readiness.DRAFT]
-        if not eligible_posts:
-            logger.debug(f"No eligible (non-DRAFT) posts in queue for user {user_id}")
+    @timed(PICK_POST_SECONDS)
+    async def _claim_post_from_queue(self, user_id: int) -> PosterBotQueueItem | None:
+        """
+        Atomically pick a post from the queue for a user and lease it to this worker.
+
+        Priority: FINISHED > UNPOLISHED, oldest first within the same readiness. DRAFT posts are never picked.
+        Posts leased by another worker are skipped until the lease expires.
+        """
+        logger.debug(f"_claim_post_from_queue called with user_id={user_id}")
+        now = datetime.now(timezone.utc)
+        doc = await self.queue_collection.find_one_and_update(
+            {
+                "user_id": user_id,
+                "posted": False,
+                "readiness_priority": {"$lt": READINESS_PRIORITY[Readiness.DRAFT]},
+                "$or": [
+                    {"claim_expires_at": None},
+                    {"claim_expires_at": {"$lte": now}},
+                ],
+            },
+            {
+                "$set": {
+                    "claimed_by": uuid4().hex,
+                    "claim_expires_at": now + timedelta(seconds=self.config.post_lease_seconds),
+                }
+            },
+            sort=[("readiness_priority", 1), ("_id", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            logger.debug(f"No eligible (non-posted, non-DRAFT, unclaimed) posts in queue for user {user_id}")
             return None
 
-        # Sort by readiness priority
-        readiness_priority = {Readiness.FINISHED: 0, Readiness.UNPOLISHED: 1, Readiness.DRAFT: 2}
-        chosen = min(eligible_posts, key=lambda x: readiness_priority.get(x.readiness, 3))
-        logger.debug(f"Chose post for user_id={user_id}: {chosen}")
+        chosen = PosterBotQueueItem.from_doc(doc)
+        logger.debug(f"Claimed post for user_id={user_id}: {chosen}")
         return chosen
 
     async def activate_user(self, user_id: int):
@@ -264,17 +1523,15 @@ class App:
         Activate a user.
         """
         logger.info(f"Activating user {user_id}")
-        # check if user has all the settings specified. if not - launch the setup flow
-        user = await self.get_user(user_id)
-        # if user.scheduling_mode is None:
-        await self._initialize_user(user_id)
-
-        await self.update_user_field(user_id, "auto_posting_enabled", True)
+        # todo: check if user has all the settings specified. if not - launch the setup flow
+        fields = self._default_user_settings()
+        fields["auto_posting_enabled"] = True
+        # single atomic write, returns the updated user - no re-load needed
+        user = await self.update_user_fields(user_id, fields)
         logger.debug(f"Set auto_posting_enabled=True for user_id={user_id}")
-        # re-load the user object to get the updated values
-        user = await self.get_user(user_id)
 
         self._schedule_user_posting_job(user)
+        await self._save_schedule_state([user_id])
 
     async def deactivate_user(self, user_id: int):
         """
@@ -283,46 +1540,138 @@ class App:
         logger.info(f"Deactivating user {user_id}")
         await self.update_user_field(user_id, "auto_posting_enabled", False)
         logger.debug(f"Set auto_posting_enabled=False for user_id={user_id}")
-        # todo: check if user has a job scheduled. if so - cancel it.
         self._cancel_user_posting_job(user_id)
+        await self.schedule_state_collection.delete_one({"user_id": user_id})
 
     def _cancel_user_posting_job(self, user_id: int):
         """
         Cancel the posting job for a user.
         """
         logger.debug(f"_cancel_user_posting_job called with user_id={user_id}")
-        self.scheduler.remove_job(f"post_content_job_{user_id}")
+        if not self.dispatcher.unschedule(user_id):
+            logger.debug(f"No posting job was scheduled for user_id={user_id}")
 
+    @timed(GET_USER_SECONDS)
     async def get_user(self, user_id: int) -> PosterBotUser:
-        from botspot.utils import get_user_manager
+        cached = self._user_cache.get(user_id)
+        if cached is not None and cached[1] > time.monotonic():
+            USER_CACHE_REQUESTS.inc("hit")
+            return cached[0]
+        USER_CACHE_REQUESTS.inc("miss")
 
-        logger.debug(f"Fetching user {user_id} from user manager")
-        user_manager = get_user_manager()
-        user = await user_manager.get_user(user_id)
+        logger.debug(f"Fetching user {user_id} from db")
+        doc = await self.users_collection.find_one({"user_id": user_id})
+        assert doc is not None, f"User {user_id} not found"
+        user = self._cache_user(PosterBotUser(**doc))
         logger.debug(f"Fetched user: {user}")
-        assert isinstance(user, PosterBotUser), f"User {user_id} is not a PosterBotUser"
         return user
 
-    async def update_user_field(self, user_id: int, field: str, value: Any):
-        from botspot.utils import get_user_manager
+    def _cache_user(self, user: PosterBotUser) -> PosterBotUser:
+        now = time.monotonic()
+        # re-inserted at the end: the dict is ordered from the least recently cached
+        self._user_cache.pop(user.user_id, None)
+        self._user_cache[user.user_id] = (user, now + self.config.user_cache_ttl_seconds)
+        if len(self._user_cache) > self.config.user_cache_max_size:
+            expired = [
+                user_id for user_id, (_, expires_at) in self._user_cache.items() if expires_at <= now
+            ]
+            for user_id in expired:
+                del self._user_cache[user_id]
+            while len(self._user_cache) > self.config.user_cache_max_size:
+                del self._user_cache[next(iter(self._user_cache))]
+        return user
 
-        logger.debug(f"Updating user {user_id} field {field} to {value!r}")
-        user_manager = get_user_manager()
-        await user_manager.update_user(user_id, field, value)
-        logger.debug(f"Updated user {user_id} field {field}")
+    def invalidate_user(self, user_id: int):
+        """Drop the cached user - e.g. after it was changed outside of this process."""
+        self._user_cache.pop(user_id, None)
 
-    async def _initialize_user(self, user_id: int):
-        logger.debug(f"_initialize_user called with user_id={user_id}")
-        data = self.config.model_dump(mode="json")
-        for key in [
-            "target_channel_id",
-            "scheduling_mode",
-            "scheduling_period_seconds",
-            "scheduling_cron_expr",
-        ]:
-            await self.update_user_field(user_id, key, data[key])
-        logger.debug(f"Initialized user {user_id} with default config fields")
+    async def update_user_field(self, user_id: int, field: str, value: Any) -> PosterBotUser:
+        return await self.update_user_fields(user_id, {field: value})
+
+    async def update_user_fields(self, user_id: int, fields: dict[str, Any]) -> PosterBotUser:
+        """Update several user fields in one atomic write. Returns the updated user."""
+        logger.debug(f"Updating user {user_id} fields {fields!r}")
+        try:
+            doc = await self.users_collection.find_one_and_update(
+                {"user_id": user_id},
+                {"$set": fields},
+                return_document=ReturnDocument.AFTER,
+            )
+        except Exception:
+            # the write may have been applied - the cached user can not be trusted anymore
+            self.invalidate_user(user_id)
+            raise
+        assert doc is not None, f"User {user_id} not found"
+        logger.debug(f"Updated user {user_id} fields {list(fields)}")
+        # write-through: the cache always holds what we just wrote
+        return self._cache_user(PosterBotUser(**doc))
+
+    def _default_user_settings(self) -> dict[str, Any]:
         # todo: replace with a proper interactive flow
+        data = self.config.model_dump(mode="json")
+        return {
+            key: data[key]
+            for key in [
+                "target_channel_id",
+                "target_channel_ids",
+                "scheduling_mode",
+                "scheduling_period_seconds",
+                "scheduling_cron_expr",
+            ]
+        }
+
+    async def collect_burst(self, message: Message) -> list[list[Message]] | None:
+        """
+        Gather messages a user sends in quick succession - e.g. a bulk forward or an album.
+
+        The burst ends once no new message came for enqueue_debounce_seconds.
+        Returns the burst to the handler of its first message, as posts (an album is one post),
+        and None to the handlers of the rest.
+        """
+        assert message.from_user is not None
+        user_id = message.from_user.id
+        loop = asyncio.get_running_loop()
+        burst = self._bursts.get(user_id)
+        if burst is not None:
+            burst.messages.append(message)
+            burst.last_received_at = loop.time()
+            return None
+
+        burst = self._bursts[user_id] = MessageBurst([message], loop.time())
+        window = self.config.enqueue_debounce_seconds
+        while len(burst.messages) < self.config.enqueue_batch_max_messages:
+            delay = burst.last_received_at + window - loop.time()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        del self._bursts[user_id]
+
+        posts: list[list[Message]] = []
+        for m in sorted(burst.messages, key=lambda m: m.message_id):
+            if posts and m.media_group_id is not None and posts[-1][0].media_group_id == m.media_group_id:
+                posts[-1].append(m)
+            else:
+                posts.append([m])
+        return posts
+
+    def render(self, text: str) -> RenderPlan:
+        """How a text post will be sent - computed at enqueue, replayed by the posting job"""
+        return render_post(text, self.send_safe_settings)
+
+    async def prepare_post_content(
+        self, message: Message, album: list[Message] | None = None
+    ) -> PosterBotQueueItem:
+        messages = album or [message]
+        text = next((m.html_text for m in messages if m.text or m.caption), "")
+        has_media = any(m.content_type != ContentType.TEXT for m in messages)
+        if self.config.save_mode == SaveMode.DATA and not has_media:
+            return PosterBotQueueItem(data=text, render_plan=self.render(text))
 
-    async def prepare_post_content(self, message: Message) -> str:
-        return message.html_text
\ No newline at end of file
+        # store only a reference - telegram keeps the content. Text is kept as a preview
+        return PosterBotQueueItem(
+            data=html_preview(text, PREVIEW_LENGTH),
+            save_mode=SaveMode.FORWARD,
+            source_chat_id=message.chat.id,
+            source_message_ids=[m.message_id for m in messages],
+            media_group_id=message.media_group_id,
+        )
\ No newline at end of file
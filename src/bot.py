@@ -2,6 +2,7 @@ from pathlib import Path
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
 from aiogram.enums import ParseMode
 from botspot.core.bot_manager import BotManager
 from calmlib.utils import LogFormat, setup_logger  # , heartbeat_for_sync
@@ -9,20 +10,37 @@ from dotenv import load_dotenv
 from loguru import logger
 
 from src.app import App, PosterBotUser
+from src.metrics import start_metrics_server
 from src.router import router as main_router
 from src.routers.settings import router as settings_router
 
+# Everything a start needs is imported here, so that bench/import_time.py measuring this module
+# sees the real cold start. Only the webhook server, used in one of the modes, is deferred.
+
 
 async def on_startup(dispatcher):
     app = dispatcher["app"]
-    await app.schedule_posts_on_startup()
+    if app.config.metrics_port is not None:
+        dispatcher["metrics_runner"] = await start_metrics_server(
+            app.config.metrics_host, app.config.metrics_port
+        )
+    await app.ensure_indexes()
+    app.outbox.start()
+    app.dispatcher.start()
+    app.start_scheduling_on_startup()
+    app.schedule_maintenance_jobs()
 
 
+async def on_shutdown(dispatcher):
+    app = dispatcher["app"]
+    await app.stop_scheduling()
+    await app.outbox.stop()
+    if "metrics_runner" in dispatcher.workflow_data:
+        await dispatcher["metrics_runner"].cleanup()
 
-# @heartbeat_for_sync(App.name)
-def main(debug=False) -> None:
-    setup_logger(logger, format=LogFormat.DEFAULT if debug else LogFormat.DETAILED, level="DEBUG" if debug else "INFO")
 
+def create_dispatcher(session: BaseSession | None = None) -> tuple[Dispatcher, Bot]:
+    """Build the dispatcher with all routers and components. session - e.g. for a custom Bot API server"""
     # Initialize bot and dispatcher
     dp = Dispatcher()
     dp.include_router(main_router)
@@ -35,6 +53,7 @@ def main(debug=False) -> None:
     bot = Bot(
         token=app.config.telegram_bot_token.get_secret_value(),
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+        session=session,
     )
 
     # Initialize BotManager with default components
@@ -43,15 +62,52 @@ def main(debug=False) -> None:
         error_handler={"enabled": True},
         ask_user={"enabled": True},
         bot_commands_menu={"enabled": True},
+        # not used by the bot - off regardless of .env, it would pull langchain into every cold start
+        llm_provider={"enabled": False},
+        # the same for the telethon client - no user sessions are needed to post as the bot
+        telethon_manager={"enabled": False},
          user_class=PosterBotUser,
     )
 
     # Setup dispatcher with our components
     bm.setup_dispatcher(dp)
     dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    return dp, bot
+
+
+def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    from aiohttp import web
+
+    from src.webhook import create_webhook_app
+
+    config = dp["app"].config
+    if config.webhook_secret is None:
+        raise ValueError("webhook_secret must be set in webhook mode")
+    webhook_app = create_webhook_app(
+        dp,
+        bot,
+        path=config.webhook_path,
+        secret_token=config.webhook_secret.get_secret_value(),
+        workers=config.webhook_workers,
+        max_pending=config.webhook_max_pending,
+        drain_timeout=config.webhook_drain_timeout_seconds,
+        webhook_url=config.webhook_url,
+    )
+    web.run_app(webhook_app, host=config.webhook_host, port=config.webhook_port)
+
+
+# @heartbeat_for_sync(App.name)
+def main(debug=False, webhook=False) -> None:
+    setup_logger(logger, format=LogFormat.DEFAULT if debug else LogFormat.DETAILED, level="DEBUG" if debug else "INFO")
+
+    dp, bot = create_dispatcher()
 
-    # Start polling
-    dp.run_polling(bot)
+    if webhook:
+        run_webhook(dp, bot)
+    else:
+        # Start polling
+        dp.run_polling(bot)
 
 
 if __name__ == "__main__":
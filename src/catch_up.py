@@ -0,0 +1,97 @@
+"""
+Catch-up of posting slots missed while the bot was down.
+
+On startup every user whose saved next fire time has passed missed at least one slot - the saved
+time only moves on once a job has run (see PostingDispatcher.advance_observer). How many of the
+missed slots are posted is decided by the misfire policy.
+
+A user's saved state is moved past the downtime only after its catch-up posts went out, so that
+a crash during the catch-up does not lose them. Catch-up posts are posted for the missed fire times
+they stand for, so that replicas catching up at the same time claim each slot once (see src.slots).
+"""
+
+import asyncio
+from datetime import datetime
+from enum import Enum
+from typing import Awaitable, Callable, Optional
+
+from apscheduler.triggers.base import BaseTrigger
+from loguru import logger
+
+
+class MisfirePolicy(Enum):
+    """What to do with posts that were due while the bot was down"""
+
+    SKIP = "skip"  # resume on the next regular fire time
+    ONCE = "once"  # post once, however many fire times were missed
+    ALL = "all"  # post once per missed fire time (up to misfire_max_posts)
+    RATE_LIMITED = "rate_limited"  # same as ALL, paced at misfire_catchup_rate posts per second
+
+
+def missed_fire_times(
+    trigger: BaseTrigger, first: datetime, now: datetime, limit: int
+) -> list[datetime]:
+    """Fire times from `first` up to `now`, at most `limit`"""
+    fire_times: list[datetime] = []
+    fire_time: Optional[datetime] = first
+    while fire_time is not None and fire_time <= now and len(fire_times) < limit:
+        fire_times.append(fire_time)
+        fire_time = trigger.get_next_fire_time(fire_time, now)
+    return fire_times
+
+
+def posts_to_catch_up(
+    missed: dict[int, list[datetime]], policy: MisfirePolicy
+) -> dict[int, list[datetime]]:
+    """user_id -> fire times to post for, from the missed fire times"""
+    if policy == MisfirePolicy.SKIP:
+        return {}
+    if policy == MisfirePolicy.ONCE:
+        # the latest one - a single post stands for all of them
+        return {user_id: fire_times[-1:] for user_id, fire_times in missed.items()}
+    return {user_id: list(fire_times) for user_id, fire_times in missed.items()}
+
+
+async def catch_up(
+    missed: dict[int, list[datetime]],
+    policy: MisfirePolicy,
+    post: Callable[[int, datetime], Awaitable[None]],
+    caught_up: Callable[[list[int]], Awaitable[None]],
+    max_concurrency: int,
+    rate: float,
+):
+    """
+    Post the missed slots according to the policy with `post(user_id, fire_time)`, one post per
+    user per round - a user's posts go out in queue order. `caught_up(user_ids)` is called once
+    those users are done, to save their schedule state - right away for users with nothing to post.
+    """
+    logger.info(f"{len(missed)} users missed posts during downtime, misfire policy: {policy.value}")
+    slots = posts_to_catch_up(missed, policy)
+    nothing_to_post = [user_id for user_id in missed if not slots.get(user_id)]
+    if nothing_to_post:
+        await caught_up(nothing_to_post)
+    if not any(slots.values()):
+        return
+
+    pace = 1 / rate if policy == MisfirePolicy.RATE_LIMITED else 0
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def post_one(user_id: int, fire_time: datetime):
+        async with semaphore:
+            try:
+                await post(user_id, fire_time)
+            except Exception:
+                logger.exception(f"Catch-up post for user {user_id} failed")
+
+    for round_ in range(max(len(fire_times) for fire_times in slots.values())):
+        jobs = []
+        for user_id, fire_times in slots.items():
+            if len(fire_times) > round_:
+                jobs.append(asyncio.create_task(post_one(user_id, fire_times[round_])))
+                if pace:
+                    await asyncio.sleep(pace)
+        await asyncio.gather(*jobs)
+        done = [user_id for user_id, fire_times in slots.items() if len(fire_times) == round_ + 1]
+        if done:
+            await caught_up(done)
+    logger.info("Catch-up of missed posts finished")
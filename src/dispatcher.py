@@ -0,0 +1,276 @@
+import asyncio
+import heapq
+import itertools
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, tzinfo
+from typing import Awaitable, Callable, Hashable, Iterable, Optional
+
+from apscheduler.triggers.base import BaseTrigger
+from loguru import logger
+
+# upper bound on a single sleep - protects against clock jumps
+MAX_SLEEP_SECONDS = 60
+
+
+def spread_offset(user_id: int, spread_seconds: float) -> float:
+    """Deterministic per-user delay within the spread window, seconds"""
+    if not spread_seconds:
+        return 0.0
+    return zlib.crc32(str(user_id).encode()) / 2**32 * spread_seconds
+
+
+@dataclass
+class ScheduleGroup:
+    """Users sharing one trigger - e.g. everyone on '0 10 * * 1'"""
+
+    trigger: BaseTrigger
+    entry_id: int
+    members: set[int] = field(default_factory=set)
+    next_fire_time: Optional[datetime] = None
+
+
+class PostingDispatcher:
+    """
+    Fires a per-user callback on each user's trigger, from a single asyncio task.
+
+    Users are grouped by schedule: users passing the same group key (e.g. a normalized cron
+    expression) share one trigger and one heap entry, so a popular schedule is a single wakeup
+    that fans out to all its members. Users without a group key get a group of their own.
+
+    Groups are kept in a min-heap keyed by next fire time. Removal is lazy: stale heap entries
+    are skipped when they surface, so schedule is O(log n) and unschedule is O(1).
+
+    The callback gets the user and the nominal fire time - the slot being posted, which lets
+    replicas running the same schedules agree on who posts it (see src.slots).
+
+    Admission control for synchronized schedules: members of a due group are spread over
+    `spread_seconds` with a deterministic per-user offset (a user always lands at the same
+    offset), and at most `max_concurrency` jobs run at once - the rest wait for a free slot.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[int, datetime], Awaitable[None]],
+        timezone: tzinfo,
+        max_concurrency: int = 100,
+        spread_seconds: float = 0,
+    ):
+        self._callback = callback
+        self._timezone = timezone
+        self._max_concurrency = max_concurrency
+        self._spread_seconds = spread_seconds
+
+        # (fire_time, entry_id, group_key)
+        self._heap: list[tuple[datetime, int, Hashable]] = []
+        # a heap entry is live only if its entry_id matches the group's
+        self._groups: dict[Hashable, ScheduleGroup] = {}
+        self._user_groups: dict[int, Hashable] = {}
+        self._entry_ids = itertools.count()
+
+        # called on job start with (user_id, seconds since the nominal fire time, the user's offset)
+        self.lag_observer: Callable[[int, float, float], None] | None = None
+        # called once a user is done with a fire time - its job has run (or failed), or was skipped -
+        # with ([user_id], next fire time or None if the trigger is done), to persist schedule state.
+        # Not called for jobs that never ran, e.g. cancelled on shutdown: those fire times count as missed
+        self.advance_observer: Callable[[list[int], Optional[datetime]], None] | None = None
+
+        self._running: set[int] = set()
+        self._batches: set[asyncio.Task] = set()
+        self._semaphore: asyncio.Semaphore | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def __len__(self):
+        return len(self._user_groups)
+
+    def __contains__(self, user_id: int):
+        return user_id in self._user_groups
+
+    @property
+    def group_count(self) -> int:
+        return len(self._groups)
+
+    def next_fire_time(self, user_id: int) -> Optional[datetime]:
+        group_key = self._user_groups.get(user_id)
+        if group_key is None:
+            return None
+        return self._groups[group_key].next_fire_time
+
+    def offset(self, user_id: int) -> float:
+        """Deterministic per-user delay within the spread window, seconds"""
+        return spread_offset(user_id, self._spread_seconds)
+
+    def now(self) -> datetime:
+        return datetime.now(self._timezone)
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="posting_dispatcher")
+        logger.info(
+            f"Posting dispatcher started with {len(self)} scheduled users in {self.group_count} groups"
+        )
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        for batch in list(self._batches):
+            batch.cancel()
+        await asyncio.gather(self._task, *self._batches, return_exceptions=True)
+        self._task = None
+        logger.info("Posting dispatcher stopped")
+
+    def schedule(self, user_id: int, trigger: BaseTrigger, group_key: Optional[Hashable] = None):
+        """
+        Add or replace the schedule of a user.
+
+        If a group with the same key exists, the user joins it and its trigger is reused.
+        """
+        entry = self._add(user_id, trigger, group_key, self.now())
+        if entry is None:
+            return
+        heapq.heappush(self._heap, entry)
+        logger.debug(f"Dispatcher: group {entry[2]} next fire at {entry[0]}")
+        if self._wakeup is not None and self._heap[0][1] == entry[1]:
+            # new earliest entry - re-arm the sleep
+            self._wakeup.set()
+
+    def schedule_many(self, schedules: Iterable[tuple[int, BaseTrigger, Optional[Hashable]]]):
+        """Bulk version of schedule - for startup, where most of the heap is built at once."""
+        now = self.now()
+        new_entries = []
+        for user_id, trigger, group_key in schedules:
+            entry = self._add(user_id, trigger, group_key, now)
+            if entry is not None:
+                new_entries.append(entry)
+        if len(new_entries) > len(self._heap) // 8:
+            self._heap.extend(new_entries)
+            heapq.heapify(self._heap)
+        else:
+            for entry in new_entries:
+                heapq.heappush(self._heap, entry)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def unschedule(self, user_id: int) -> bool:
+        """Remove the schedule of a user. Returns False if the user was not scheduled."""
+        group_key = self._user_groups.pop(user_id, None)
+        if group_key is None:
+            return False
+        group = self._groups[group_key]
+        group.members.discard(user_id)
+        if not group.members:
+            # its heap entry goes stale and is dropped when it surfaces
+            del self._groups[group_key]
+        return True
+
+    def _add(self, user_id: int, trigger: BaseTrigger, group_key: Optional[Hashable], now: datetime):
+        """Put the user in a group. Returns a heap entry to push if a new group was created."""
+        own_group = group_key is None
+        if own_group:
+            group_key = ("user", user_id)
+        if own_group or self._user_groups.get(user_id) != group_key:
+            # leave the previous group. A personal group is always re-created with the new trigger
+            self.unschedule(user_id)
+        self._user_groups[user_id] = group_key
+
+        group = self._groups.get(group_key)
+        if group is not None:
+            group.members.add(user_id)
+            return None
+
+        group = self._groups[group_key] = ScheduleGroup(trigger, next(self._entry_ids), {user_id})
+        fire_time = trigger.get_next_fire_time(None, now)
+        if fire_time is None:
+            logger.warning(f"Trigger {trigger} for group {group_key} will never fire")
+            return None
+        group.next_fire_time = fire_time
+        return fire_time, group.entry_id, group_key
+
+    def _next_fire_time(self, trigger: BaseTrigger, previous: datetime, now: datetime):
+        # coalesce fire times missed while the loop was busy - same as APScheduler's default
+        fire_time = trigger.get_next_fire_time(previous, now)
+        while fire_time is not None and fire_time <= now:
+            fire_time = trigger.get_next_fire_time(fire_time, now)
+        return fire_time
+
+    def _pop_due(self, now: datetime) -> list[tuple[list[int], datetime, Optional[datetime]]]:
+        """Due groups as (members, fire time, next fire time), advanced past `now`"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_time, entry_id, group_key = heapq.heappop(self._heap)
+            group = self._groups.get(group_key)
+            if group is None or group.entry_id != entry_id:
+                continue  # emptied or re-created since
+            next_fire_time = self._next_fire_time(group.trigger, fire_time, now)
+            group.next_fire_time = next_fire_time
+            due.append((list(group.members), fire_time, next_fire_time))
+            if next_fire_time is None:
+                for user_id in group.members:
+                    del self._user_groups[user_id]
+                del self._groups[group_key]
+                continue
+            heapq.heappush(self._heap, (next_fire_time, entry_id, group_key))
+        return due
+
+    async def _run(self):
+        assert self._wakeup is not None
+        while True:
+            for user_ids, fire_time, next_fire_time in self._pop_due(self.now()):
+                batch = asyncio.create_task(self._fire_group(user_ids, fire_time, next_fire_time))
+                self._batches.add(batch)
+                batch.add_done_callback(self._batches.discard)
+
+            self._wakeup.clear()
+            timeout = MAX_SLEEP_SECONDS
+            if self._heap:
+                timeout = min(timeout, max((self._heap[0][0] - self.now()).total_seconds(), 0))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _advanced(self, user_id: int, next_fire_time: Optional[datetime]):
+        if self.advance_observer is not None:
+            self.advance_observer([user_id], next_fire_time)
+
+    async def _fire_group(self, user_ids: list[int], fire_time: datetime, next_fire_time: Optional[datetime]):
+        logger.debug(f"Dispatcher: firing {len(user_ids)} users")
+        assert self._semaphore is not None
+        for user_id in sorted(user_ids, key=self.offset):
+            delay = (fire_time + timedelta(seconds=self.offset(user_id)) - self.now()).total_seconds()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if user_id in self._running:
+                logger.warning(f"Previous posting job for user {user_id} is still running, skipping")
+                self._advanced(user_id, next_fire_time)
+                continue
+            # admission: wait for a free slot instead of piling up coroutines
+            await self._semaphore.acquire()
+            self._running.add(user_id)
+            job = asyncio.create_task(self._fire(user_id, fire_time, next_fire_time))
+            self._batches.add(job)
+            job.add_done_callback(self._batches.discard)
+
+    async def _fire(self, user_id: int, fire_time: datetime, next_fire_time: Optional[datetime]):
+        """
+        Run the job of a single user. The caller has acquired a concurrency slot.
+        The fire time is reported as done only after the job - a crash before that leaves it missed.
+        """
+        assert self._semaphore is not None
+        try:
+            if self.lag_observer is not None:
+                delay = (self.now() - fire_time).total_seconds()
+                self.lag_observer(user_id, delay, self.offset(user_id))
+            try:
+                await self._callback(user_id, fire_time)
+            except Exception:
+                logger.exception(f"Posting job for user {user_id} failed")
+            self._advanced(user_id, next_fire_time)
+        finally:
+            self._running.discard(user_id)
+            self._semaphore.release()
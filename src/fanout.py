@@ -0,0 +1,89 @@
+"""
+Fan-out of one post to several channels.
+
+Channels are sent to concurrently, at most `max_parallel` at a time. Every channel gets its own
+delivery record - stored on the queue item - so that a post which failed for some channels is
+retried only for those: channels already marked SENT are skipped on the next attempt.
+
+A channel that failed `max_attempts` times in a row is marked GIVEN_UP and skipped as well - a
+channel the bot was removed from must not hold the post, and the queue behind it, forever.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Awaitable, Callable, Iterable, Optional
+
+from loguru import logger
+from pydantic import BaseModel
+
+
+class DeliveryStatus(Enum):
+    SENT = "sent"
+    FAILED = "failed"  # retried on the next run
+    GIVEN_UP = "given_up"  # failed max_attempts times, not retried
+
+
+class ChannelDelivery(BaseModel):
+    status: DeliveryStatus
+    # ids of the messages in the channel - several for albums and split texts
+    message_ids: list[int] = []
+    error: Optional[str] = None
+    attempts: int = 1
+    updated_at: datetime
+
+    def to_doc(self) -> dict:
+        return {**self.model_dump(), "status": self.status.value}
+
+
+def pending_channels(
+    channel_ids: Iterable[int], deliveries: dict[str, ChannelDelivery]
+) -> list[int]:
+    """Channels the post still has to be delivered to"""
+    return [
+        channel_id
+        for channel_id in channel_ids
+        if (delivery := deliveries.get(str(channel_id))) is None
+        or delivery.status == DeliveryStatus.FAILED
+    ]
+
+
+async def deliver(
+    channel_ids: Iterable[int],
+    send: Callable[[int], Awaitable[list[int]]],
+    max_parallel: int,
+    previous: Optional[dict[str, ChannelDelivery]] = None,
+    max_attempts: int = 3,
+) -> dict[str, ChannelDelivery]:
+    """
+    Send to every channel with `send(channel_id) -> message ids`. Errors are recorded, not raised:
+    FAILED, or GIVEN_UP once a channel has failed `max_attempts` times.
+    Keys are channel ids as strings - they end up as mongo field names.
+    """
+    previous = previous or {}
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    async def deliver_one(channel_id: int) -> ChannelDelivery:
+        before = previous.get(str(channel_id))
+        attempts = before.attempts + 1 if before is not None else 1
+        async with semaphore:
+            try:
+                message_ids = await send(channel_id)
+            except Exception as e:
+                logger.warning(f"Failed to post to channel {channel_id}: {e!r}")
+                return ChannelDelivery(
+                    status=DeliveryStatus.FAILED if attempts < max_attempts else DeliveryStatus.GIVEN_UP,
+                    error=f"{type(e).__name__}: {e}",
+                    attempts=attempts,
+                    updated_at=datetime.now(timezone.utc),
+                )
+        return ChannelDelivery(
+            status=DeliveryStatus.SENT,
+            message_ids=message_ids,
+            attempts=attempts,
+            updated_at=datetime.now(timezone.utc),
+        )
+
+    channel_ids = list(channel_ids)
+    results = await asyncio.gather(*(deliver_one(channel_id) for channel_id in channel_ids))
+    return {str(channel_id): result for channel_id, result in zip(channel_ids, results)}
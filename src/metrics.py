@@ -0,0 +1,173 @@
+"""
+Lightweight in-process metrics with a Prometheus text endpoint.
+
+No external dependencies and cheap enough to leave on at full load:
+a counter increment is a dict update, a histogram observation is a bisect over ~15 buckets.
+"""
+
+import functools
+import time
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Awaitable, Callable, ParamSpec, TypeVar
+
+from loguru import logger
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        REGISTRY.append(self)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        # labels -> (per-bucket counts incl. +Inf, sum)
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels: str):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = entry
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {total[0]}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+REGISTRY: list[Metric] = []
+
+POST_JOB_SECONDS = Histogram("poster_post_job_seconds", "Duration of post_content_job")
+PICK_POST_SECONDS = Histogram("poster_pick_post_seconds", "Duration of claiming the next post")
+ADD_TO_QUEUE_SECONDS = Histogram("poster_add_to_queue_seconds", "Duration of add_to_queue")
+GET_USER_SECONDS = Histogram("poster_get_user_seconds", "Duration of get_user, cache hits included")
+USER_CACHE_REQUESTS = Counter("poster_user_cache_requests_total", "User cache lookups", ("result",))
+SEND_SECONDS = Histogram("poster_send_seconds", "Duration of a Telegram send call", ("priority",))
+OUTBOX_WAIT_SECONDS = Histogram(
+    "poster_outbox_wait_seconds", "Time a message waited in the outbox", ("priority",), LAG_BUCKETS
+)
+FLOOD_WAITS = Counter("poster_flood_waits_total", "Telegram 429 responses", ("priority",))
+SEND_FAILURES = Counter("poster_send_failures_total", "Messages given up on", ("priority",))
+SCHEDULER_LAG_SECONDS = Histogram(
+    "poster_scheduler_lag_seconds",
+    "Delay between a job's slot (fire time plus spread offset) and its start",
+    buckets=LAG_BUCKETS,
+)
+POST_DELAY_SECONDS = Histogram(
+    "poster_post_delay_seconds", "Delay between nominal fire time and job start", buckets=LAG_BUCKETS
+)
+QUEUE_DEPTH = Gauge("poster_queue_depth", "Unposted items across all users", ("readiness",))
+STARTUP_SCHEDULING_SECONDS = Gauge(
+    "poster_startup_scheduling_seconds", "Time to register all schedules on startup"
+)
+
+
+def timed(histogram: Histogram):
+    """Record the duration of an async function into the histogram"""
+
+    def decorator(func: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]:
+        @functools.wraps(func)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def _metrics_handler(request: "web.Request") -> "web.Response":
+    from aiohttp import web
+
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str, port: int) -> "web.AppRunner":
+    # the server is optional (metrics_port) - aiohttp.web is only imported when it is on
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return runner
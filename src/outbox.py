@@ -0,0 +1,311 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Optional
+
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from loguru import logger
+
+from src.metrics import FLOOD_WAITS, OUTBOX_WAIT_SECONDS, SEND_FAILURES, SEND_SECONDS
+
+# Telegram Bot API limits: https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+GLOBAL_RATE = 30  # messages per second, across all chats
+PRIVATE_CHAT_RATE = 1  # messages per second, per private chat
+GROUP_CHAT_RATE = 20 / 60  # messages per second, per group / channel
+
+# how many recent wait times to keep for percentiles
+WAIT_SAMPLES = 1000
+
+
+class Priority(IntEnum):
+    """Lower value is sent first"""
+
+    CHANNEL_POST = 0
+    NOTIFICATION = 1
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available"""
+        self._refill(now)
+        wait = max(self.blocked_until - now, 0)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, until: float):
+        """Stop handing out tokens until the given time - e.g. after a flood wait"""
+        self.blocked_until = max(self.blocked_until, until)
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+
+@dataclass
+class OutboxMessage:
+    chat_id: int
+    text: str
+    priority: Priority
+    kwargs: dict = field(default_factory=dict)
+    # custom bot api call instead of send_safe(chat_id, text, **kwargs) - e.g. copy_messages
+    method: Optional[Callable[[], Awaitable[Any]]] = None
+    coalesce_key: Optional[str] = None
+    future: Optional[asyncio.Future] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+
+    def is_abandoned(self) -> bool:
+        """
+        The sender stopped waiting - e.g. its posting job was cancelled on shutdown and released
+        the post, which will be sent again on the next start. Such messages are dropped unsent.
+        """
+        return self.future is not None and self.future.done()
+
+
+class Outbox:
+    """
+    Async outbound queue in front of send_safe.
+
+    - token buckets for the global and per-chat Telegram limits
+    - priority classes: channel posts go before user notifications
+    - retries: waits out 429 retry_after, exponential backoff on network / server errors
+    - notifications with the same coalesce key replace each other while still queued
+    """
+
+    def __init__(
+        self,
+        send: Callable[..., Awaitable[Any]],
+        global_rate: float = GLOBAL_RATE,
+        max_in_flight: int = 10,
+        max_retries: int = 5,
+        backoff_seconds: float = 1.0,
+    ):
+        self._send = send
+        self._max_in_flight = max_in_flight
+        self._max_retries = max_retries
+        self._backoff_seconds = backoff_seconds
+
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets: dict[int, TokenBucket] = {}
+
+        # (priority, seq, message) - ready to go as soon as tokens allow
+        self._ready: list[tuple[int, int, OutboxMessage]] = []
+        # (not_before, seq, message) - waiting for their chat bucket / retry delay
+        self._delayed: list[tuple[float, int, OutboxMessage]] = []
+        self._seq = itertools.count()
+        self._pending_by_key: dict[str, OutboxMessage] = {}
+
+        self._wait_times: dict[Priority, deque] = {p: deque(maxlen=WAIT_SAMPLES) for p in Priority}
+        self.counters = {"sent": 0, "failed": 0, "retried": 0, "flood_waits": 0, "coalesced": 0}
+
+        self._in_flight: set[asyncio.Task] = set()
+        self._semaphore: asyncio.Semaphore | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._semaphore = asyncio.Semaphore(self._max_in_flight)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="outbox")
+        logger.info("Outbox started")
+
+    async def stop(self, timeout: float = 10):
+        """Stop the outbox, giving queued and in-flight messages some time to go out"""
+        if self._task is None:
+            return
+        deadline = time.monotonic() + timeout
+        while (self._ready or self._delayed or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        self._task.cancel()
+        await asyncio.gather(self._task, *self._in_flight, return_exceptions=True)
+        self._task = None
+        logger.info(f"Outbox stopped, {len(self)} messages dropped")
+
+    def __len__(self):
+        return len(self._ready) + len(self._delayed)
+
+    async def send(self, chat_id: int, text: str, priority: Priority = Priority.CHANNEL_POST, **kwargs):
+        """Queue a message and wait until it is sent. Raises if it could not be delivered."""
+        future = asyncio.get_running_loop().create_future()
+        self._push_ready(OutboxMessage(chat_id, text, priority, kwargs, future=future))
+        return await future
+
+    async def submit(
+        self,
+        chat_id: int,
+        method: Callable[[], Awaitable[Any]],
+        priority: Priority = Priority.CHANNEL_POST,
+    ):
+        """Like send, but for any bot api call targeting the chat. Returns the call result."""
+        future = asyncio.get_running_loop().create_future()
+        self._push_ready(OutboxMessage(chat_id, "", priority, method=method, future=future))
+        return await future
+
+    def notify(self, chat_id: int, text: str, coalesce_key: Optional[str] = None, **kwargs):
+        """Queue a low-priority message without waiting for it."""
+        if coalesce_key is not None:
+            pending = self._pending_by_key.get(coalesce_key)
+            if pending is not None:
+                # still queued - the newer notification supersedes it
+                pending.text = text
+                pending.kwargs = kwargs
+                self.counters["coalesced"] += 1
+                return
+        message = OutboxMessage(chat_id, text, Priority.NOTIFICATION, kwargs, coalesce_key=coalesce_key)
+        if coalesce_key is not None:
+            self._pending_by_key[coalesce_key] = message
+        self._push_ready(message)
+
+    def wait_time_percentiles(self, priority: Priority) -> dict[str, float]:
+        samples = sorted(self._wait_times[priority])
+        if not samples:
+            return {"p50": 0.0, "p99": 0.0}
+        return {
+            "p50": samples[int(0.5 * (len(samples) - 1))],
+            "p99": samples[int(0.99 * (len(samples) - 1))],
+        }
+
+    def _push_ready(self, message: OutboxMessage):
+        heapq.heappush(self._ready, (message.priority, next(self._seq), message))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _push_delayed(self, message: OutboxMessage, not_before: float):
+        heapq.heappush(self._delayed, (not_before, next(self._seq), message))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # negative ids are groups and channels
+            rate = GROUP_CHAT_RATE if chat_id < 0 else PRIVATE_CHAT_RATE
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, 1)
+        return bucket
+
+    def _prune_chat_buckets(self, now: float):
+        for chat_id in [c for c, b in self._chat_buckets.items() if b.is_idle(now)]:
+            del self._chat_buckets[chat_id]
+
+    async def _run(self):
+        assert self._wakeup is not None and self._semaphore is not None
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, _, message = heapq.heappop(self._delayed)
+                self._push_ready(message)
+
+            timeout: Optional[float] = None
+            if self._ready:
+                global_delay = self._global_bucket.delay(now)
+                if global_delay > 0:
+                    timeout = global_delay
+                else:
+                    _, _, message = heapq.heappop(self._ready)
+                    if message.is_abandoned():
+                        continue
+                    chat_delay = self._chat_bucket(message.chat_id).delay(now)
+                    if chat_delay > 0:
+                        # don't block other chats behind this one
+                        self._push_delayed(message, now + chat_delay)
+                        continue
+                    await self._semaphore.acquire()
+                    if message.is_abandoned():
+                        self._semaphore.release()
+                        continue
+                    now = time.monotonic()
+                    self._global_bucket.consume(now)
+                    self._chat_bucket(message.chat_id).consume(now)
+                    task = asyncio.create_task(self._deliver(message))
+                    self._in_flight.add(task)
+                    task.add_done_callback(self._in_flight.discard)
+                    continue
+            if self._delayed:
+                delayed_timeout = max(self._delayed[0][0] - now, 0)
+                timeout = delayed_timeout if timeout is None else min(timeout, delayed_timeout)
+            if len(self._chat_buckets) > 10_000:
+                self._prune_chat_buckets(now)
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _deliver(self, message: OutboxMessage):
+        assert self._semaphore is not None
+        priority = message.priority.name.lower()
+        try:
+            if message.attempts == 0:
+                wait_time = time.monotonic() - message.enqueued_at
+                self._wait_times[message.priority].append(wait_time)
+                OUTBOX_WAIT_SECONDS.observe(wait_time, priority)
+            if message.coalesce_key is not None:
+                self._pending_by_key.pop(message.coalesce_key, None)
+            message.attempts += 1
+            started = time.perf_counter()
+            try:
+                if message.method is not None:
+                    result = await message.method()
+                else:
+                    result = await self._send(message.chat_id, message.text, **message.kwargs)
+            finally:
+                SEND_SECONDS.observe(time.perf_counter() - started, priority)
+        except TelegramRetryAfter as e:
+            self.counters["flood_waits"] += 1
+            FLOOD_WAITS.inc(priority)
+            logger.warning(f"Flood wait for chat {message.chat_id}: retry after {e.retry_after}s")
+            until = time.monotonic() + e.retry_after
+            self._chat_bucket(message.chat_id).block(until)
+            self._retry_or_fail(message, e, until)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            delay = self._backoff_seconds * 2 ** (message.attempts - 1)
+            logger.warning(f"Failed to send to chat {message.chat_id} ({e}), retrying in {delay}s")
+            self._retry_or_fail(message, e, time.monotonic() + delay)
+        except Exception as e:
+            self._fail(message, e)
+        else:
+            self.counters["sent"] += 1
+            if message.future is not None and not message.future.done():
+                message.future.set_result(result)
+        finally:
+            self._semaphore.release()
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    def _retry_or_fail(self, message: OutboxMessage, error: Exception, not_before: float):
+        if message.attempts > self._max_retries:
+            self._fail(message, error)
+            return
+        self.counters["retried"] += 1
+        self._push_delayed(message, not_before)
+
+    def _fail(self, message: OutboxMessage, error: Exception):
+        self.counters["failed"] += 1
+        SEND_FAILURES.inc(message.priority.name.lower())
+        if message.future is not None and not message.future.done():
+            message.future.set_exception(error)
+        else:
+            logger.error(f"Failed to send notification to chat {message.chat_id}: {error}")
@@ -0,0 +1,203 @@
+"""
+Render plans: how a text post is sent, decided once at enqueue time.
+
+Validates the markup, splits long texts into messages or falls back to a file - following the
+BOTSPOT_SEND_SAFE_* settings, so the result matches what send_safe would do - and stores the
+outcome on the queue item. The posting job only replays the plan.
+"""
+
+from html import escape
+from html.parser import HTMLParser
+from typing import Optional
+
+from pydantic import BaseModel, field_validator
+from pydantic_settings import BaseSettings
+
+# in UTF-16 code units, after entity parsing
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# https://core.telegram.org/bots/api#html-style
+TELEGRAM_HTML_TAGS = {
+    "b", "strong", "i", "em", "u", "ins", "s", "strike", "del", "span", "tg-spoiler",
+    "a", "code", "pre", "blockquote", "tg-emoji",
+}  # fmt: skip
+
+
+class SendSafeSettings(BaseSettings):
+    """The BOTSPOT_SEND_SAFE_* settings that decide how a text is sent"""
+
+    parse_mode: Optional[str] = "HTML"
+    send_long_messages_as_files: bool = True
+    preview_cutoff: int = 200
+
+    class Config:
+        env_prefix = "BOTSPOT_SEND_SAFE_"
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        extra = "ignore"
+
+    @field_validator("parse_mode")
+    @classmethod
+    def empty_parse_mode_is_none(cls, value: Optional[str]) -> Optional[str]:
+        if value is None or value.strip().lower() in ("", "none", "null"):
+            return None
+        return value
+
+
+class RenderPlan(BaseModel):
+    # message texts, or the file content if send_as_file
+    chunks: list[str]
+    parse_mode: Optional[str] = None
+    send_as_file: bool = False
+    # what was changed to make the post sendable - shown to the user at enqueue
+    warnings: list[str] = []
+
+    def describe(self) -> str:
+        notes = list(self.warnings)
+        if self.send_as_file:
+            notes.append("too long for a message - will be sent as a file")
+        elif len(self.chunks) > 1:
+            notes.append(f"too long for a message - will be sent as {len(self.chunks)} messages")
+        return "\n".join(notes)
+
+
+def utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+class _HTMLScanner(HTMLParser):
+    """Checks telegram HTML and tracks visible length and nesting, fed line by line"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.open_tags: list[str] = []
+        self.visible = 0
+        self.plain: list[str] = []
+        self.errors: list[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        del attrs  # telegram tags take no attributes we check
+        if tag not in TELEGRAM_HTML_TAGS:
+            self.errors.append(f"unsupported tag <{tag}>")
+        self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        del attrs
+        self.errors.append(f"unsupported tag <{tag}/>")
+
+    def handle_endtag(self, tag):
+        if not self.open_tags or self.open_tags[-1] != tag:
+            self.errors.append(f"unexpected </{tag}>")
+            return
+        self.open_tags.pop()
+
+    def handle_data(self, data):
+        self.visible += utf16_len(data)
+        self.plain.append(data)
+
+
+Boundary = tuple[int, int, int, bool]
+
+
+def _boundaries(text: str, html: bool) -> tuple[list[Boundary], _HTMLScanner | None]:
+    """
+    At the end of every line: (raw offset, visible length before the line break,
+    visible length after it, may split here). Line breaks at a split are dropped.
+    """
+    scanner = _HTMLScanner() if html else None
+    result = []
+    offset = 0
+    visible = 0
+    for line in text.splitlines(keepends=True):
+        offset += len(line)
+        line_break = utf16_len(line) - utf16_len(line.rstrip("\r\n"))
+        if scanner is not None:
+            scanner.feed(line)
+            visible = scanner.visible
+            splittable = not scanner.open_tags
+        else:
+            visible += utf16_len(line)
+            splittable = True
+        result.append((offset, visible - line_break, visible, splittable))
+    if scanner is not None:
+        scanner.close()
+        if scanner.open_tags:
+            scanner.errors.append(f"unclosed <{scanner.open_tags[-1]}>")
+    return result, scanner
+
+
+def _split(text: str, boundaries: list[Boundary], limit: int) -> list[str] | None:
+    """Greedy split at the allowed boundaries. None if some part can not fit the limit"""
+    chunks = []
+    start, start_visible = 0, 0
+    i = 0
+    while i < len(boundaries):
+        end = None
+        while i < len(boundaries) and boundaries[i][1] - start_visible <= limit:
+            if boundaries[i][3]:
+                end = i
+            i += 1
+        if end is None:
+            return None
+        offset, _, visible, _ = boundaries[end]
+        chunk = text[start:offset].strip()
+        if chunk:
+            chunks.append(chunk)
+        start, start_visible = offset, visible
+        i = end + 1
+    return chunks
+
+
+def _split_plain(text: str, limit: int) -> list[str]:
+    """Split at line ends, lines over the limit are cut"""
+    lines = []
+    for line in text.splitlines(keepends=True):
+        while utf16_len(line) > limit:
+            cut = limit
+            while utf16_len(line[:cut]) > limit:
+                cut -= 1
+            lines.append(line[:cut] + "\n")
+            line = line[cut:]
+        lines.append(line)
+    text = "".join(lines)
+    boundaries, _ = _boundaries(text, html=False)
+    chunks = _split(text, boundaries, limit)
+    assert chunks is not None, "every line fits the limit"
+    return chunks
+
+
+def html_preview(text: str, limit: int) -> str:
+    """Start of an HTML text for a preview - cut as escaped plain text, so no tag is cut in half"""
+    if len(text) <= limit:
+        return text
+    scanner = _HTMLScanner()
+    scanner.feed(text)
+    scanner.close()
+    return escape("".join(scanner.plain)[:limit])
+
+
+def render_post(
+    text: str, settings: SendSafeSettings, limit: int = TELEGRAM_MESSAGE_LIMIT
+) -> RenderPlan:
+    parse_mode = settings.parse_mode
+    html = parse_mode is not None and parse_mode.upper() == "HTML"
+    boundaries, scanner = _boundaries(text, html)
+    warnings = []
+    if scanner is not None and scanner.errors:
+        warnings.append(f"Invalid HTML ({scanner.errors[0]}) - will be sent as plain text")
+        parse_mode = None
+        html = False
+        boundaries, _ = _boundaries(text, html=False)
+    plain = "".join(scanner.plain) if html and scanner is not None else text
+
+    visible = boundaries[-1][1] if boundaries else 0
+    if visible <= limit:
+        return RenderPlan(chunks=[text], parse_mode=parse_mode, warnings=warnings)
+    if settings.send_long_messages_as_files:
+        return RenderPlan(chunks=[plain], send_as_file=True, warnings=warnings)
+    chunks = _split(text, boundaries, limit)
+    if chunks is None:
+        # a formatted block longer than a message
+        warnings.append("Formatting does not survive splitting - will be sent as plain text")
+        return RenderPlan(chunks=_split_plain(plain, limit), warnings=warnings)
+    return RenderPlan(chunks=chunks, parse_mode=parse_mode, warnings=warnings)
@@ -0,0 +1,169 @@
+"""
+Pre-aggregated posting history: hour and day buckets of counters, per user and per channel.
+
+Counters are incremented (upserts, one bulk write) as posts are delivered and items enqueued,
+so reading the history is a bounded number of bucket documents - 24 hourly per user and
+30 daily per user and per channel - however long the history is.
+
+Bucket documents:
+    {user_id, channel_id (None - user totals), granularity, bucket (UTC start), posts, messages, added, removed}
+
+posts and messages count sent deliveries only. An item given up on every channel counts as removed.
+"""
+
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Iterable, Optional
+
+from pydantic import BaseModel
+from pymongo import UpdateOne
+
+# what /stats looks back at
+HOURLY_WINDOW = timedelta(hours=24)
+DAILY_WINDOW_DAYS = 30
+CHANNEL_WINDOW_DAYS = 7
+
+
+class Granularity(Enum):
+    HOUR = "hour"
+    DAY = "day"
+
+
+def bucket_start(at: datetime, granularity: Granularity) -> datetime:
+    """Start of the UTC bucket the moment falls into. Naive datetimes are taken as UTC"""
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    at = at.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if granularity == Granularity.DAY:
+        at = at.replace(hour=0)
+    return at
+
+
+def rollup_updates(
+    user_id: int, at: datetime, inc: dict[str, int], channel_id: Optional[int] = None
+) -> list[UpdateOne]:
+    """Upserts adding `inc` to the hour and day buckets of `at`"""
+    return [
+        UpdateOne(
+            {
+                "user_id": user_id,
+                "channel_id": channel_id,
+                "granularity": granularity.value,
+                "bucket": bucket_start(at, granularity),
+            },
+            {"$inc": inc},
+            upsert=True,
+        )
+        for granularity in Granularity
+    ]
+
+
+def history_query(user_id: int, now: datetime) -> dict:
+    """All buckets PostingHistory needs - served by the (user_id, granularity, bucket) index"""
+    today = bucket_start(now, Granularity.DAY)
+    return {
+        "user_id": user_id,
+        "$or": [
+            {
+                "granularity": Granularity.HOUR.value,
+                "channel_id": None,
+                "bucket": {"$gt": bucket_start(now - HOURLY_WINDOW, Granularity.HOUR)},
+            },
+            {
+                "granularity": Granularity.DAY.value,
+                "bucket": {"$gt": today - timedelta(days=DAILY_WINDOW_DAYS)},
+            },
+        ],
+    }
+
+
+class Bucket(BaseModel):
+    channel_id: Optional[int] = None
+    granularity: Granularity
+    bucket: datetime
+    posts: int = 0
+    messages: int = 0
+    added: int = 0
+    removed: int = 0
+
+
+class PostingHistory(BaseModel):
+    """User totals and per-channel posts over the recent windows, from bucket documents"""
+
+    now: datetime
+    hourly: list[Bucket] = []
+    daily: list[Bucket] = []
+    # channel_id -> daily buckets
+    channels: dict[int, list[Bucket]] = {}
+
+    @classmethod
+    def from_docs(cls, docs: Iterable[dict], now: datetime) -> "PostingHistory":
+        history = cls(now=now)
+        for doc in docs:
+            bucket = Bucket(**doc)
+            if bucket.channel_id is not None:
+                if bucket.granularity == Granularity.DAY:
+                    history.channels.setdefault(bucket.channel_id, []).append(bucket)
+            elif bucket.granularity == Granularity.HOUR:
+                history.hourly.append(bucket)
+            else:
+                history.daily.append(bucket)
+        return history
+
+    def _since(self, buckets: list[Bucket], days: int) -> list[Bucket]:
+        start = bucket_start(self.now, Granularity.DAY) - timedelta(days=days - 1)
+        return [bucket for bucket in buckets if bucket_start(bucket.bucket, Granularity.DAY) >= start]
+
+    def posts_last_day(self) -> int:
+        return sum(bucket.posts for bucket in self.hourly)
+
+    def posts_last_days(self, days: int) -> int:
+        """Posts over the last `days` calendar days (UTC), today included"""
+        return sum(bucket.posts for bucket in self._since(self.daily, days))
+
+    def channel_posts(self, days: int = CHANNEL_WINDOW_DAYS) -> dict[int, int]:
+        return {
+            channel_id: sum(bucket.posts for bucket in self._since(buckets, days))
+            for channel_id, buckets in self.channels.items()
+        }
+
+    def daily_rate(self, days: int = 7) -> float:
+        """Average posts per day"""
+        return self.posts_last_days(days) / days
+
+    def net_backlog_change(self, days: int = 7) -> int:
+        """Items enqueued minus items posted or removed - negative while the backlog burns down"""
+        buckets = self._since(self.daily, days)
+        return sum(bucket.added - bucket.posts - bucket.removed for bucket in buckets)
+
+    def days_left(self, backlog: int, days: int = 7) -> Optional[float]:
+        """Days until the backlog runs out at the recent posting rate, None if nothing was posted"""
+        rate = self.daily_rate(days)
+        if rate == 0:
+            return None
+        return backlog / rate
+
+    def format(self, backlog: int) -> str:
+        lines = [
+            "Throughput:",
+            f"- last 24h: {self.posts_last_day()} posts",
+            f"- last 7 days: {self.posts_last_days(7)} posts ({self.daily_rate(7):.1f}/day)",
+            f"- last 30 days: {self.posts_last_days(30)} posts",
+        ]
+        channel_posts = self.channel_posts()
+        if channel_posts:
+            lines.append(f"Per channel, last {CHANNEL_WINDOW_DAYS} days:")
+            lines += [f"- {channel_id}: {posts} posts" for channel_id, posts in sorted(channel_posts.items())]
+
+        net = self.net_backlog_change(7)
+        lines += [
+            "Backlog:",
+            f"- ready to post: {backlog}",
+            f"- change over the last 7 days: {'+' if net > 0 else ''}{net} (added - posted - removed)",
+        ]
+        days_left = self.days_left(backlog)
+        if days_left is None:
+            lines.append("- days of content left: unknown (nothing posted in the last 7 days)")
+        else:
+            lines.append(f"- days of content left: {days_left:.1f} at {self.daily_rate(7):.1f} posts/day")
+        return "\n".join(lines)
@@ -1,11 +1,24 @@
+import re
+import tempfile
+import time
+from html import escape
+from pathlib import Path
+from typing import Awaitable, Callable
+
 from aiogram import F, Router
-from aiogram.filters import Command, CommandStart
-from aiogram.fsm.context import FSMContext
-from aiogram.types import Message
+from aiogram.filters import Command, CommandObject, CommandStart
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery, FSInputFile, Message
+from aiogram.utils.keyboard import InlineKeyboardBuilder
 from botspot import commands_menu
 from botspot.utils import send_safe
+from botspot.utils.admin_filter import AdminFilter
 
-from src.app import App, Readiness
+from src.app import PREVIEW_LENGTH, App, Readiness
+from src.outbox import Priority
+from src.render import html_preview
+from src.simulator import format_report
+from src.transfer import TransferFormat, parse
 
 router = Router()
 
@@ -46,60 +59,270 @@ async def stop_autopost_handler(message: Message, app: App):
 
 
 
-@router.message(F.text | F.caption)
-async def message_handler(message: Message, app: App, state: FSMContext):
-    """Basic help command handler"""
-    from botspot.user_interactions import ask_user_choice
+@commands_menu.botspot_command("stats", "Show posting stats")
+@router.message(Command("stats"))
+async def stats_handler(message: Message, app: App):
+    """Throughput, backlog burn-down and days of content left - from the rollups, not the queue"""
+    assert message.from_user is not None
+    history = await app.get_posting_history(message.from_user.id)
+    stats = await app.get_queue_stats(message.from_user.id)
+    await send_safe(message.chat.id, history.format(backlog=stats.total_pickable), parse_mode=None)
+
+
+@commands_menu.botspot_command("recount_stats", "Recount queue stats", visibility="hidden")
+@router.message(Command("recount_stats"))
+async def recount_stats_handler(message: Message, app: App):
+    """Rebuild queue counters from the queue - in case they drifted"""
+    assert message.from_user is not None
+    stats = await app.recount_queue_stats(message.from_user.id)
+    await send_safe(
+        message.chat.id,
+        f"Queue stats recounted. Currently in queue: {stats.total_unposted}\n{stats.format_breakdown()}",
+    )
+
+
+@commands_menu.botspot_command("outbox_stats", "Show outbound queue stats", visibility="hidden")
+@router.message(Command("outbox_stats"))
+async def outbox_stats_handler(message: Message, app: App):
+    """Outbound queue health: backlog, counters and wait times"""
+    lines = [f"Queued: {len(app.outbox)}"]
+    lines += [f"{name}: {value}" for name, value in app.outbox.counters.items()]
+    for priority in Priority:
+        waits = app.outbox.wait_time_percentiles(priority)
+        lines.append(f"{priority.name} wait: p50={waits['p50']:.2f}s p99={waits['p99']:.2f}s")
+    await send_safe(message.chat.id, "\n".join(lines))
+
+
+# how far ahead /simulate looks by default, days
+SIMULATION_DAYS = 7
+
+
+@commands_menu.botspot_command("simulate", "Simulate the load of current schedules", visibility="hidden")
+@router.message(Command("simulate"), AdminFilter())
+async def simulate_handler(message: Message, app: App, command: CommandObject):
+    """
+    Peak send rate, flood-wait exposure and queue exhaustion over the next days: /simulate [days].
+    Admins only - it reads every user's schedule and costs a full pass over the users collection.
+    """
+    try:
+        days = float(command.args) if command.args else SIMULATION_DAYS
+    except ValueError:
+        await send_safe(message.chat.id, "Usage: /simulate [days]")
+        return
+    assert message.from_user is not None
+    result = await app.simulate_schedules(days)
+    # aggregates only - other users' ids stay private
+    report = format_report(result, top_users=0)
+    if message.from_user.id in result.exhaustion:
+        when = result.exhaustion[message.from_user.id]
+        report += "\nYour queue: " + (f"runs out {when:%Y-%m-%d %H:%M}" if when else "lasts the whole period")
+    await send_safe(message.chat.id, report, parse_mode=None)
+
+
+@commands_menu.botspot_command("history", "Show recently posted items")
+@router.message(Command("history"))
+async def history_handler(message: Message, app: App):
+    """Last posted items, from the archive"""
+    assert message.from_user is not None
+    items = await app.get_archived_items(message.from_user.id)
+    if not items:
+        await send_safe(message.chat.id, "No archived posts yet.")
+        return
+    lines = []
+    for item in items:
+        posted_at = item.posted_at.strftime("%Y-%m-%d %H:%M") if item.posted_at else "?"
+        lines.append(f"{posted_at} | /repost_{item._doc_id}\n{item.preview[:PREVIEW_LENGTH]}")
+    await send_safe(message.chat.id, "\n\n".join(lines), parse_mode=None)
+
+
+@router.message(F.text.regexp(r"^/repost_([0-9a-f]{24})$").as_("match"))
+async def repost_handler(message: Message, app: App, match: re.Match):
+    """Put an archived post back in the queue"""
+    from bson import ObjectId
 
+    assert message.from_user is not None
+    item = await app.repost_archived_item(message.from_user.id, ObjectId(match.group(1)))
+    if item is None:
+        await send_safe(message.chat.id, "Archived post not found.")
+        return
+    if item._doc_id is None:
+        await send_safe(message.chat.id, "This post is already in the queue.")
+        return
+    await send_safe(message.chat.id, f"Added back to queue as {item.readiness.value}.")
+
+
+IMPORT_HELP = (
+    "Send a file with the /import caption (or reply /import to it):\n"
+    "- .jsonl: one post per line - a json string, or an object with 'data' and optional 'readiness'\n"
+    "- .md: posts separated by lines with ---\n"
+    "Add a readiness to the caption to set it for all posts without one, e.g. /import finished"
+)
+
+# minimum interval between progress message edits
+PROGRESS_INTERVAL_SECONDS = 2
+
+
+def progress_reporter(status: Message, action: str) -> Callable[[int], Awaitable[None]]:
+    last_report = time.monotonic()
+
+    async def report(count: int):
+        nonlocal last_report
+        if time.monotonic() - last_report >= PROGRESS_INTERVAL_SECONDS:
+            last_report = time.monotonic()
+            await status.edit_text(f"{action}... {count} posts so far")
+
+    return report
+
+
+@commands_menu.botspot_command("import", "Import posts from a .jsonl or .md file")
+@router.message(Command("import"))
+async def import_handler(message: Message, app: App, command: CommandObject):
+    """Stream posts from the attached document into the queue"""
+    assert message.from_user is not None and message.bot is not None
+    document = message.document
+    if document is None and message.reply_to_message is not None:
+        document = message.reply_to_message.document
+    if document is None:
+        await send_safe(message.chat.id, IMPORT_HELP, parse_mode=None)
+        return
+    try:
+        readiness = Readiness(command.args.strip().lower()) if command.args else Readiness.DRAFT
+        format = TransferFormat.from_filename(document.file_name or "")
+    except ValueError as e:
+        await send_safe(message.chat.id, f"{e}\n\n{IMPORT_HELP}", parse_mode=None)
+        return
+
+    status = await message.answer("Importing...")
+    reporter = progress_reporter(status, "Importing")
+    imported = 0
+
+    async def report(count: int):
+        # remembered for the error message - import_items does not return on error
+        nonlocal imported
+        imported = count
+        await reporter(count)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "import"
+        await message.bot.download(document, destination=path)
+        with path.open(encoding="utf-8") as file:
+            try:
+                imported, duplicates = await app.import_items(
+                    message.from_user.id, parse(file, format), readiness, progress=report
+                )
+            except ValueError as e:
+                await status.edit_text(f"Import stopped after {imported} posts: {e}")
+                return
+    stats = await app.get_queue_stats(message.from_user.id)
+    await status.edit_text(
+        f"Imported {imported} posts, skipped {duplicates} already in queue. "
+        f"Currently in queue: {stats.total_unposted}"
+    )
+
+
+@commands_menu.botspot_command("export", "Export the queue as a .jsonl file")
+@router.message(Command("export"))
+async def export_handler(message: Message, app: App):
+    """Stream pending posts into a file, in posting order"""
+    assert message.from_user is not None
+    status = await message.answer("Exporting...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "queue.jsonl"
+        with path.open("w", encoding="utf-8") as file:
+            exported = await app.export_queue(
+                message.from_user.id, file, progress=progress_reporter(status, "Exporting")
+            )
+        if exported == 0:
+            await status.edit_text("The queue is empty.")
+            return
+        await message.answer_document(FSInputFile(path), caption=f"{exported} posts")
+    await status.delete()
+
+
+class ReadinessCallback(CallbackData, prefix="readiness"):
+    """Carries the batch of queued posts - the prompt needs no state on the bot side and survives restarts"""
+
+    batch_id: str
+    choice: str  # Readiness value or "cancel"
+
+
+READINESS_CHOICES = {
+    "finished": "Finished",
+    "unpolished": "Unpolished",
+    "draft": "Draft",
+    "cancel": "Cancel",
+}
+
+# how many posts of a batch are previewed in the prompt
+BATCH_PREVIEW_POSTS = 5
+
+
+@router.message(
+    F.text | F.caption | F.photo | F.video | F.animation | F.document | F.audio | F.voice
+)
+async def message_handler(message: Message, app: App):
+    """Save a burst of posts as drafts in one write and ask once how ready they are"""
     assert message.from_user is not None
     user_id = message.from_user.id
 
-    # save user message to queue
-    # todo: handle captions, media etc. 
-    # todo: for now, add 'forwarding' mode for media-based posts
-    post_content = await app.prepare_post_content(message)
+    posts = await app.collect_burst(message)
+    if posts is None:
+        # handled together with the first message of the burst
+        return
+
+    # save user messages to queue
+    items = [await app.prepare_post_content(post[0], post) for post in posts]
+    batch_id = await app.add_batch_to_queue(items, user_id, readiness=Readiness.DRAFT)
+    duplicates = sum(item._doc_id is None for item in items)
+    items = [item for item in items if item._doc_id is not None]
+    if not items:
+        await send_safe(message.chat.id, "Already in queue.")
+        return
 
     # todo: move to prepare_post_content?
     # title = app._get_post_title(post_content)
 
-    preview = f"Adding new post to queue. Preview:\n'''\n{post_content}\n'''\nHow ready is this post?"
-    choices = {
-        "finished": "Finished",
-        "unpolished": "Unpolished",
-        "draft": "Draft",
-        "cancel": "Cancel"
-    }
-    choice = await ask_user_choice(
-        message.chat.id,
-        preview,
-        choices=choices,
-        default_choice="draft",
-        state=state,
-        parse_mode="HTML", 
-        cleanup=True,
-    )
-    if choice == "cancel" or choice is None:
-        await send_safe(message.chat.id, "Cancelled.")
-        return
-    readiness_map = {
-        "finished": Readiness.FINISHED,
-        "unpolished": Readiness.UNPOLISHED,
-        "draft": Readiness.DRAFT
-    }
-    readiness = readiness_map[choice]
-    await app.add_to_queue(post_content, user_id, readiness=readiness)
-
-    # todo: add alternative mode of saving: forwarding
-    queue_items = await app.queue.get_items(user_id=user_id)
-    # todo: add better stats
-    # counts per readiness state
-    unposted_items = [item for item in queue_items if not item.posted]
-
-    # todo: Format this message better, add utils
-    # - util to get queue stats - here and in app.py send_to_channel
-    # - util to format post preview - here and above
-    await send_safe(
-        message.chat.id,
-        f"Saved to queue as {choice}. Currently in queue: {len(unposted_items)}. Preview:</b>\n{post_content}\n\nReadiness: {readiness.value}",
-        parse_mode="HTML"
-    )
\ No newline at end of file
+    keyboard = InlineKeyboardBuilder()
+    for choice, text in READINESS_CHOICES.items():
+        keyboard.button(text=text, callback_data=ReadinessCallback(batch_id=batch_id, choice=choice))
+    keyboard.adjust(3, 1)
+    duplicates_note = f" ({duplicates} already in queue - skipped)" if duplicates else ""
+    if len(items) == 1:
+        text = f"Saved to queue as draft{duplicates_note}. Preview:\n'''\n{items[0].preview}\n'''\nHow ready is this post?"
+    else:
+        previews = "\n\n".join(html_preview(item.preview, PREVIEW_LENGTH) for item in items[:BATCH_PREVIEW_POSTS])
+        if len(items) > BATCH_PREVIEW_POSTS:
+            previews += f"\n\n... and {len(items) - BATCH_PREVIEW_POSTS} more"
+        text = f"Saved {len(items)} posts to queue as drafts{duplicates_note}. Previews:\n'''\n{previews}\n'''\nHow ready are these posts?"
+    # what the render plans changed - e.g. split into several messages, invalid HTML
+    notes = [
+        f"{i}. {item.render_plan.describe()}" if len(items) > 1 else item.render_plan.describe()
+        for i, item in enumerate(items, 1)
+        if item.render_plan is not None and item.render_plan.describe()
+    ]
+    if notes:
+        text += "\n\nNote:\n" + escape("\n".join(notes))
+    await send_safe(message.chat.id, text, reply_markup=keyboard.as_markup(), parse_mode="HTML")
+
+
+@router.callback_query(ReadinessCallback.filter())
+async def readiness_callback_handler(
+    callback: CallbackQuery, callback_data: ReadinessCallback, app: App
+):
+    """Set readiness of a batch of queued posts, or remove them on cancel"""
+    user_id = callback.from_user.id
+    if callback_data.choice == "cancel":
+        count = await app.remove_batch_from_queue(user_id, callback_data.batch_id)
+        text = "Cancelled."
+    else:
+        readiness = Readiness(callback_data.choice)
+        count = await app.set_batch_readiness(user_id, callback_data.batch_id, readiness)
+        stats = await app.get_queue_stats(user_id)
+        saved = "Saved to queue" if count == 1 else f"Saved {count} posts to queue"
+        text = f"{saved} as {readiness.value}. Currently in queue: {stats.total_unposted}"
+    if count == 0:
+        text = "These posts are no longer in the queue."
+
+    await callback.answer()
+    if isinstance(callback.message, Message):
+        await callback.message.edit_text(text, reply_markup=None)
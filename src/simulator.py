@@ -0,0 +1,325 @@
+"""
+Discrete-event simulation of posting schedules, for capacity planning.
+
+Replays the schedules of a set of users in virtual time - no timers, no sleeping - and reports
+what the bot would have to sustain: posts and messages per second, concurrently running posting
+jobs, mongo operations, how much of the traffic goes over telegram's global rate limit (and would
+end in flood waits) and when every user's queue runs out.
+
+Fire times are computed once per schedule, not per user: cron users sharing a (normalized)
+expression and period users sharing a period and phase form one group, and the number of users
+still posting at the k-th fire of a group is a bisect over the sorted queue sizes of its members.
+
+    python -m src.simulator users.jsonl --days 7 --spread 60
+
+users.jsonl: one user per line, with the PosterBotUser scheduling fields and a queue size, e.g.
+    {"user_id": 1, "scheduling_mode": "cron", "scheduling_cron_expr": "0 10 * * *", "queue_size": 30}
+(queue_size - posts that will be picked: finished + unpolished. Missing - unlimited)
+
+Cron expressions are evaluated with the same APScheduler CronTrigger the bot schedules with, so
+numeric day-of-week follows APScheduler (0 = Monday), not classic cron.
+"""
+
+import argparse
+import csv
+import json
+import math
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+from apscheduler.triggers.cron import CronTrigger
+
+from src.dispatcher import spread_offset
+from src.outbox import GLOBAL_RATE
+from src.utils import normalize_cron_expr, parse_cron_expr_for_apscheduler
+
+# mongo operations of one posting job: claiming the slot and the post, the item, counters and
+# rollups writes, saving the next fire time. The user is usually served from the cache
+MONGO_OPS_PER_POST = 6
+
+
+@dataclass
+class SimUser:
+    user_id: int
+    scheduling_mode: str  # SchedulingMode value
+    scheduling_period_seconds: Optional[int] = None
+    scheduling_cron_expr: Optional[str] = None
+    # posts that will be picked - None for unlimited
+    queue_size: Optional[int] = None
+    # target channels - every post is one message per channel
+    channels: int = 1
+    # first fire time of a period schedule - e.g. restored from schedule_state
+    next_fire_at: Optional[datetime] = None
+
+    @classmethod
+    def from_record(cls, record: dict) -> "SimUser":
+        next_fire_at = record.get("next_fire_at")
+        return cls(
+            user_id=record["user_id"],
+            scheduling_mode=record["scheduling_mode"],
+            scheduling_period_seconds=record.get("scheduling_period_seconds"),
+            scheduling_cron_expr=record.get("scheduling_cron_expr"),
+            queue_size=record.get("queue_size"),
+            channels=record.get("channels", 1),
+            next_fire_at=datetime.fromisoformat(next_fire_at) if next_fire_at else None,
+        )
+
+
+@dataclass
+class FloodExposure:
+    # seconds in which more messages were due than the global rate allows
+    seconds_over_limit: int = 0
+    # messages over the limit, summed over those seconds
+    excess_messages: int = 0
+    # longest wait of a message in the backlog built up by the excess, seconds
+    max_delay_seconds: float = 0
+
+
+@dataclass
+class SimulationResult:
+    start: datetime
+    end: datetime
+    # second (epoch) -> posting jobs started / messages sent in that second
+    posts: Counter = field(default_factory=Counter)
+    messages: Counter = field(default_factory=Counter)
+    peak_concurrency: int = 0
+    flood: FloodExposure = field(default_factory=FloodExposure)
+    # user_id -> when the last post leaves the queue, None if it lasts beyond the simulated period
+    exhaustion: dict[int, Optional[datetime]] = field(default_factory=dict)
+    mongo_ops_per_post: int = MONGO_OPS_PER_POST
+
+    @property
+    def total_posts(self) -> int:
+        return sum(self.posts.values())
+
+    @property
+    def peak_messages_per_second(self) -> int:
+        return max(self.messages.values(), default=0)
+
+    @property
+    def peak_second(self) -> Optional[datetime]:
+        if not self.messages:
+            return None
+        second = max(self.messages, key=lambda key: (self.messages[key], -key))
+        return datetime.fromtimestamp(second, self.start.tzinfo)
+
+    @property
+    def peak_mongo_ops_per_second(self) -> int:
+        return max(self.posts.values(), default=0) * self.mongo_ops_per_post
+
+    def rate_histogram(self) -> dict[int, int]:
+        """Messages per second -> number of seconds with that rate, idle seconds included"""
+        histogram = Counter(self.messages.values())
+        seconds = int((self.end - self.start).total_seconds())
+        histogram[0] += seconds - len(self.messages)
+        return dict(sorted(histogram.items()))
+
+
+def _epoch(value: datetime) -> float:
+    return value.timestamp()
+
+
+def _cron_fire_times(expr: str, start: datetime, end: float, limit: Optional[int]) -> list[float]:
+    trigger = CronTrigger(**parse_cron_expr_for_apscheduler(expr), timezone=start.tzinfo)
+    times = []
+    # a fire exactly at start counts
+    fire = trigger.get_next_fire_time(None, start)
+    while fire is not None and (limit is None or len(times) < limit):
+        if _epoch(fire) >= end:
+            break
+        times.append(_epoch(fire))
+        fire = trigger.get_next_fire_time(fire, fire)
+    return times
+
+
+def _period_fire_times(
+    period: int, first: float, start: float, end: float, limit: Optional[int]
+) -> list[float]:
+    if first < start:
+        # keep the phase, skip what is in the past
+        first += math.ceil((start - first) / period) * period
+    count = max(0, math.ceil((end - first) / period))
+    if limit is not None:
+        count = min(count, limit)
+    return [first + k * period for k in range(count)]
+
+
+def _schedule_key(user: SimUser, start: datetime) -> tuple:
+    if user.scheduling_mode == "period":
+        assert user.scheduling_period_seconds, f"Scheduling period is not set for user {user.user_id}"
+        period = user.scheduling_period_seconds
+        # IntervalTrigger without a start date first fires one period after scheduling
+        first = user.next_fire_at or start + timedelta(seconds=period)
+        return ("period", period, _epoch(first))
+    if user.scheduling_mode == "cron":
+        assert user.scheduling_cron_expr, f"Scheduling cron expression is not set for user {user.user_id}"
+        # same validation as scheduling in the bot
+        parse_cron_expr_for_apscheduler(user.scheduling_cron_expr)
+        return ("cron", normalize_cron_expr(user.scheduling_cron_expr))
+    raise ValueError(f"Invalid scheduling mode: {user.scheduling_mode}")
+
+
+def _peak_concurrency(posts: Counter, post_seconds: float) -> int:
+    """Most jobs running at once if every job takes post_seconds - a sliding window sum"""
+    window = max(1, math.ceil(post_seconds))
+    peak = running = 0
+    seconds = sorted(posts)
+    left = 0
+    for second in seconds:
+        running += posts[second]
+        while seconds[left] <= second - window:
+            running -= posts[seconds[left]]
+            left += 1
+        peak = max(peak, running)
+    return peak
+
+
+def _flood_exposure(messages: Counter, rate: float) -> FloodExposure:
+    """Messages over the rate are queued and drained at the rate - as the outbox does"""
+    flood = FloodExposure()
+    backlog = 0.0
+    previous = None
+    for second in sorted(messages):
+        if previous is not None:
+            backlog = max(0.0, backlog - rate * (second - previous))
+        previous = second
+        sent = messages[second]
+        if sent > rate:
+            flood.seconds_over_limit += 1
+            flood.excess_messages += math.ceil(sent - rate)
+        backlog += sent
+        flood.max_delay_seconds = max(flood.max_delay_seconds, max(0.0, backlog - rate) / rate)
+    return flood
+
+
+def simulate(
+    users: Iterable[SimUser],
+    start: datetime,
+    days: float = 7,
+    spread_seconds: float = 0,
+    post_seconds: float = 1.0,
+    global_rate: float = GLOBAL_RATE,
+    mongo_ops_per_post: int = MONGO_OPS_PER_POST,
+) -> SimulationResult:
+    """
+    Run the schedules of `users` from `start` for `days`.
+
+    spread_seconds - post_spread_seconds of the bot, post_seconds - how long a posting job takes.
+    """
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    end = start + timedelta(days=days)
+    result = SimulationResult(start=start, end=end, mongo_ops_per_post=mongo_ops_per_post)
+
+    # schedule -> (offset, channels) -> members
+    groups: dict[tuple, dict[tuple[int, int], list[SimUser]]] = defaultdict(lambda: defaultdict(list))
+    for user in users:
+        offset = int(spread_offset(user.user_id, spread_seconds))
+        groups[_schedule_key(user, start)][offset, user.channels].append(user)
+
+    start_epoch, end_epoch = _epoch(start), _epoch(end)
+    for key, subgroups in groups.items():
+        members = [user for subgroup in subgroups.values() for user in subgroup]
+        # fires past the largest queue produce no posts
+        sizes = [user.queue_size for user in members if user.queue_size is not None]
+        limit = max(sizes) if len(sizes) == len(members) else None
+        if key[0] == "cron":
+            fire_times = _cron_fire_times(key[1], start, end_epoch, limit)
+        else:
+            fire_times = _period_fire_times(key[1], key[2], start_epoch, end_epoch, limit)
+
+        for (offset, channels), subgroup in subgroups.items():
+            bounded = sorted(user.queue_size for user in subgroup if user.queue_size is not None)
+            unlimited = len(subgroup) - len(bounded)
+            for k, fire in enumerate(fire_times):
+                # members with more than k posts in the queue
+                active = unlimited + len(bounded) - bisect_right(bounded, k)
+                if not active:
+                    break
+                second = int(fire) + offset
+                result.posts[second] += active
+                result.messages[second] += active * channels
+
+        for user in members:
+            if user.queue_size is None or user.queue_size > len(fire_times):
+                result.exhaustion[user.user_id] = None
+            elif user.queue_size == 0:
+                result.exhaustion[user.user_id] = start
+            else:
+                offset = int(spread_offset(user.user_id, spread_seconds))
+                last_post = fire_times[user.queue_size - 1] + offset
+                result.exhaustion[user.user_id] = datetime.fromtimestamp(last_post, start.tzinfo)
+
+    result.peak_concurrency = _peak_concurrency(result.posts, post_seconds)
+    result.flood = _flood_exposure(result.messages, global_rate)
+    return result
+
+
+def format_report(result: SimulationResult, top_users: int = 10) -> str:
+    peak_second = result.peak_second
+    lines = [
+        f"Simulated {result.start:%Y-%m-%d %H:%M} - {result.end:%Y-%m-%d %H:%M} ({result.start.tzinfo})",
+        f"Posts: {result.total_posts}, messages: {sum(result.messages.values())}",
+        f"Peak send rate: {result.peak_messages_per_second} msg/s"
+        + (f" at {peak_second:%Y-%m-%d %H:%M:%S}" if peak_second else ""),
+        f"Peak concurrent posting jobs: {result.peak_concurrency}",
+        f"Peak mongo ops: ~{result.peak_mongo_ops_per_second}/s",
+        f"Over the global rate limit: {result.flood.seconds_over_limit} seconds, "
+        f"{result.flood.excess_messages} messages, max delay {result.flood.max_delay_seconds:.1f}s",
+        "",
+        "Messages per second -> seconds:",
+    ]
+    lines += [f"  {rate}: {seconds}" for rate, seconds in result.rate_histogram().items()]
+
+    exhausted = sorted(
+        ((when, user_id) for user_id, when in result.exhaustion.items() if when is not None)
+    )
+    lines += ["", f"Queues running out: {len(exhausted)} of {len(result.exhaustion)} users"]
+    lines += [f"  {user_id}: {when:%Y-%m-%d %H:%M}" for when, user_id in exhausted[:top_users]]
+    if top_users and len(exhausted) > top_users:
+        lines.append(f"  ... and {len(exhausted) - top_users} more")
+    return "\n".join(lines)
+
+
+def write_histogram_csv(result: SimulationResult, path: Path) -> None:
+    """Per-second time series of active seconds: time, posts, messages"""
+    with path.open("w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["time", "posts", "messages"])
+        for second in sorted(result.messages):
+            time = datetime.fromtimestamp(second, result.start.tzinfo).isoformat()
+            writer.writerow([time, result.posts[second], result.messages[second]])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("users", type=Path, help="jsonl file with users")
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--start", type=datetime.fromisoformat, help="default: now, UTC")
+    parser.add_argument("--spread", type=float, default=0, help="post_spread_seconds")
+    parser.add_argument("--post-seconds", type=float, default=1.0, help="duration of a posting job")
+    parser.add_argument("--rate", type=float, default=GLOBAL_RATE, help="global messages per second")
+    parser.add_argument("--histogram", type=Path, help="write the per-second series to this csv")
+    args = parser.parse_args()
+
+    with args.users.open() as file:
+        users = [SimUser.from_record(json.loads(line)) for line in file if line.strip()]
+    result = simulate(
+        users,
+        start=args.start or datetime.now(timezone.utc).replace(microsecond=0),
+        days=args.days,
+        spread_seconds=args.spread,
+        post_seconds=args.post_seconds,
+        global_rate=args.rate,
+    )
+    print(format_report(result))
+    if args.histogram:
+        write_histogram_csv(result, args.histogram)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Per-slot claims, for running several replicas of the bot.
+
+Every replica restores the same schedules from schedule_state, so every replica fires the same
+posting slots. The post lease keeps two replicas from sending the same item, but not from each
+sending a different one - a slot has to be claimed first: a conditional write on the user's
+schedule state document that succeeds for one replica only. The others skip the slot.
+"""
+
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+# fields of the schedule state document holding the latest claimed slot. Catch-up posts are claimed
+# under their own field: their slots are older than the regular ones fired since the restart, and
+# would always lose to them
+REGULAR_SLOT = "last_slot"
+CATCH_UP_SLOT = "last_catch_up_slot"
+
+
+async def claim_slot(state_collection, user_id: int, slot: datetime, field: str = REGULAR_SLOT) -> bool:
+    """
+    Claim the fire time `slot` of a user. False if it - or a later one - was claimed already.
+    Relies on the unique user_id index of the collection.
+    """
+    # mongo keeps milliseconds - a claim of the same slot must compare equal to the stored one
+    slot = slot.replace(microsecond=slot.microsecond // 1000 * 1000)
+    try:
+        await state_collection.update_one(
+            {"user_id": user_id, "$or": [{field: None}, {field: {"$lt": slot}}]},
+            {"$set": {field: slot}},
+            # no document yet: created by the first claim. If the filter did not match an existing
+            # document, the insert hits the unique index instead
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+    return True
@@ -0,0 +1,107 @@
+"""
+Streaming import / export of queue contents.
+
+Formats:
+- JSONL: one post per line - a json string, or an object with "data" and optional "readiness"
+  (as written by export, so an export can be imported back)
+- Markdown: posts separated by lines consisting of "---"
+
+Copied posts (FORWARD mode) refer to messages by chat and message id. On import they are accepted
+only from the importing user's own chat with the bot - see check_source.
+
+Parsers work on an iterable of lines and yield one record at a time - memory does not grow with
+the size of the document.
+"""
+
+import json
+from enum import Enum
+from pathlib import PurePath
+from typing import Iterable, Iterator
+
+MARKDOWN_SEPARATOR = "---"
+
+# queue item fields written by export and accepted by import
+EXPORT_FIELDS = (
+    "data",
+    "readiness",
+    "save_mode",
+    "source_chat_id",
+    "source_message_ids",
+    "media_group_id",
+)
+
+
+class TransferFormat(Enum):
+    JSONL = "jsonl"
+    MARKDOWN = "markdown"
+
+    @classmethod
+    def from_filename(cls, filename: str) -> "TransferFormat":
+        suffix = PurePath(filename).suffix.lower()
+        if suffix in (".jsonl", ".ndjson", ".json"):
+            return cls.JSONL
+        if suffix in (".md", ".markdown", ".txt"):
+            return cls.MARKDOWN
+        raise ValueError(f"Unsupported file type '{suffix}', expected .jsonl or .md")
+
+
+def parse_jsonl(lines: Iterable[str]) -> Iterator[dict]:
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {number}: invalid json: {e}") from e
+        if isinstance(record, str):
+            record = {"data": record}
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {number}: expected a string or an object")
+        record = {key: value for key, value in record.items() if key in EXPORT_FIELDS}
+        if not record.get("data") and not record.get("source_message_ids"):
+            raise ValueError(f"Line {number}: empty post")
+        yield record
+
+
+def check_source(record: dict, user_id: int) -> dict:
+    """
+    Reject a record that references messages outside the user's chat with the bot - otherwise
+    an uploaded file could make the bot copy messages from any chat it can read.
+    """
+    references = record.get("save_mode") == "forward" or any(
+        record.get(key) for key in ("source_chat_id", "source_message_ids")
+    )
+    if references and record.get("source_chat_id") != user_id:
+        raise ValueError(
+            f"post copies messages from chat {record.get('source_chat_id')} - "
+            "only messages from your own chat with the bot can be imported"
+        )
+    return record
+
+
+def parse_markdown(lines: Iterable[str]) -> Iterator[dict]:
+    post: list[str] = []
+    for line in lines:
+        if line.strip() == MARKDOWN_SEPARATOR:
+            text = "".join(post).strip()
+            if text:
+                yield {"data": text}
+            post = []
+        else:
+            post.append(line)
+    text = "".join(post).strip()
+    if text:
+        yield {"data": text}
+
+
+def parse(lines: Iterable[str], format: TransferFormat) -> Iterator[dict]:
+    if format == TransferFormat.JSONL:
+        return parse_jsonl(lines)
+    return parse_markdown(lines)
+
+
+def export_line(doc: dict) -> str:
+    """A queue document as a JSONL line, without empty fields"""
+    record = {key: doc[key] for key in EXPORT_FIELDS if doc.get(key) not in (None, "", [])}
+    return json.dumps(record, ensure_ascii=False) + "\n"
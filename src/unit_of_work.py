@@ -0,0 +1,90 @@
+"""
+Unit of work of one posting cycle: the writes of a post_content_job run are buffered while the
+post is sent, and flushed together once the outcome is known.
+
+The flush issues one write per collection - the leased item, the queue counters, the rollups -
+concurrently, so a cycle costs two round trips: reading the user and claiming the item
+(also concurrent), then the flush. The counters update returns the new counters, so that the
+notification needs no extra read.
+
+Failure semantics are those of writing the item first and the counters only if it was updated:
+if the lease was lost in the meantime (or the item write failed), the counters change is reverted.
+Rollups are kept either way - the messages were sent.
+"""
+
+import asyncio
+from typing import Any, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+
+
+class PostingUnitOfWork:
+    def __init__(self, queue_collection, stats_collection, rollups_collection, user_id: int):
+        self._queue = queue_collection
+        self._stats = stats_collection
+        self._rollups = rollups_collection
+        self.user_id = user_id
+        # the leased item: (_id, lease holder) and the fields to set on it
+        self._item: Optional[tuple[Any, str | None]] = None
+        self._item_fields: dict[str, Any] = {}
+        self._stats_inc: dict[str, int] = {}
+        self._stats_fields: dict[str, Any] = {}
+        self._rollup_updates: list[UpdateOne] = []
+        # counters document after the flush - None if there were no counters for the user yet
+        self.stats: Optional[dict] = None
+
+    def update_item(self, doc_id: Any, claimed_by: str | None, fields: dict[str, Any]):
+        """Set fields on the item - applied only while `claimed_by` still holds the lease"""
+        self._item = (doc_id, claimed_by)
+        self._item_fields.update(fields)
+
+    def update_stats(self, inc: dict[str, int], set_fields: dict[str, Any] | None = None):
+        for key, value in inc.items():
+            self._stats_inc[key] = self._stats_inc.get(key, 0) + value
+        self._stats_fields.update(set_fields or {})
+
+    def add_rollups(self, updates: list[UpdateOne]):
+        self._rollup_updates += updates
+
+    async def flush(self) -> bool:
+        """Write everything buffered. Returns False if the lease on the item was lost"""
+        item_write = stats_write = rollups_write = None
+        if self._item is not None:
+            doc_id, claimed_by = self._item
+            item_write = self._queue.update_one(
+                {"_id": doc_id, "claimed_by": claimed_by}, {"$set": self._item_fields}
+            )
+        if self._stats_inc or self._stats_fields:
+            update: dict[str, Any] = {"$inc": self._stats_inc}
+            if self._stats_fields:
+                update["$set"] = self._stats_fields
+            stats_write = self._stats.find_one_and_update(
+                {"user_id": self.user_id}, update, return_document=ReturnDocument.AFTER
+            )
+        if self._rollup_updates:
+            rollups_write = self._rollups.bulk_write(self._rollup_updates, ordered=False)
+
+        item_result, stats_result, rollups_result = await asyncio.gather(
+            *(_maybe(write) for write in (item_write, stats_write, rollups_write)),
+            return_exceptions=True,
+        )
+        lease_held = (
+            item_result is None
+            or not isinstance(item_result, BaseException)
+            and item_result.modified_count > 0
+        )
+        if not lease_held and isinstance(stats_result, dict) and self._stats_inc:
+            await self._stats.update_one(
+                {"user_id": self.user_id},
+                {"$inc": {key: -value for key, value in self._stats_inc.items()}},
+            )
+            stats_result = None
+        for result in (item_result, stats_result, rollups_result):
+            if isinstance(result, BaseException):
+                raise result
+        self.stats = stats_result if isinstance(stats_result, dict) else None
+        return lease_held
+
+
+async def _maybe(write):
+    return None if write is None else await write
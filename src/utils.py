@@ -11,6 +11,18 @@ def validate_cron_expr(expr):
         raise ValueError(f"Invalid cron expression: {expr}. Error: {e}")
     return True
 
+def normalize_cron_expr(expr) -> str:
+    """
+    Canonical form of a cron expression - equivalent expressions map to the same string.
+    Always 6 fields (sec min hour day month dow), single spaces, lowercase names.
+    """
+    if isinstance(expr, list):
+        expr = " ".join(expr)
+    fields = str(expr).lower().split()
+    if len(fields) == 5:
+        fields = ["0", *fields]
+    return " ".join(fields)
+
 def parse_cron_expr_for_apscheduler(expr: str) -> dict:
     """
     Parse a cron expression string into a dict of CronTrigger keyword arguments.
@@ -0,0 +1,189 @@
+"""
+Webhook mode: telegram POSTs updates to an aiohttp server instead of the bot long-polling for them.
+
+Several instances behind a load balancer can share the inbound traffic.
+Recorded updates can be replayed against a local instance:
+
+    python -m src.webhook updates.jsonl --url http://localhost:8080/webhook  # secret: WEBHOOK_SECRET
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Any, Iterator
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import ClientSession, web
+from loguru import logger
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Acknowledges updates right away and hands them to `workers` worker tasks. Beyond `max_pending`
+    accepted, not yet handled updates telegram is asked to retry later, so that a burst can not
+    exhaust memory.
+
+    On shutdown stops accepting updates and waits up to `drain_timeout` for accepted ones.
+    Built on the dispatcher's public feed_update - not on aiogram's own background handling.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        secret_token: str | None = None,
+        workers: int = 100,
+        max_pending: int = 1000,
+        drain_timeout: float = 30,
+        **data: Any,
+    ):
+        super().__init__(dispatcher, bot, secret_token=secret_token, **data)
+        self._queue: asyncio.Queue[tuple[Bot, dict[str, Any]]] = asyncio.Queue()
+        self._worker_count = workers
+        self._workers: list[asyncio.Task] = []
+        self._max_pending = max_pending
+        self._drain_timeout = drain_timeout
+        self._pending = 0
+        self._closing = False
+
+    @property
+    def pending(self) -> int:
+        """Accepted updates not handled yet - queued and in progress"""
+        return self._pending
+
+    def register(self, app: web.Application, /, path: str, **kwargs: Any) -> None:
+        super().register(app, path=path, **kwargs)
+        app.on_startup.append(self._start_workers)
+
+    async def _start_workers(self, _app: web.Application) -> None:
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self._worker_count)]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get(SECRET_HEADER, ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+        if self._closing or self._pending >= self._max_pending:
+            # telegram re-delivers the update later - possibly to another instance
+            return web.Response(status=503)
+        self._queue.put_nowait((bot, await request.json(loads=bot.session.json_loads)))
+        self._pending += 1
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def _work(self) -> None:
+        while True:
+            bot, update = await self._queue.get()
+            try:
+                await self._feed_update(bot, update)
+            except Exception:
+                logger.exception(f"Failed to handle update {update.get('update_id')}")
+            finally:
+                self._pending -= 1
+                self._queue.task_done()
+
+    async def _feed_update(self, bot: Bot, update: dict[str, Any]) -> None:
+        result = await self.dispatcher.feed_update(
+            bot, Update.model_validate(update, context={"bot": bot}), **self.data
+        )
+        # a handler may answer with a method, as if replying to the webhook request
+        if isinstance(result, TelegramMethod):
+            await self.dispatcher.silent_call_request(bot, result)
+
+    async def close(self) -> None:
+        self._closing = True
+        if self._pending:
+            logger.info(f"Draining {self._pending} in-flight updates")
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=self._drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"{self._pending} updates not handled within {self._drain_timeout}s, cancelling"
+                )
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        await super().close()
+
+
+def create_webhook_app(
+    dp: Dispatcher,
+    bot: Bot,
+    path: str,
+    secret_token: str,
+    workers: int = 100,
+    max_pending: int = 1000,
+    drain_timeout: float = 30,
+    webhook_url: str | None = None,
+) -> web.Application:
+    """
+    aiohttp app serving updates at `path`. If webhook_url is set, it is registered with telegram on
+    startup - every instance may do it, the call is idempotent.
+    """
+    handler = BoundedRequestHandler(
+        dp,
+        bot,
+        secret_token=secret_token,
+        workers=workers,
+        max_pending=max_pending,
+        drain_timeout=drain_timeout,
+    )
+    app = web.Application()
+    # registered before setup_application: in-flight updates are drained before the bot shuts down
+    handler.register(app, path=path)
+    setup_application(app, dp, bot=bot)
+
+    if webhook_url is not None:
+
+        async def set_webhook(bot: Bot):
+            await bot.set_webhook(
+                webhook_url,
+                secret_token=secret_token,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+            logger.info(f"Webhook set to {webhook_url}")
+
+        dp.startup.register(set_webhook)
+    return app
+
+
+def read_updates(path: Path) -> Iterator[dict]:
+    """Updates from a jsonl file, a json list, or a saved getUpdates response"""
+    text = path.read_text()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        yield from (json.loads(line) for line in text.splitlines() if line.strip())
+        return
+    if isinstance(data, dict):
+        data = data.get("result", [data])
+    yield from data
+
+
+async def replay_updates(path: Path, url: str, secret: str | None, delay: float) -> None:
+    headers = {SECRET_HEADER: secret} if secret else {}
+    async with ClientSession() as session:
+        for update in read_updates(path):
+            async with session.post(url, json=update, headers=headers) as response:
+                logger.info(f"Update {update.get('update_id')}: {response.status}")
+            if delay:
+                await asyncio.sleep(delay)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("updates", type=Path, help="jsonl / json file with recorded updates")
+    parser.add_argument("--url", default="http://localhost:8080/webhook")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET"))
+    parser.add_argument("--delay", type=float, default=0, help="seconds between updates")
+    args = parser.parse_args()
+    asyncio.run(replay_updates(args.updates, args.url, args.secret, args.delay))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+App instances on an in-memory mongo (mongomock). Apps made by one test share the database -
+like replicas of the bot. Telegram is replaced by FakeTelegram, nothing is sent.
+"""
+
+import functools
+import inspect
+import itertools
+from datetime import timezone
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from mongomock.collection import BulkOperationBuilder
+from mongomock_motor import AsyncMongoMockClient
+
+from src.outbox import Outbox
+
+CHANNEL_ID = -1001
+
+
+def _without_sort(add_operation):
+    @functools.wraps(add_operation)
+    def wrapper(self, *args, sort=None, **kwargs):
+        assert sort is None, "mongomock can not sort bulk updates"
+        return add_operation(self, *args, **kwargs)
+
+    return wrapper
+
+
+# pymongo >= 4.11 passes `sort` to the bulk builder for UpdateOne / ReplaceOne, mongomock 4.3 does not
+# take it yet
+for _name in ("add_update", "add_replace"):
+    if "sort" not in inspect.signature(getattr(BulkOperationBuilder, _name)).parameters:
+        setattr(BulkOperationBuilder, _name, _without_sort(getattr(BulkOperationBuilder, _name)))
+
+
+class FakeTelegram:
+    """Records channel posts and notifications. Sends to the channels in `failing` raise"""
+
+    def __init__(self):
+        self.posts: list[tuple[int, str]] = []
+        self.notifications: list[tuple[int, str]] = []
+        self.failing: set[int] = set()
+        self._message_ids = itertools.count(1)
+
+    async def send_post(self, channel_id: int, post) -> list[int]:
+        if channel_id in self.failing:
+            raise RuntimeError(f"chat {channel_id} not found")
+        self.posts.append((channel_id, post.data))
+        return [next(self._message_ids)]
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.notifications.append((chat_id, text))
+
+
+class RecordingOutbox(Outbox):
+    """Notifications are recorded right away - the rate limits are tested in test_outbox"""
+
+    def __init__(self, telegram: FakeTelegram):
+        super().__init__(telegram.send_message)
+        self.telegram = telegram
+
+    def notify(self, chat_id: int, text: str, coalesce_key=None, **kwargs):
+        self.telegram.notifications.append((chat_id, text))
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient()["poster_bot"]
+
+
+@pytest.fixture
+def telegram():
+    return FakeTelegram()
+
+
+@pytest.fixture
+def make_app(db, telegram):
+    # imported here, so that the tests of the helper modules do not need the bot stack
+    from src.app import App
+
+    def make(**config) -> App:
+        app = App(telegram_bot_token="123:test", target_channel_id=CHANNEL_ID, **config)
+        app._queue = SimpleNamespace(collection=db["queue_content"])
+        app._users_collection = db["users"]
+        app._stats_collection = db["queue_stats"]
+        app._archive_collection = db["content_archive"]
+        app._schedule_state_collection = db["schedule_state"]
+        app._rollups_collection = db["posting_rollups"]
+        app._scheduler = AsyncIOScheduler(timezone=timezone.utc)
+        app._outbox = RecordingOutbox(telegram)
+        app._send_post = telegram.send_post
+        return app
+
+    return make
+
+
+@pytest_asyncio.fixture
+async def app(make_app):
+    app = make_app()
+    await app.ensure_indexes()
+    return app
+
+
+@pytest.fixture
+def add_user(db):
+    """Insert a user document - the fields botspot's user manager would have saved"""
+
+    async def add(user_id: int, **fields):
+        await db["users"].insert_one({"user_id": user_id, **fields})
+
+    return add
+
+
+@pytest.fixture
+def add_posts():
+    """Enqueue text posts through the app - counters and rollups included"""
+
+    from src.app import PosterBotQueueItem, Readiness
+
+    async def add(app, user_id: int, *texts: str, readiness: Readiness = Readiness.FINISHED):
+        for text in texts:
+            item = PosterBotQueueItem(data=text, render_plan=app.render(text))
+            await app.add_to_queue(item, user_id, readiness)
+
+    return add
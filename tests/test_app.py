@@ -0,0 +1,240 @@
+import asyncio
+import io
+import json
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from src.app import PosterBotQueueItem, Readiness
+
+
+def counts(stats) -> tuple[int, ...]:
+    return (stats.posted, *(stats.count(readiness) for readiness in Readiness))
+
+
+@pytest.fixture
+def user(app, add_user):
+    """An active user posting to the app's channel"""
+
+    async def add(user_id: int = 1, **fields):
+        fields.setdefault("target_channel_id", app.config.target_channel_id)
+        await add_user(user_id, auto_posting_enabled=True, **fields)
+
+    return add
+
+
+@pytest.mark.asyncio
+async def test_post_cycle(app, user, add_posts, telegram):
+    channel_id = app.config.target_channel_id
+    await user()
+    await add_posts(app, 1, "draft", readiness=Readiness.DRAFT)
+    await add_posts(app, 1, "unpolished", readiness=Readiness.UNPOLISHED)
+    await add_posts(app, 1, "finished")
+
+    await app.post_content_job(1)
+
+    # finished first
+    assert telegram.posts == [(channel_id, "finished")]
+    doc = await app.queue_collection.find_one({"data": "finished"})
+    assert doc["posted"] and doc["claimed_by"] is None
+    assert doc["deliveries"][str(channel_id)]["status"] == "sent"
+    # the counters are updated by the same flush, and match the queue
+    stats = await app.get_queue_stats(1)
+    assert (stats.posted, stats.count(Readiness.FINISHED), stats.total_unposted) == (1, 0, 2)
+    assert counts(await app.recount_queue_stats(1)) == counts(stats)
+    assert "Remaining posts in queue: 2" in telegram.notifications[-1][1]
+
+    await app.post_content_job(1)
+    await app.post_content_job(1)
+
+    # drafts are never posted
+    assert [text for _, text in telegram.posts] == ["finished", "unpolished"]
+    assert "no posts in queue" in telegram.notifications[-1][1]
+
+
+@pytest.mark.asyncio
+async def test_rollups_are_counted_at_post_time(app, user, add_posts):
+    await user()
+    await add_posts(app, 1, "one", "two", "three")
+    await app.post_content_job(1)
+    await app.post_content_job(1)
+
+    history = await app.get_posting_history(1)
+    assert history.posts_last_day() == 2
+    assert history.channel_posts() == {app.config.target_channel_id: 2}
+    # the backlog changed by the enqueued items minus the posted ones
+    assert history.net_backlog_change() == 1
+
+
+@pytest.mark.asyncio
+async def test_lost_lease_is_not_confirmed(app, user, add_posts, telegram):
+    await user()
+    await add_posts(app, 1, "post")
+
+    async def send_and_lose_lease(channel_id, post):
+        # the lease expired mid-send and another worker took the post
+        await app.queue_collection.update_one({"_id": post._doc_id}, {"$set": {"claimed_by": "other"}})
+        return await telegram.send_post(channel_id, post)
+
+    app._send_post = send_and_lose_lease
+    await app.post_content_job(1)
+
+    doc = await app.queue_collection.find_one({"data": "post"})
+    assert not doc["posted"] and doc["claimed_by"] == "other"
+    # the counters are reverted - the other worker counts the post
+    stats = await app.get_queue_stats(1)
+    assert (stats.posted, stats.count(Readiness.FINISHED)) == (0, 1)
+
+
+@pytest.mark.asyncio
+async def test_failed_channel_is_retried_alone_then_given_up(make_app, user, add_posts, telegram):
+    app = make_app(max_channel_attempts=2)
+    await app.ensure_indexes()
+    await user(target_channel_ids=[-1, -2])
+    await add_posts(app, 1, "post", "next")
+    telegram.failing = {-2}
+
+    await app.post_content_job(1)
+
+    assert telegram.posts == [(-1, "post")]
+    doc = await app.queue_collection.find_one({"data": "post"})
+    assert not doc["posted"] and doc["claimed_by"] is None
+    assert "could not be sent to 1 of 2 channels" in telegram.notifications[-1][1]
+
+    await app.post_content_job(1)
+
+    # only the failed channel was retried - and given up, the queue moves on
+    assert telegram.posts == [(-1, "post")]
+    doc = await app.queue_collection.find_one({"data": "post"})
+    assert doc["posted"]
+    assert {key: delivery["status"] for key, delivery in doc["deliveries"].items()} == {
+        "-1": "sent",
+        "-2": "given_up",
+    }
+    assert "Gave up on channels -2" in telegram.notifications[-1][1]
+    history = await app.get_posting_history(1)
+    assert history.channel_posts() == {-1: 1}
+
+    await app.post_content_job(1)
+    assert telegram.posts[-1] == (-1, "next")
+
+
+@pytest.mark.asyncio
+async def test_post_given_up_everywhere_is_not_counted_as_posted(make_app, user, add_posts, telegram):
+    app = make_app(max_channel_attempts=1)
+    await app.ensure_indexes()
+    await user(target_channel_ids=[-1, -2])
+    await add_posts(app, 1, "post", "next")
+    telegram.failing = {-1, -2}
+
+    await app.post_content_job(1)
+
+    assert telegram.posts == []
+    assert "not sent to any channel" in telegram.notifications[-1][1]
+    history = await app.get_posting_history(1)
+    assert (history.posts_last_day(), history.channel_posts()) == (0, {})
+    # the item left the backlog all the same - the rollups agree with the queue counters
+    assert history.net_backlog_change() == (await app.get_queue_stats(1)).total_unposted == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_readiness(app):
+    items = [PosterBotQueueItem(data=text) for text in ("a", "b", "c")]
+    batch_id = await app.add_batch_to_queue(items, 1)
+    assert (await app.get_queue_stats(1)).count(Readiness.DRAFT) == 3
+
+    assert await app.set_batch_readiness(1, batch_id, Readiness.FINISHED) == 3
+    stats = await app.get_queue_stats(1)
+    assert (stats.count(Readiness.DRAFT), stats.count(Readiness.FINISHED)) == (0, 3)
+
+    # already pending - not enqueued again
+    duplicate = [PosterBotQueueItem(data="A"), PosterBotQueueItem(data="d")]
+    await app.add_batch_to_queue(duplicate, 1)
+    assert [item._doc_id is not None for item in duplicate] == [False, True]
+
+    assert await app.remove_batch_from_queue(1, batch_id) == 3
+    stats = await app.get_queue_stats(1)
+    assert stats.total_unposted == 1
+    assert counts(await app.recount_queue_stats(1)) == counts(stats)
+
+
+@pytest.mark.asyncio
+async def test_startup_schedules_only_users_without_state(app, user, add_user):
+    for user_id in (1, 2, 3):
+        await user(user_id, scheduling_mode="period", scheduling_period_seconds=600)
+    await add_user(4, auto_posting_enabled=False, scheduling_mode="period")
+    tomorrow = datetime.now(timezone.utc) + timedelta(days=1)
+    await app.schedule_state_collection.insert_many(
+        [
+            # beyond the horizon - restored later by load_upcoming_schedules
+            {"user_id": 1, "next_fire_at": tomorrow},
+            # a slot claim only, no schedule
+            {"user_id": 2, "last_slot": tomorrow},
+        ]
+    )
+
+    await app.schedule_posts_on_startup()
+
+    assert [user_id in app.dispatcher for user_id in (1, 2, 3, 4)] == [False, True, True, False]
+    states = {
+        doc["user_id"]: doc.get("next_fire_at")
+        async for doc in app.schedule_state_collection.find({})
+    }
+    assert states.keys() == {1, 2, 3} and all(states.values())
+
+
+def message(message_id: int, media_group_id: str | None = None):
+    return SimpleNamespace(
+        from_user=SimpleNamespace(id=1), message_id=message_id, media_group_id=media_group_id
+    )
+
+
+@pytest.mark.asyncio
+async def test_burst_is_collected_by_its_first_message(make_app):
+    app = make_app(enqueue_debounce_seconds=0.2)
+
+    async def receive(m, delay):
+        await asyncio.sleep(delay)
+        return await app.collect_burst(m)
+
+    messages = [message(1), message(2, "album"), message(3, "album"), message(4)]
+    results = await asyncio.gather(
+        *(receive(m, delay) for m, delay in zip(messages, (0, 0.05, 0.1, 0.15)))
+    )
+
+    # an album is one post, the rest of the burst goes to the first handler
+    assert results[0] == [[messages[0]], [messages[1], messages[2]], [messages[3]]]
+    assert results[1:] == [None, None, None]
+
+    # a message after the window starts a new burst
+    assert await app.collect_burst(message(5)) == [[message(5)]]
+
+
+@pytest.mark.asyncio
+async def test_import_and_export(app):
+    records = [{"data": "a", "readiness": "finished"}, {"data": "b"}, {"data": "a"}]
+    assert await app.import_items(1, records) == (2, 1)
+
+    file = io.StringIO()
+    assert await app.export_queue(1, file) == 2
+    # in posting order: finished first
+    assert [json.loads(line)["data"] for line in file.getvalue().splitlines()] == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_posted_items_are_archived(app, user, add_posts):
+    await user()
+    await add_posts(app, 1, "post", "next")
+    await app.post_content_job(1)
+
+    assert await app.compact_posted_items() == 1
+    assert await app.queue_collection.count_documents({}) == 1
+    # the archive still counts as posted
+    assert (await app.recount_queue_stats(1)).posted == 1
+
+    [archived] = await app.get_archived_items(1)
+    assert archived.data == "post" and archived.posted
+    copy = await app.repost_archived_item(1, archived._doc_id)
+    assert copy is not None and copy._doc_id is not None
+    assert (await app.get_queue_stats(1)).count(Readiness.FINISHED) == 2
@@ -0,0 +1,105 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+from src.catch_up import MisfirePolicy, catch_up, missed_fire_times, posts_to_catch_up
+
+START = datetime(2026, 1, 5, 10, 0, tzinfo=timezone.utc)
+T1, T2, T3 = (START + timedelta(minutes=10 * k) for k in range(3))
+MISSED = {1: [T1, T2, T3], 2: [T1]}
+
+
+def test_missed_fire_times():
+    trigger = IntervalTrigger(minutes=10, start_date=START, timezone=timezone.utc)
+    now = START + timedelta(minutes=35)
+    assert missed_fire_times(trigger, START, now, limit=10) == [
+        START + timedelta(minutes=minutes) for minutes in (0, 10, 20, 30)
+    ]
+    assert len(missed_fire_times(trigger, START, now, limit=2)) == 2
+    assert missed_fire_times(trigger, now + timedelta(minutes=1), now, limit=10) == []
+
+    daily = CronTrigger(hour=10, minute=0, timezone=timezone.utc)
+    assert len(missed_fire_times(daily, START, START + timedelta(days=2, hours=1), limit=10)) == 3
+
+
+@pytest.mark.parametrize(
+    "policy, expected",
+    [
+        (MisfirePolicy.SKIP, {}),
+        # a single post, for the latest missed slot
+        (MisfirePolicy.ONCE, {1: [T3], 2: [T1]}),
+        (MisfirePolicy.ALL, {1: [T1, T2, T3], 2: [T1]}),
+        (MisfirePolicy.RATE_LIMITED, {1: [T1, T2, T3], 2: [T1]}),
+    ],
+)
+def test_posts_to_catch_up(policy, expected):
+    assert posts_to_catch_up(MISSED, policy) == expected
+
+
+async def run_catch_up(policy: MisfirePolicy, rate: float = 1000):
+    events = []
+
+    async def post(user_id, slot):
+        events.append(("post", user_id, slot))
+
+    async def caught_up(user_ids):
+        events.append(("caught_up", sorted(user_ids)))
+
+    await catch_up(dict(MISSED), policy, post, caught_up, max_concurrency=10, rate=rate)
+    return events
+
+
+@pytest.mark.asyncio
+async def test_skip_posts_nothing_and_saves_state():
+    assert await run_catch_up(MisfirePolicy.SKIP) == [("caught_up", [1, 2])]
+
+
+@pytest.mark.asyncio
+async def test_once_posts_once_per_user():
+    events = await run_catch_up(MisfirePolicy.ONCE)
+    assert sorted(event for event in events if event[0] == "post") == [("post", 1, T3), ("post", 2, T1)]
+    # state is saved only after the posts went out
+    assert events[-1] == ("caught_up", [1, 2])
+
+
+@pytest.mark.asyncio
+async def test_all_posts_every_missed_fire_time_round_robin():
+    events = await run_catch_up(MisfirePolicy.ALL)
+    assert events == [
+        ("post", 1, T1),
+        ("post", 2, T1),
+        ("caught_up", [2]),
+        ("post", 1, T2),
+        ("post", 1, T3),
+        ("caught_up", [1]),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_paces_posts():
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    events = await run_catch_up(MisfirePolicy.RATE_LIMITED, rate=20)
+
+    posts = [event[1] for event in events if event[0] == "post"]
+    assert posts == [1, 2, 1, 1]
+    # one post every 1/20 s
+    assert loop.time() - started >= 3 / 20
+
+
+@pytest.mark.asyncio
+async def test_failed_post_does_not_stop_catch_up():
+    async def post(user_id, slot):
+        if user_id == 1:
+            raise RuntimeError("send failed")
+
+    saved = []
+
+    async def caught_up(user_ids):
+        saved.extend(user_ids)
+
+    await catch_up({1: [T1], 2: [T1]}, MisfirePolicy.ONCE, post, caught_up, max_concurrency=10, rate=1)
+    assert sorted(saved) == [1, 2]
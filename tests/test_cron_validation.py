@@ -1,5 +1,8 @@
 import pytest
-from src.utils import validate_cron_expr
+
+from src.utils import normalize_cron_expr, validate_cron_expr
+
+
 @pytest.mark.parametrize("expr", [
     "* * * * *",
     "0 0 * * *",
@@ -28,4 +31,13 @@ def test_valid_cron(expr):
 ])
 def test_invalid_cron(expr):
     with pytest.raises(ValueError):
-        validate_cron_expr(expr) 
\ No newline at end of file
+        validate_cron_expr(expr) 
+
+@pytest.mark.parametrize("expr, expected", [
+    ("0 10 * * 1", "0 0 10 * * 1"),
+    ("0  10 *  * MON", "0 0 10 * * mon"),
+    (["0", "10", "*", "*", "1"], "0 0 10 * * 1"),
+    ("*/10 * * * * *", "*/10 * * * * *"),
+])
+def test_normalize_cron(expr, expected):
+    assert normalize_cron_expr(expr) == expected
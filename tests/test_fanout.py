@@ -0,0 +1,119 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from src.fanout import ChannelDelivery, DeliveryStatus, deliver, pending_channels
+
+
+@pytest.mark.asyncio
+async def test_deliver_records_status_per_channel():
+    async def send(channel_id):
+        if channel_id == -2:
+            raise RuntimeError("chat not found")
+        return [channel_id * 10]
+
+    results = await deliver([-1, -2, -3], send, max_parallel=10)
+
+    assert results["-1"].status == DeliveryStatus.SENT
+    assert results["-1"].message_ids == [-10]
+    assert results["-2"].status == DeliveryStatus.FAILED
+    assert results["-2"].error == "RuntimeError: chat not found"
+    assert results["-3"].message_ids == [-30]
+
+
+@pytest.mark.asyncio
+async def test_deliver_bounds_parallelism():
+    in_flight = 0
+    peak = 0
+
+    async def send(channel_id):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return [1]
+
+    results = await deliver(range(10), send, max_parallel=3)
+
+    assert len(results) == 10
+    assert peak == 3
+
+
+@pytest.mark.asyncio
+async def test_retry_skips_delivered_channels():
+    sent = []
+
+    async def send(channel_id):
+        sent.append(channel_id)
+        return [1]
+
+    deliveries = {
+        "-1": ChannelDelivery(status=DeliveryStatus.SENT, message_ids=[5], updated_at=datetime.now()),
+        "-2": ChannelDelivery(status=DeliveryStatus.FAILED, error="x", updated_at=datetime.now()),
+    }
+    channels = pending_channels([-1, -2, -3], deliveries)
+    assert channels == [-2, -3]
+
+    results = await deliver(channels, send, max_parallel=10, previous=deliveries)
+
+    assert sent == [-2, -3]
+    assert results["-2"].attempts == 2
+    assert results["-3"].attempts == 1
+
+
+def test_delivery_doc_stores_status_by_value():
+    delivery = ChannelDelivery(status=DeliveryStatus.SENT, message_ids=[1, 2], updated_at=datetime.now())
+    doc = delivery.to_doc()
+    assert doc["status"] == "sent"
+    assert ChannelDelivery(**doc) == delivery
+
+
+@pytest.mark.asyncio
+async def test_failing_channel_is_given_up():
+    async def send(channel_id):
+        raise RuntimeError("bot was kicked")
+
+    deliveries = {}
+    for _ in range(3):
+        channels = pending_channels([-1], deliveries)
+        assert channels == [-1]
+        deliveries.update(await deliver(channels, send, max_parallel=10, previous=deliveries, max_attempts=3))
+
+    assert deliveries["-1"].status == DeliveryStatus.GIVEN_UP
+    assert deliveries["-1"].attempts == 3
+    assert pending_channels([-1], deliveries) == []
+
+
+@pytest.mark.asyncio
+async def test_queue_moves_on_after_permanent_failure():
+    """The posting loop of post_content_job: an item stays at the head until no channel is left to retry"""
+    queue = [("first", {}), ("second", {})]
+    sent = []
+
+    async def send(channel_id, text):
+        if channel_id == -2:
+            raise RuntimeError("chat not found")
+        sent.append((channel_id, text))
+        return [1]
+
+    runs = 0
+    while queue and runs < 10:
+        runs += 1
+        text, deliveries = queue[0]
+        results = await deliver(
+            pending_channels([-1, -2], deliveries),
+            lambda channel_id: send(channel_id, text),
+            max_parallel=10,
+            previous=deliveries,
+            max_attempts=3,
+        )
+        deliveries.update(results)
+        if not any(delivery.status == DeliveryStatus.FAILED for delivery in results.values()):
+            queue.pop(0)
+
+    assert queue == []
+    assert runs == 6
+    # the healthy channel got the first post once, and then the next post
+    assert sent == [(-1, "first"), (-1, "second")]
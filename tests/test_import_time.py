@@ -0,0 +1,58 @@
+import pytest
+
+from bench.import_time import (
+    DEFAULT_MODULE,
+    OVERHEAD_BUDGET,
+    breakdown,
+    format_report,
+    measure,
+    overhead,
+    parse_importtime,
+    total_seconds,
+)
+
+SAMPLE = """\
+import time: self [us] | cumulative | imported package
+import time:       100 |        100 |   _io
+import time:       200 |        300 | encodings
+import time:       500 |        500 |     pydantic.fields
+import time:      1000 |       1500 |   pydantic.main
+import time:      2000 |       3500 | pydantic
+"""
+
+
+def test_parse_importtime():
+    records = parse_importtime(SAMPLE)
+    assert [record.module for record in records] == [
+        "_io",
+        "encodings",
+        "pydantic.fields",
+        "pydantic.main",
+        "pydantic",
+    ]
+    assert [record.depth for record in records] == [1, 0, 2, 1, 0]
+    assert total_seconds(records) == pytest.approx(0.0038)
+    assert breakdown(records) == pytest.approx({"pydantic": 0.0035, "encodings": 0.0002, "_io": 0.0001})
+
+
+def test_overhead_is_relative_to_the_baseline():
+    records = parse_importtime(SAMPLE)
+    assert overhead(records, baseline="pydantic") == pytest.approx(0.0003 / 0.0035)
+    with pytest.raises(ValueError):
+        overhead(records, baseline="aiogram")
+
+
+def test_optional_modules_are_not_imported_on_start():
+    # the metrics server and the version lookup are loaded when used
+    modules = {record.module for record in measure("src.metrics")}
+    assert not modules & {"aiohttp.web", "tomllib", "importlib.metadata"}
+
+
+def test_bot_import_time_budget():
+    """
+    Cold import of the bot: everything but aiogram takes at most OVERHEAD_BUDGET of aiogram's time,
+    measured in the same run - see `python -m bench.import_time` for the full report
+    """
+    pytest.importorskip("botspot.core.bot_manager", reason="the bot stack is not installed")
+    records = measure(DEFAULT_MODULE)
+    assert overhead(records) <= OVERHEAD_BUDGET, format_report(records)
@@ -0,0 +1,38 @@
+import pytest
+
+from src.metrics import Counter, Histogram, render_metrics, timed
+
+
+def test_histogram_render():
+    histogram = Histogram("test_histogram_seconds", "Test histogram", ("kind",), buckets=(0.1, 1))
+    histogram.observe(0.05, "a")
+    histogram.observe(0.5, "a")
+    histogram.observe(5, "a")
+
+    lines = histogram.render()
+    assert 'test_histogram_seconds_bucket{kind="a",le="0.1"} 1' in lines
+    assert 'test_histogram_seconds_bucket{kind="a",le="1"} 2' in lines
+    assert 'test_histogram_seconds_bucket{kind="a",le="+Inf"} 3' in lines
+    assert 'test_histogram_seconds_count{kind="a"} 3' in lines
+    assert 'test_histogram_seconds_sum{kind="a"} 5.55' in lines
+
+
+def test_counter_render():
+    counter = Counter("test_counter_total", "Test counter", ("result",))
+    counter.inc("hit")
+    counter.inc("hit", amount=2)
+
+    assert 'test_counter_total{result="hit"} 3' in counter.render()
+    assert "# TYPE test_counter_total counter" in render_metrics()
+
+
+@pytest.mark.asyncio
+async def test_timed():
+    histogram = Histogram("test_timed_seconds", "Test timed")
+
+    @timed(histogram)
+    async def job(x):
+        return x * 2
+
+    assert await job(2) == 4
+    assert "test_timed_seconds_count 1" in histogram.render()
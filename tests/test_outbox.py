@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from src.outbox import Outbox, Priority, TokenBucket
+
+
+def test_token_bucket_delay():
+    bucket = TokenBucket(rate=2, capacity=1)
+    now = bucket.updated
+    assert bucket.delay(now) == 0
+    bucket.consume(now)
+    assert bucket.delay(now) == pytest.approx(0.5)
+    assert bucket.delay(now + 0.5) == 0
+
+
+def test_token_bucket_block():
+    bucket = TokenBucket(rate=10, capacity=10)
+    now = bucket.updated
+    bucket.block(now + 3)
+    assert bucket.delay(now) == pytest.approx(3)
+
+
+@pytest.mark.asyncio
+async def test_channel_posts_go_before_notifications():
+    sent = []
+
+    async def send(chat_id, text, **kwargs):
+        sent.append(text)
+
+    outbox = Outbox(send, max_in_flight=1)
+    outbox.notify(1, "notification")
+    post = asyncio.create_task(outbox.send(-100, "post", priority=Priority.CHANNEL_POST))
+    await asyncio.sleep(0)
+    outbox.start()
+    await post
+    await outbox.stop()
+
+    assert sent == ["post", "notification"]
+
+
+@pytest.mark.asyncio
+async def test_notifications_are_coalesced():
+    sent = []
+
+    async def send(chat_id, text, **kwargs):
+        sent.append(text)
+
+    outbox = Outbox(send)
+    outbox.notify(1, "stats 1", coalesce_key="stats_1")
+    outbox.notify(1, "stats 2", coalesce_key="stats_1")
+    outbox.notify(2, "other user", coalesce_key="stats_2")
+    outbox.start()
+    await outbox.stop()
+
+    assert sorted(sent) == ["other user", "stats 2"]
+    assert outbox.counters["coalesced"] == 1
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_respected():
+    attempts = []
+
+    async def send(chat_id, text, **kwargs):
+        attempts.append(text)
+        if len(attempts) == 1:
+            raise TelegramRetryAfter(
+                method=SendMessage(chat_id=chat_id, text=text), message="flood", retry_after=0
+            )
+        return "ok"
+
+    outbox = Outbox(send)
+    outbox.start()
+    assert await outbox.send(1, "post") == "ok"
+    await outbox.stop()
+
+    assert attempts == ["post", "post"]
+    assert outbox.counters["flood_waits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_submit_custom_call():
+    async def send(chat_id, text, **kwargs):
+        raise AssertionError("send_safe should not be used")
+
+    async def copy():
+        return [1, 2]
+
+    outbox = Outbox(send)
+    outbox.start()
+    assert await outbox.submit(-100, copy) == [1, 2]
+    await outbox.stop()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_sends_are_dropped_on_drain():
+    sent = []
+
+    async def send(chat_id, text, **kwargs):
+        sent.append(text)
+
+    outbox = Outbox(send)
+    outbox.start()
+    # queued behind the global rate limit, then cancelled - like a posting job on shutdown
+    outbox._global_bucket.block(time.monotonic() + 0.2)
+    post = asyncio.create_task(outbox.send(-100, "post"))
+    outbox.notify(1, "notification")
+    await asyncio.sleep(0)
+    post.cancel()
+    await outbox.stop()
+
+    assert sent == ["notification"]
+    assert len(outbox) == 0
@@ -0,0 +1,56 @@
+from src.render import RenderPlan, SendSafeSettings, html_preview, render_post, utf16_len
+
+HTML = SendSafeSettings(parse_mode="HTML", send_long_messages_as_files=False)
+
+
+def test_short_post_is_sent_as_is():
+    plan = render_post("<b>Hello</b> &amp; bye", HTML)
+    assert plan == RenderPlan(chunks=["<b>Hello</b> &amp; bye"], parse_mode="HTML")
+    assert plan.describe() == ""
+
+
+def test_invalid_html_falls_back_to_plain_text():
+    for text in ["<div>x</div>", "<b>unclosed", "<b><i>x</b></i>"]:
+        plan = render_post(text, HTML)
+        assert plan.parse_mode is None
+        assert plan.chunks == [text]
+        assert "Invalid HTML" in plan.warnings[0]
+
+
+def test_long_post_is_split_at_lines_outside_tags():
+    paragraph = "<b>" + "x" * 30 + "</b>\n"
+    plan = render_post(paragraph * 10, HTML, limit=100)
+    assert plan.parse_mode == "HTML"
+    assert len(plan.chunks) == 4
+    assert "\n".join(plan.chunks) == (paragraph * 10).strip()
+    # the limit applies to visible text, not markup
+    assert all(chunk.count("<b>") == chunk.count("</b>") for chunk in plan.chunks)
+
+
+def test_unsplittable_formatting_is_dropped():
+    text = "<pre>" + "line\n" * 50 + "</pre>"
+    plan = render_post(text, HTML, limit=100)
+    assert plan.parse_mode is None
+    assert all(utf16_len(chunk) <= 100 for chunk in plan.chunks)
+    assert "<pre>" not in "".join(plan.chunks)
+
+
+def test_long_plain_line_is_cut():
+    plan = render_post("y" * 250, SendSafeSettings(parse_mode=None, send_long_messages_as_files=False), limit=100)
+    assert [len(chunk) for chunk in plan.chunks] == [100, 100, 50]
+
+
+def test_long_post_as_file():
+    settings = SendSafeSettings(parse_mode="HTML", send_long_messages_as_files=True)
+    plan = render_post("<i>" + "z" * 200 + "</i>", settings, limit=100)
+    assert plan.send_as_file
+    assert plan.chunks == ["z" * 200]
+    assert "file" in plan.describe()
+
+
+def test_html_preview_never_cuts_a_tag():
+    assert html_preview("<b>short</b>", 20) == "<b>short</b>"
+    text = '<a href="https://example.com">link</a> &lt;tail&gt; ' + "x" * 50
+    preview = html_preview(text, 9)
+    assert preview == "link &lt;tai"
+    assert render_post(preview, HTML).warnings == []
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta, timezone
+
+from src.rollups import Granularity, PostingHistory, bucket_start, history_query, rollup_updates
+
+NOW = datetime(2026, 3, 10, 15, 42, 7, tzinfo=timezone.utc)
+
+
+def bucket_doc(at, granularity, channel_id=None, **counters):
+    return {
+        "channel_id": channel_id,
+        "granularity": granularity.value,
+        "bucket": bucket_start(at, granularity).replace(tzinfo=None),  # as read from mongo
+        **counters,
+    }
+
+
+def test_bucket_start():
+    assert bucket_start(NOW, Granularity.HOUR) == datetime(2026, 3, 10, 15, tzinfo=timezone.utc)
+    assert bucket_start(NOW, Granularity.DAY) == datetime(2026, 3, 10, tzinfo=timezone.utc)
+    # naive datetimes are UTC
+    assert bucket_start(datetime(2026, 3, 10, 23, 59), Granularity.DAY) == datetime(
+        2026, 3, 10, tzinfo=timezone.utc
+    )
+
+
+def test_rollup_updates_upsert_hour_and_day_buckets():
+    updates = rollup_updates(1, NOW, {"posts": 1}, channel_id=-100)
+    filters = [update._filter for update in updates]
+    assert {f["granularity"] for f in filters} == {"hour", "day"}
+    assert all(f["user_id"] == 1 and f["channel_id"] == -100 for f in filters)
+    assert all(update._doc == {"$inc": {"posts": 1}} and update._upsert for update in updates)
+
+
+def test_history_query_is_bounded():
+    query = history_query(1, NOW)
+    hourly, daily = query["$or"]
+    assert NOW - hourly["bucket"]["$gt"] < timedelta(hours=25)
+    assert NOW - daily["bucket"]["$gt"] < timedelta(days=31)
+
+
+def test_posting_history():
+    docs = [
+        bucket_doc(NOW, Granularity.HOUR, posts=2),
+        bucket_doc(NOW - timedelta(hours=3), Granularity.HOUR, posts=1),
+        bucket_doc(NOW, Granularity.DAY, posts=3, added=10),
+        bucket_doc(NOW - timedelta(days=6), Granularity.DAY, posts=4, removed=1),
+        bucket_doc(NOW - timedelta(days=20), Granularity.DAY, posts=7),
+        bucket_doc(NOW, Granularity.DAY, channel_id=-1, posts=3),
+        bucket_doc(NOW - timedelta(days=10), Granularity.DAY, channel_id=-1, posts=5),
+        bucket_doc(NOW, Granularity.DAY, channel_id=-2, posts=2),
+        bucket_doc(NOW, Granularity.HOUR, channel_id=-2, posts=2),
+    ]
+    history = PostingHistory.from_docs(docs, NOW)
+
+    assert history.posts_last_day() == 3
+    assert history.posts_last_days(7) == 7
+    assert history.posts_last_days(30) == 14
+    assert history.channel_posts() == {-1: 3, -2: 2}
+    assert history.daily_rate(7) == 1
+    assert history.net_backlog_change(7) == 10 - 7 - 1
+    assert history.days_left(backlog=14) == 14
+
+    report = history.format(backlog=14)
+    assert "days of content left: 14.0" in report
+    assert "- -1: 3 posts" in report
+
+
+def test_days_left_unknown_without_posts():
+    history = PostingHistory.from_docs([], NOW)
+    assert history.days_left(backlog=5) is None
+    assert "unknown" in history.format(backlog=5)
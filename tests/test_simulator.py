@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.simulator import SimUser, format_report, simulate
+
+START = datetime(2026, 1, 5, 0, 0, tzinfo=timezone.utc)  # a Monday
+
+
+def cron_user(user_id, expr="0 10 * * *", queue_size=None, channels=1):
+    return SimUser(
+        user_id=user_id,
+        scheduling_mode="cron",
+        scheduling_cron_expr=expr,
+        queue_size=queue_size,
+        channels=channels,
+    )
+
+
+def test_shared_cron_fires_together():
+    users = [cron_user(user_id) for user_id in range(100)]
+    result = simulate(users, START, days=2)
+
+    assert result.total_posts == 200
+    assert result.peak_messages_per_second == 100
+    assert result.peak_second == START + timedelta(hours=10)
+    assert result.peak_concurrency == 100
+    assert result.peak_mongo_ops_per_second == 100 * result.mongo_ops_per_post
+    assert result.flood.seconds_over_limit == 2
+    assert result.flood.excess_messages == 140
+    assert result.flood.max_delay_seconds == pytest.approx(70 / 30)
+
+
+def test_day_of_week_follows_apscheduler():
+    # the bot schedules with APScheduler's CronTrigger: 0 is Monday there, Sunday in classic cron
+    result = simulate([cron_user(1, expr="0 10 * * 0"), cron_user(2, expr="0 10 * * sun")], START, days=7)
+
+    assert sorted(result.posts) == [
+        (START + timedelta(hours=10)).timestamp(),
+        (START + timedelta(days=6, hours=10)).timestamp(),
+    ]
+
+
+def test_spread_flattens_the_peak():
+    users = [cron_user(user_id) for user_id in range(100)]
+    result = simulate(users, START, days=1, spread_seconds=60)
+
+    assert result.total_posts == 100
+    assert result.peak_messages_per_second < 10
+    assert result.flood.seconds_over_limit == 0
+
+
+def test_queue_exhaustion():
+    users = [
+        cron_user(1, queue_size=3),
+        cron_user(2, queue_size=0),
+        cron_user(3, queue_size=None),
+        cron_user(4, queue_size=100),
+    ]
+    result = simulate(users, START, days=7)
+
+    assert result.exhaustion[1] == START + timedelta(days=2, hours=10)
+    assert result.exhaustion[2] == START
+    assert result.exhaustion[3] is None
+    assert result.exhaustion[4] is None
+    # posting stops once a queue is empty
+    assert result.total_posts == 3 + 0 + 7 + 7
+
+
+def test_period_users_keep_their_phase():
+    users = [
+        SimUser(user_id=1, scheduling_mode="period", scheduling_period_seconds=3600),
+        SimUser(
+            user_id=2,
+            scheduling_mode="period",
+            scheduling_period_seconds=3600,
+            next_fire_at=START - timedelta(minutes=90),
+            queue_size=2,
+        ),
+    ]
+    result = simulate(users, START, days=1)
+
+    first = int(START.timestamp())
+    assert result.posts[first + 3600] == 1
+    assert result.posts[first + 1800] == 1
+    assert result.posts[first + 5400] == 1
+    assert result.exhaustion[2] == START + timedelta(minutes=90)
+    # the fire at the end of the day is outside the simulated period
+    assert result.total_posts == 23 + 2
+
+
+def test_channels_multiply_messages():
+    result = simulate([cron_user(1, channels=3)], START, days=1)
+    assert result.total_posts == 1
+    assert result.peak_messages_per_second == 3
+
+
+def test_rate_histogram_counts_idle_seconds():
+    result = simulate([cron_user(1, expr="*/10 * * * * *")], START, days=1)
+    histogram = result.rate_histogram()
+    assert histogram == {0: 86400 - 8640, 1: 8640}
+    assert "Peak send rate: 1 msg/s" in format_report(result)
+
+
+def test_invalid_cron_expression():
+    with pytest.raises(ValueError):
+        simulate([cron_user(1, expr="0 10 *")], START)
@@ -0,0 +1,153 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from src.slots import CATCH_UP_SLOT, claim_slot
+
+START = datetime(2026, 1, 5, 10, 0, tzinfo=timezone.utc)
+
+
+class FakeStateCollection:
+    """schedule_state with its unique user_id index - just the conditional update claim_slot issues"""
+
+    def __init__(self):
+        self.docs: dict[int, dict] = {}
+
+    @staticmethod
+    def _matches(doc: dict, condition: dict) -> bool:
+        [(field, expected)] = condition.items()
+        value = doc.get(field)
+        if isinstance(expected, dict):
+            return value is not None and value < expected["$lt"]
+        return value == expected
+
+    async def update_one(self, query, update, upsert=False):
+        # let the other replica interleave between reading and writing
+        await asyncio.sleep(0)
+        doc = self.docs.get(query["user_id"])
+        if doc is not None and any(self._matches(doc, condition) for condition in query["$or"]):
+            doc.update(update["$set"])
+        elif doc is not None:
+            raise DuplicateKeyError("E11000 duplicate key error")
+        elif upsert:
+            self.docs[query["user_id"]] = {"user_id": query["user_id"], **update["$set"]}
+
+
+@pytest.mark.asyncio
+async def test_claim_slot_once():
+    state = FakeStateCollection()
+
+    assert await claim_slot(state, 1, START)
+    assert not await claim_slot(state, 1, START)
+    # an older slot - e.g. a late catch-up - is not posted after a newer one
+    assert not await claim_slot(state, 1, START - timedelta(minutes=1))
+    assert await claim_slot(state, 1, START + timedelta(minutes=1))
+    assert await claim_slot(state, 2, START)
+
+
+@pytest.mark.asyncio
+async def test_catch_up_slots_are_claimed_apart():
+    state = FakeStateCollection()
+
+    assert await claim_slot(state, 1, START)
+    # missed while down - older than the regular slot fired since the restart
+    assert await claim_slot(state, 1, START - timedelta(minutes=20), CATCH_UP_SLOT)
+    assert await claim_slot(state, 1, START - timedelta(minutes=10), CATCH_UP_SLOT)
+    assert not await claim_slot(state, 1, START - timedelta(minutes=10), CATCH_UP_SLOT)
+
+
+@pytest.mark.asyncio
+async def test_claim_compares_at_mongo_precision():
+    state = FakeStateCollection()
+    slot = START.replace(microsecond=301900)
+
+    assert await claim_slot(state, 1, slot)
+    # stored as mongo would keep it - the same slot claimed again is not newer
+    assert state.docs[1]["last_slot"] == START.replace(microsecond=301000)
+    assert not await claim_slot(state, 1, slot)
+
+
+@pytest.mark.asyncio
+async def test_post_is_claimed_only_by_the_slot_winner(make_app, add_user, add_posts, telegram):
+    winner, loser = make_app(), make_app()
+    await winner.ensure_indexes()
+    channel_id = winner.config.target_channel_id
+    await add_user(1, target_channel_id=channel_id, auto_posting_enabled=True)
+    await add_posts(winner, 1, "first", "second")
+
+    await winner.post_content_job(1, START)
+
+    async def claim_post(user_id):
+        raise AssertionError("the post is claimed before the slot was won")
+
+    loser._claim_post_from_queue = claim_post
+    await loser.post_content_job(1, START)
+
+    assert telegram.posts == [(channel_id, "first")]
+    # the second post is still there for the next slot, not leased
+    doc = await winner.queue_collection.find_one({"data": "second"})
+    assert not doc["posted"] and doc["claimed_by"] is None
+
+
+@pytest.mark.asyncio
+async def test_replicas_post_a_period_slot_once(make_app, add_user, add_posts, telegram):
+    activating, restoring = make_app(), make_app()
+    await activating.ensure_indexes()
+    await add_user(1)
+    await add_posts(activating, 1, "first", "second")
+
+    # one replica schedules the user itself, the other restores the schedule from schedule_state
+    await activating.activate_user(1)
+    await restoring.load_upcoming_schedules()
+    replicas = [activating, restoring]
+
+    slots = [app.dispatcher.next_fire_time(1) for app in replicas]
+    assert slots[0] == slots[1]
+    # each replica fires the slot of its own schedule
+    await asyncio.gather(*(app.post_content_job(1, slot) for app, slot in zip(replicas, slots)))
+
+    assert telegram.posts == [(activating.config.target_channel_id, "first")]
+
+
+@pytest.mark.asyncio
+async def test_catch_up_posts_after_a_regular_slot(make_app, add_user, add_posts, telegram):
+    app = make_app(misfire_policy="all")
+    await app.ensure_indexes()
+    await add_user(
+        1,
+        target_channel_id=app.config.target_channel_id,
+        auto_posting_enabled=True,
+        scheduling_mode="period",
+        scheduling_period_seconds=600,
+    )
+    await add_posts(app, 1, "a", "b", "c", "d")
+    now = app.dispatcher.now().replace(microsecond=0)
+    # the bot was down for 25 minutes, 3 posts were missed
+    await app.schedule_state_collection.insert_one(
+        {"user_id": 1, "next_fire_at": now - timedelta(minutes=25)}
+    )
+    # the regular schedule of another replica fired first
+    assert await claim_slot(app.schedule_state_collection, 1, now)
+
+    await app.schedule_posts_on_startup()
+    await app._catch_up_task
+
+    assert [text for _, text in telegram.posts] == ["a", "b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_replica_stops_posting_once_turned_off_elsewhere(make_app, add_user, add_posts, telegram):
+    posting, stopping = make_app(), make_app()
+    await posting.ensure_indexes()
+    await add_user(1)
+    await add_posts(posting, 1, "first")
+    # cached as enabled by the replica that activated the user
+    await posting.activate_user(1)
+
+    await stopping.deactivate_user(1)
+    await posting.post_content_job(1, posting.dispatcher.next_fire_time(1))
+
+    assert telegram.posts == []
+    assert 1 not in posting.dispatcher
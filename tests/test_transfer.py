@@ -0,0 +1,68 @@
+import pytest
+
+from src.transfer import (
+    TransferFormat,
+    check_source,
+    export_line,
+    parse,
+    parse_jsonl,
+    parse_markdown,
+)
+
+
+def test_format_from_filename():
+    assert TransferFormat.from_filename("queue.jsonl") == TransferFormat.JSONL
+    assert TransferFormat.from_filename("Posts.MD") == TransferFormat.MARKDOWN
+    with pytest.raises(ValueError):
+        TransferFormat.from_filename("posts.pdf")
+
+
+def test_parse_jsonl():
+    lines = ['"plain post"\n', "\n", '{"data": "ready", "readiness": "finished", "user_id": 1}\n']
+    assert list(parse_jsonl(lines)) == [
+        {"data": "plain post"},
+        {"data": "ready", "readiness": "finished"},
+    ]
+
+
+def test_parse_jsonl_reports_bad_line():
+    records = parse_jsonl(['"ok"\n', "{broken\n"])
+    assert next(records) == {"data": "ok"}
+    with pytest.raises(ValueError, match="Line 2"):
+        next(records)
+
+
+def test_parse_markdown():
+    lines = ["# First\n", "body\n", "---\n", "\n", "---\n", "Second\n"]
+    assert list(parse_markdown(lines)) == [{"data": "# First\nbody"}, {"data": "Second"}]
+
+
+def test_export_round_trip():
+    doc = {
+        "_id": "x",
+        "user_id": 1,
+        "data": "Привет",
+        "readiness": "unpolished",
+        "save_mode": "data",
+        "source_chat_id": None,
+        "source_message_ids": [],
+    }
+    line = export_line(doc)
+    assert "Привет" in line
+    assert list(parse([line], TransferFormat.JSONL)) == [
+        {"data": "Привет", "readiness": "unpolished", "save_mode": "data"}
+    ]
+
+
+def test_check_source_rejects_other_chats():
+    own = {"data": "", "save_mode": "forward", "source_chat_id": 1, "source_message_ids": [5]}
+    assert check_source(own, user_id=1) == own
+    assert check_source({"data": "text"}, user_id=1) == {"data": "text"}
+
+    for record in (
+        {**own, "source_chat_id": -100123},
+        {"data": "x", "source_chat_id": -100123, "source_message_ids": [5]},
+        {"data": "x", "save_mode": "forward", "source_message_ids": [5]},
+    ):
+        with pytest.raises(ValueError, match="own chat"):
+            check_source(record, user_id=1)
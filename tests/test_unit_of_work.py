@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+import pytest
+from pymongo import UpdateOne
+
+from src.unit_of_work import PostingUnitOfWork
+
+
+class FakeCollection:
+    """Records the writes of a unit of work - enough to check what is flushed"""
+
+    def __init__(self, modified: int = 1, stats: dict | None = None, error: Exception | None = None):
+        self.calls: list[tuple] = []
+        self.modified = modified
+        self.stats = stats
+        self.error = error
+
+    async def update_one(self, query, update):
+        self.calls.append(("update_one", query, update))
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(modified_count=self.modified)
+
+    async def find_one_and_update(self, query, update, return_document):
+        self.calls.append(("find_one_and_update", query, update))
+        return self.stats
+
+    async def bulk_write(self, updates, ordered):
+        self.calls.append(("bulk_write", updates))
+
+
+def unit_of_work(queue=None, stats=None, rollups=None):
+    queue = queue or FakeCollection()
+    stats = stats or FakeCollection(stats={"user_id": 1, "posted": 5})
+    rollups = rollups or FakeCollection()
+    work = PostingUnitOfWork(queue, stats, rollups, user_id=1)
+    work.update_item("id", "lease", {"posted": True})
+    work.update_stats({"unposted.finished": -1, "posted": 1}, set_fields={"last_posted_at": 0})
+    work.add_rollups([UpdateOne({"user_id": 1}, {"$inc": {"posts": 1}}, upsert=True)])
+    return work, queue, stats, rollups
+
+
+@pytest.mark.asyncio
+async def test_flush_writes_once_per_collection():
+    work, queue, stats, rollups = unit_of_work()
+
+    assert await work.flush()
+
+    assert queue.calls == [("update_one", {"_id": "id", "claimed_by": "lease"}, {"$set": {"posted": True}})]
+    assert stats.calls == [
+        (
+            "find_one_and_update",
+            {"user_id": 1},
+            {"$inc": {"unposted.finished": -1, "posted": 1}, "$set": {"last_posted_at": 0}},
+        )
+    ]
+    assert len(rollups.calls) == 1
+    # the counters come back with the write - no extra read
+    assert work.stats == {"user_id": 1, "posted": 5}
+
+
+@pytest.mark.asyncio
+async def test_lost_lease_reverts_counters():
+    work, queue, stats, rollups = unit_of_work(queue=FakeCollection(modified=0))
+
+    assert not await work.flush()
+
+    assert stats.calls[-1] == ("update_one", {"user_id": 1}, {"$inc": {"unposted.finished": 1, "posted": -1}})
+    assert work.stats is None
+    # the messages were sent - rollups stay
+    assert len(rollups.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_item_write_reverts_counters_and_raises():
+    work, queue, stats, rollups = unit_of_work(queue=FakeCollection(error=RuntimeError("down")))
+
+    with pytest.raises(RuntimeError):
+        await work.flush()
+
+    assert stats.calls[-1][0] == "update_one"
+
+
+@pytest.mark.asyncio
+async def test_nothing_to_revert_without_counters():
+    work, queue, stats, rollups = unit_of_work(
+        queue=FakeCollection(modified=0), stats=FakeCollection(stats=None)
+    )
+
+    assert not await work.flush()
+
+    assert [call[0] for call in stats.calls] == ["find_one_and_update"]
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+from aiogram import Bot, Dispatcher
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import TestServer
+
+from src.webhook import SECRET_HEADER, BoundedRequestHandler
+
+SECRET = "test-secret"
+
+
+def message_update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Test"},
+            "text": f"update {update_id}",
+        },
+    }
+
+
+async def serve(handler_kwargs, on_message):
+    dp = Dispatcher()
+    dp.message.register(on_message)
+    bot = Bot(token="123456:test")
+    handler = BoundedRequestHandler(dp, bot, secret_token=SECRET, **handler_kwargs)
+    app = web.Application()
+    handler.register(app, path="/webhook")
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+async def post(server: TestServer, update: dict, secret: str = SECRET) -> int:
+    async with ClientSession() as session:
+        async with session.post(
+            server.make_url("/webhook"), json=update, headers={SECRET_HEADER: secret}
+        ) as response:
+            return response.status
+
+
+@pytest.mark.asyncio
+async def test_rejects_wrong_secret():
+    handled = asyncio.Queue()
+
+    async def on_message(message):
+        handled.put_nowait(message.message_id)
+
+    server = await serve({}, on_message)
+    try:
+        assert await post(server, message_update(1), secret="wrong") == 401
+        assert await post(server, message_update(2)) == 200
+        assert await asyncio.wait_for(handled.get(), timeout=5) == 2
+    finally:
+        await server.close()
+    assert handled.empty()
+
+
+@pytest.mark.asyncio
+async def test_bounds_workers_and_drains_on_close():
+    release = asyncio.Event()
+    both_started = asyncio.Event()
+    active = 0
+    peak = 0
+    handled = []
+
+    async def on_message(message):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        if active == 2:
+            both_started.set()
+        # handlers hold their worker until the test lets them go
+        await release.wait()
+        active -= 1
+        handled.append(message.message_id)
+
+    server = await serve({"workers": 2, "max_pending": 5}, on_message)
+    statuses = [await post(server, message_update(i)) for i in range(7)]
+    # nothing is handled yet, so updates beyond max_pending are refused - telegram re-delivers them
+    assert statuses == [200] * 5 + [503] * 2
+    await asyncio.wait_for(both_started.wait(), timeout=5)
+    assert peak == 2
+    assert handled == []
+
+    # runs on_shutdown, which waits for the accepted updates
+    closing = asyncio.create_task(server.close())
+    done, _ = await asyncio.wait([closing], timeout=0.1)
+    assert not done
+    release.set()
+    await asyncio.wait_for(closing, timeout=5)
+
+    assert sorted(handled) == [0, 1, 2, 3, 4]
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_update_keeps_the_worker():
+    handled = asyncio.Queue()
+
+    async def on_message(message):
+        if message.message_id == 1:
+            raise RuntimeError("handler failed")
+        handled.put_nowait(message.message_id)
+
+    server = await serve({"workers": 1, "max_pending": 2}, on_message)
+    try:
+        assert [await post(server, message_update(i)) for i in (1, 2)] == [200, 200]
+        # the only worker survived the failure - and counts the failed update as handled
+        assert await asyncio.wait_for(handled.get(), timeout=5) == 2
+        assert await post(server, message_update(3)) == 200
+        assert await asyncio.wait_for(handled.get(), timeout=5) == 3
+    finally:
+        await server.close()